@@ -0,0 +1,232 @@
+#/usr/bin/python3
+
+#
+# Microbenchmarks for the MachineMotion driver hot paths.
+#
+# Usage: python3 benchmark.py [name ...]
+# Runs every benchmark when no name is given.
+#
+
+from internal.machine_motion import GCodeReply, GCodeBuilder, AXIS_NUMBER, DIRECTION, restrictInputValue, DataCache, DATA_DURABILITY
+from internal.machine_motion import HTTPTransport, PipelinedHTTPTransport, LoopbackTransport
+import http.server
+import socketserver
+import sys
+import threading
+import time
+import timeit
+import urllib.parse
+
+M114_REPLY = b'echo:M114\nX:125.00 Y:40.50 Z:0.00 E:0.00 Count X:10000 Y:3240 Z:0\nok\n'
+M119_REPLY = b'echo:M119\nReporting endstop status\nx_min: TRIGGERED\nx_max: open\ny_min: open\ny_max: open\nz_min: TRIGGERED\nz_max: open\nok\n'
+V0_REPLY = b'echo:V0\nCOMPLETED\nok\n'
+ROUND_TRIP_SECONDS = 0.002     # Simulated HTTP round trip to the controller
+
+def legacyGetCurrentPositions(body) :
+    ''' getCurrentPositions before the typed reply parser, on the str(bytes) reply '''
+    reply = str(body)
+    positions = {1 : None, 2 : None, 3 : None}
+    if ( "echo" in reply and "ok" in reply ) :
+        positions[1] = float(reply[reply.find('X')+2:(reply.find('Y')-1)])
+        positions[2] = float(reply[reply.find('Y')+2:(reply.find('Z')-1)])
+        positions[3] = float(reply[reply.find('Z')+2:(reply.find('E')-1)])
+    else : raise Exception('Error in gCode execution')
+    return positions
+
+def legacyGetEndStopState(body) :
+    ''' getEndStopState before the typed reply parser, on the str(bytes) reply '''
+    def trimUntil(S, key) :
+        return S[S.find(key) + len(key) :]
+
+    reply = str(body)
+    states = {}
+    if ( "echo" in reply and "ok" in reply ) :
+        reply = trimUntil(reply, "\n")
+        for key in ("x_min", "x_max", "y_min", "y_max", "z_min", "z_max") :
+            if key in reply :
+                keyB = key + ": "
+                keyE = " \n"
+                states[key] = reply[(reply.find(keyB) + len(keyB)) : (reply.find(keyE))]
+                reply = trimUntil(reply, "\n")
+            else : raise Exception('Error in gCode')
+    else : raise Exception('Error in gCode execution')
+    return states
+
+def legacyIsMotionCompleted(body) :
+    ''' isMotionCompleted before the typed reply parser, on the str(bytes) reply '''
+    reply = str(body)
+    if ( "echo" in reply and "ok" in reply ) :
+        if ("COMPLETED" in reply) : return True
+        else : return False
+    else : raise Exception('Error in gCode execution')
+
+def currentGetCurrentPositions(body) :
+    reply = GCodeReply(body)
+    if ( reply.isOk ) : return reply.getPositions()
+    else : raise Exception('Error in gCode execution')
+
+def currentGetEndStopState(body) :
+    reply = GCodeReply(body)
+    if ( reply.isOk ) : return reply.getEndStopStates()
+    else : raise Exception('Error in gCode execution')
+
+def currentIsMotionCompleted(body) :
+    reply = GCodeReply(body)
+    if ( reply.isOk ) : return reply.isMotionCompleted()
+    else : raise Exception('Error in gCode execution')
+
+def legacyRestrictInputValue(argName, argValue, argClass) :
+    ''' MachineMotion._restrictInputValue before the cached validation tables '''
+    validParams = [i for i in argClass.__dict__.keys() if i[:1] != '_']
+    validValues = [argClass.__dict__[i] for i in validParams]
+
+    if argValue in validValues:
+        pass
+    else:
+        class InvalidInput(Exception):
+            pass
+        errorMessage = "An invalid selection was made. Given parameter '" + str(argName) + "' must be one of the following values:"
+        for param in validParams:
+            errorMessage = errorMessage + "\n" + argClass.__name__ + "." + param + " (" + str(argClass.__dict__[param]) +")"
+        raise InvalidInput(errorMessage)
+
+def legacyGetTrueAxis(axis) :
+    if axis == 1: return "X"
+    elif axis == 2: return "Y"
+    elif axis == 3: return "Z"
+    else: return "Axis Error"
+
+def legacyPath(gCode) :
+    ''' GCode.__emit__ request path before the Python-3-only code path '''
+    if sys.version_info[0] < 3 :
+        return "/gcode?%s" % urllib.urlencode({"gcode": "%s" % gCode})
+    else :
+        return "/gcode?%s" % urllib.parse.urlencode({"gcode": "%s" % gCode})
+
+def legacyRelativeMove(axis, direction, distance) :
+    ''' Validation and command building of emitRelativeMove before the command builders '''
+    legacyRestrictInputValue("axis", axis, AXIS_NUMBER)
+    legacyRestrictInputValue("direction", direction, DIRECTION)
+    if direction == DIRECTION.POSITIVE :
+        distance = "" + str(distance)
+    elif direction  == DIRECTION.NEGATIVE :
+        distance = "-" + str(distance)
+    return legacyPath("G0 " + legacyGetTrueAxis(axis) + str(distance))
+
+def legacyCombinedAbsoluteMove(axes, positions) :
+    ''' Validation and command building of emitCombinedAxesAbsoluteMove before the command builders '''
+    for axis in axes:
+        legacyRestrictInputValue("axis", axis, AXIS_NUMBER)
+    command = "G0 "
+    for axis, position in zip(axes, positions):
+        command += legacyGetTrueAxis(axis) + str(position) + " "
+    return legacyPath(command)
+
+def currentRelativeMove(axis, direction, distance) :
+    restrictInputValue("axis", axis, AXIS_NUMBER)
+    restrictInputValue("direction", direction, DIRECTION)
+    return "/gcode?gcode=" + urllib.parse.quote_plus(GCodeBuilder.move(axis, GCodeBuilder.signedDistance(direction, distance)))
+
+def currentCombinedAbsoluteMove(axes, positions) :
+    for axis in axes :
+        restrictInputValue("axis", axis, AXIS_NUMBER)
+    return "/gcode?gcode=" + urllib.parse.quote_plus(GCodeBuilder.combinedMove(axes, positions))
+
+def simulatedRequest(*args) :
+    ''' Stands for an HTTPSend to the controller '''
+    time.sleep(ROUND_TRIP_SECONDS)
+    return '12'
+
+def legacyCycle() :
+    ''' Cycle of an application storing a counter and reading a recipe parameter, before the data cache '''
+    simulatedRequest('/saveData', 'count')      # saveData
+    time.sleep(0.05)
+    simulatedRequest('/getData', 'recipe')      # getData
+
+def cachedCycle(dataCache) :
+    dataCache.set('count', '12')
+    dataCache.get('recipe')
+
+class FakeControllerHandler(http.server.BaseHTTPRequestHandler) :
+    ''' Acknowledges G-code requests like the controller, on keep-alive HTTP/1.1 connections '''
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = -1       # Send the headers and body of a reply together
+
+    def do_GET(self) :
+        gCode = urllib.parse.unquote_plus(self.path.split('gcode=', 1)[-1])
+        body = ('echo:%s\nok\n' % gCode).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) :
+        pass
+
+class FakeController(socketserver.ThreadingMixIn, http.server.HTTPServer) :
+    daemon_threads = True
+
+def measure(label, func, number, commandsPerCall=1) :
+    ''' Times an implementation and prints the cost of one command in microseconds '''
+    elapsed = min(timeit.repeat(func, number=number, repeat=5)) / number / commandsPerCall * 1e6
+    print('%-32s %8.2f us per command' % (label, elapsed))
+
+def compare(label, before, after, number) :
+    ''' Times both implementations and prints the cost of one call in microseconds '''
+    beforeTime = min(timeit.repeat(before, number=number, repeat=5)) / number * 1e6
+    afterTime = min(timeit.repeat(after, number=number, repeat=5)) / number * 1e6
+    print('%-24s before: %8.2f us   after: %8.2f us   (x%.2f)' % (label, beforeTime, afterTime, beforeTime / afterTime))
+
+def benchmarkReplies(number=20000) :
+    ''' Parsing of the M114, M119 and V0 replies '''
+    compare('M114 positions', lambda: legacyGetCurrentPositions(M114_REPLY), lambda: currentGetCurrentPositions(M114_REPLY), number)
+    compare('M119 end stops', lambda: legacyGetEndStopState(M119_REPLY), lambda: currentGetEndStopState(M119_REPLY), number)
+    compare('V0 completion', lambda: legacyIsMotionCompleted(V0_REPLY), lambda: currentIsMotionCompleted(V0_REPLY), number)
+
+def benchmarkCommands(number=20000) :
+    ''' CPU cost of validating arguments and building the request path of a command '''
+    compare('axis validation', lambda: legacyRestrictInputValue("axis", 2, AXIS_NUMBER), lambda: restrictInputValue("axis", 2, AXIS_NUMBER), number)
+    compare('relative move', lambda: legacyRelativeMove(1, DIRECTION.NEGATIVE, 12.5), lambda: currentRelativeMove(1, DIRECTION.NEGATIVE, 12.5), number)
+    compare('combined absolute move', lambda: legacyCombinedAbsoluteMove([1, 2, 3], [100, 25.5, 0]), lambda: currentCombinedAbsoluteMove([1, 2, 3], [100, 25.5, 0]), number)
+
+def benchmarkData(number=20) :
+    ''' Cost of saveData/getData per application cycle, with a simulated round trip to the controller '''
+    dataCache = DataCache(simulatedRequest, simulatedRequest, DATA_DURABILITY.write_behind, flushInterval=1.0)
+    compare('cycle, write-behind', legacyCycle, lambda: cachedCycle(dataCache), number)
+    dataCache.flush()
+    print('%-24s %d writes, %d sent, %d reads, %d from memory' % ('', dataCache.writes, dataCache.sent, dataCache.reads, dataCache.hits))
+
+def benchmarkTransports(number=50) :
+    ''' Cost of sending G-code with each GCodeTransport, against a local fake controller '''
+    controller = FakeController(('127.0.0.1', 0), FakeControllerHandler)
+    threading.Thread(target=controller.serve_forever, daemon=True).start()
+    host = '127.0.0.1:%d' % controller.server_address[1]
+
+    gCodes = ['G0 X%d Y%d' % (i, -i) for i in range(20)]
+    for transport in (HTTPTransport(host), PipelinedHTTPTransport(host), LoopbackTransport()) :
+        measure('%s, one by one' % transport.name, lambda: [transport.send(gCode) for gCode in gCodes], number, len(gCodes))
+        measure('%s, sendMany' % transport.name, lambda: transport.sendMany(gCodes), number, len(gCodes))
+        transport.close()
+
+    controller.shutdown()
+    controller.server_close()
+
+BENCHMARKS = {
+    'commands' : benchmarkCommands,
+    'data' : benchmarkData,
+    'replies' : benchmarkReplies,
+    'transports' : benchmarkTransports,
+}
+
+def run(names) :
+    ''' Runs the named benchmarks, or all of them '''
+    for name in (names or sorted(BENCHMARKS)) :
+        if not name in BENCHMARKS :
+            print('Unknown benchmark "%s", expected one of: %s' % (name, ', '.join(sorted(BENCHMARKS))))
+            continue
+        print('--- %s: %s' % (name, BENCHMARKS[name].__doc__.strip()))
+        BENCHMARKS[name]()
+
+if __name__ == "__main__":
+    run(sys.argv[1:])
@@ -0,0 +1,146 @@
+import logging
+import time
+from internal.latency import latencyRecorder
+from sensor import Sensor
+from pneumatic import Pneumatic
+from digital_out import Digital_Out
+
+ESTOP_STATUS_TOPIC = 'estop/status'     # Same as MQTT.PATH.ESTOP_STATUS of the MachineMotion library
+
+class DEVICE_TYPE:
+    SENSOR = 'sensor'
+    PNEUMATIC = 'pneumatic'
+    DIGITAL_OUT = 'digital_out'
+
+class DeviceRegistry:
+    '''
+    Builds the IO devices of a MachineApp from a single hardware map, on the MQTT connection of a
+    MachineMotion, instead of one broker connection and network thread per device.
+
+    Incoming messages are dispatched to the devices through a topic dictionary, so each message
+    only reaches the devices listening to its topic. The shadow output state of the devices is
+    invalidated whenever the MQTT connection is re-established or an estop status is received.
+    '''
+
+    def __init__(self, machineMotion):
+        self.machineMotion = machineMotion
+        self.mqttClient = machineMotion.myMqttClient
+        self.devices = {}               # Maps each device key of the hardware map to its device
+        self.logger = logging.getLogger(__name__)
+
+        self.__topicCallbacks = {}      # Maps topics to the callbacks listening to them
+        self.__outputDevices = []       # Devices keeping a shadow output state
+        self.machineMotion.addMqttCallback(self.__onMqttMessage)
+        self.machineMotion.addMqttConnectCallback(self.invalidateOutputs)
+        self.subscribe(ESTOP_STATUS_TOPIC, self.__onEstopStatus)
+
+    def build(self, hardwareMap):
+        '''
+        Creates every device of the hardware map.
+
+        params:
+            hardwareMap: dict<str, dict>
+                Maps a key of your choice to the description of a device: its 'type' (see DEVICE_TYPE),
+                its 'name', its 'networkId' and its pins ('pin' for sensors and digital outputs,
+                'pushPin' and 'pullPin' for pneumatics), plus any option of the device constructor
+                such as confirmation sensors
+
+        returns:
+            dict<str, device>
+                The created devices, by key
+        '''
+        for key, description in hardwareMap.items():
+            description = dict(description)
+            deviceType = description.pop('type')
+            if deviceType == DEVICE_TYPE.SENSOR:
+                self.devices[key] = self.addSensor(**description)
+            elif deviceType == DEVICE_TYPE.PNEUMATIC:
+                self.devices[key] = self.addPneumatic(**description)
+            elif deviceType == DEVICE_TYPE.DIGITAL_OUT:
+                self.devices[key] = self.addDigitalOut(**description)
+            else:
+                raise ValueError('Unknown type {} for device {}'.format(deviceType, key))
+
+        return dict(self.devices)
+
+    def get(self, key):
+        return self.devices.get(key)
+
+    def addSensor(self, name, networkId, pin):
+        return Sensor(name, None, networkId, pin, registry=self)
+
+    def addPneumatic(self, name, networkId, pushPin, pullPin, **options):
+        device = Pneumatic(name, None, networkId, pushPin, pullPin, registry=self, **options)
+        self.__outputDevices.append(device)
+        return device
+
+    def addDigitalOut(self, name, networkId, pin, **options):
+        device = Digital_Out(name, None, networkId, pin, registry=self, **options)
+        self.__outputDevices.append(device)
+        return device
+
+    def writeOutputs(self, writes, force=False):
+        '''
+        Writes the pins of several output devices with one call, e.g. to apply a safe state.
+        Every write is published first, in order, then their delivery is confirmed together, without
+        waiting for the settle time of the devices.
+
+        params:
+            writes: list<(device, list<(int, int)>)>
+                The devices to write, each with its (pin, value) tuples
+            force: bool
+                Also writes the pins whose shadow state already has the requested value
+
+        returns:
+            bool
+                False if a write was not confirmed in time. The time from the first publish to the last
+                confirmation is recorded in internal.latency as 'IO batch'
+        '''
+        startTime = time.time()
+        pending = []
+        for device, values in writes:
+            values = device._begin_write(values, force)
+            if values is not None:
+                pending.append((device, values))
+
+        confirmed = True
+        for device, values in pending:
+            confirmed = device._wait_for_confirmation(values, None, 0) and confirmed
+
+        if pending and latencyRecorder.enabled:
+            latencyRecorder.record('IO batch', time.time() - startTime)
+        return confirmed
+
+    def invalidateOutputs(self):
+        '''
+        Forgets the shadow output state of every output device, so that their next writes are all sent.
+        '''
+        for device in self.__outputDevices:
+            device.invalidateOutputState()
+
+    def subscribe(self, topic, callback):
+        '''
+        Calls callback(topic: str, payload: str) for every message received on the topic.
+        '''
+        if not topic in self.__topicCallbacks:
+            self.__topicCallbacks[topic] = []
+            self.mqttClient.subscribe(topic)
+        self.__topicCallbacks[topic].append(callback)
+
+    def unsubscribe(self, topic, callback):
+        callbacks = self.__topicCallbacks.get(topic, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    def publish(self, topic, payload, retain=False):
+        return self.mqttClient.publish(topic, payload, retain=retain)
+
+    def __onEstopStatus(self, topic, payload):
+        self.invalidateOutputs()
+
+    def __onMqttMessage(self, topic, payload):
+        for callback in self.__topicCallbacks.get(topic, ()):
+            try:
+                callback(topic, payload)
+            except Exception as e:
+                self.logger.error('Device callback failed on {}: {}'.format(topic, e))
@@ -0,0 +1,573 @@
+#
+# Asyncio flavour of the MachineMotion API.
+#
+# AsyncMachineMotion talks to the same controller as MachineMotion, over non-blocking sockets:
+# G-code goes through a keep-alive HTTP/1.1 connection driven by asyncio streams, and MQTT is
+# driven by the event loop through the socket callbacks of paho. A single event loop can then
+# command several axes and controllers concurrently, without a thread per blocking call.
+#
+# Both classes can be used side by side, each with its own connections to the controller.
+#
+
+import asyncio
+import json
+import logging
+import time
+import urllib.parse
+
+import paho.mqtt.client as mqtt
+
+from internal.machine_motion import (
+    AXIS_NUMBER, DIRECTION, ENCODER_TYPE, MICRO_STEPS, MQTT, STEPPER_MOTOR, UNITS_ACCEL, UNITS_SPEED,
+    ControllerUnavailable, GCodeBuilder, GCodeReply, MotionCompletionTimeout, restrictInputValue
+)
+
+class AsyncHTTPConnection :
+    '''
+    Keep-alive HTTP/1.1 connection to a MachineMotion host, driven by asyncio streams.
+
+    Requests are serialized on the connection. A kept-alive socket that was closed by the
+    controller is replaced immediately; an unreachable controller is retried every
+    RETRY_DELAY_SECONDS until the deadline of the request, like HTTPConnectionPool does for the
+    synchronous API. A request that was sent but not answered is never sent again, since G-code
+    commands are not idempotent: ControllerUnavailable is raised instead.
+    '''
+    RETRY_DELAY_SECONDS = 1.0
+    DEFAULT_DEADLINE_SECONDS = 10.0
+
+    def __init__(self, host, port, loop = None) :
+        self.host = host
+        self.port = port
+        self.hits = 0           # Requests served on an already open connection
+        self.misses = 0         # Requests that had to open a new connection
+        self.reconnects = 0     # Kept-alive connections found dead and replaced
+        self.timeouts = 0       # Requests abandoned at their deadline
+        self.unanswered = 0     # Requests sent without getting a reply, never resent
+        self.replyTimeout = None    # Seconds to wait for a reply once the request is sent. None waits for as long as the command runs
+
+        self.__loop = loop or asyncio.get_event_loop()
+        self.__lock = asyncio.Lock()
+        self.__reader = None
+        self.__writer = None
+
+    async def request(self, path, data = None, deadline = None) :
+        '''
+        Sends a GET request (or a POST request if data is provided) and returns the raw response body.
+        Raises ControllerUnavailable if the request could not be sent within the deadline (in seconds,
+        DEFAULT_DEADLINE_SECONDS by default), or if it was sent but not answered. Once sent, the reply
+        is awaited for replyTimeout seconds, without limit by default.
+        '''
+        deadline = AsyncHTTPConnection.DEFAULT_DEADLINE_SECONDS if deadline is None else deadline
+        startTime = time.time()
+        async with self.__lock :
+            while True :
+                remaining = startTime + deadline - time.time()
+                if remaining <= 0 :
+                    self.timeouts += 1
+                    raise ControllerUnavailable("No reply from controller %s:%d to %s within %.1f seconds" % (self.host, self.port, path, deadline))
+
+                if self.__writer is not None and (self.__reader.at_eof() or self.__writer.is_closing()) :
+                    # The kept-alive socket went stale (e.g. idle timeout on the controller): reconnect right away
+                    self.close()
+                    self.reconnects += 1
+                if self.__writer is not None :
+                    self.hits += 1
+                else :
+                    try :
+                        self.__reader, self.__writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), remaining)
+                    except (OSError, asyncio.TimeoutError) as error :
+                        self.close()
+                        logging.warning("Could not GET %s: %s" % (path, error))
+                        await asyncio.sleep(max(0, min(AsyncHTTPConnection.RETRY_DELAY_SECONDS, startTime + deadline - time.time())))
+                        continue
+                    self.misses += 1
+
+                self.__send(path, data)
+                try :
+                    return await asyncio.wait_for(self.__readReply(), self.replyTimeout)
+                except (OSError, EOFError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as error :
+                    # The controller may have received and run the command: resending it could run it twice
+                    self.close()
+                    self.unanswered += 1
+                    raise ControllerUnavailable("No reply from controller %s:%d to %s, which may have run: %s" % (self.host, self.port, path, error))
+
+    def __send(self, path, data) :
+        method = "GET" if data is None else "POST"
+        body = b"" if data is None else (data if isinstance(data, bytes) else data.encode("utf-8"))
+        head = "%s %s HTTP/1.1\r\nHost: %s:%d\r\nContent-Length: %d\r\n" % (method, path, self.host, self.port, len(body))
+        if data is not None :
+            head += "Content-type: application/octet-stream\r\n"
+        self.__writer.write(head.encode("ascii") + b"\r\n" + body)
+
+    async def __readReply(self) :
+        statusLine = await self.__reader.readline()
+        if not statusLine :
+            raise EOFError("Connection closed by %s" % self.host)
+        version = statusLine.split(b" ", 1)[0]
+
+        headers = {}
+        while True :
+            line = await self.__reader.readline()
+            if line in (b"\r\n", b"\n", b"") :
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked" :
+            chunks = []
+            while True :
+                size = int((await self.__reader.readline()).split(b";", 1)[0], 16)
+                if size == 0 :
+                    await self.__reader.readline()
+                    break
+                chunks.append(await self.__reader.readexactly(size))
+                await self.__reader.readexactly(2)
+            responseBody = b"".join(chunks)
+        elif "content-length" in headers :
+            responseBody = await self.__reader.readexactly(int(headers["content-length"]))
+        else :
+            responseBody = await self.__reader.read()
+            self.close()
+            return responseBody
+
+        if headers.get("connection", "").lower() == "close" or version == b"HTTP/1.0" :
+            self.close()
+        return responseBody
+
+    def getStats(self) :
+        return {
+            "host" : "%s:%d" % (self.host, self.port),
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "reconnects" : self.reconnects,
+            "timeouts" : self.timeouts,
+            "unanswered" : self.unanswered,
+            "openConnections" : 0 if self.__writer is None else 1
+        }
+
+    def close(self) :
+        if self.__writer is not None :
+            self.__writer.close()
+        self.__reader = self.__writer = None
+
+class AsyncMQTTClient :
+    '''
+    Adapter that drives a paho MQTT client from an asyncio event loop instead of a network thread.
+
+    Messages are dispatched to the handlers registered with addHandler, and waitForMessage lets a
+    coroutine await the next message published on a topic. A lost connection is reopened every
+    RECONNECT_DELAY_SECONDS until disconnect is called, and the topics are subscribed again.
+    '''
+    MISC_INTERVAL_SECONDS = 1.0
+    RECONNECT_DELAY_SECONDS = 1.0
+
+    def __init__(self, loop = None) :
+        self.__loop = loop or asyncio.get_event_loop()
+        self.__handlers = []
+        self.__waiters = {}     # Maps topics to the futures awaiting their next message
+        self.__miscTask = None
+        self.__reconnectTask = None
+        self.__isDisconnecting = False
+        self.__subscriptions = []
+        self.isConnected = False
+
+        self.client = mqtt.Client()
+        self.client.on_socket_open = self.__onSocketOpen
+        self.client.on_socket_close = self.__onSocketClose
+        self.client.on_socket_register_write = self.__onSocketRegisterWrite
+        self.client.on_socket_unregister_write = self.__onSocketUnregisterWrite
+        self.client.on_connect = self.__onConnect
+        self.client.on_message = self.__onMessage
+        self.client.on_disconnect = self.__onDisconnect
+
+    async def connect(self, host, port = 1883, keepalive = 60) :
+        self.__isDisconnecting = False
+        await self.__openSocket(self.client.connect, host, port, keepalive)
+
+    async def __openSocket(self, connect, *args) :
+        # The TCP handshake itself runs in the default executor; the socket is then handed to the event loop
+        await self.__loop.run_in_executor(None, self.__connectSocket, connect, *args)
+        self.__onSocketOpen(self.client, None, self.client.socket())
+        self.__onSocketRegisterWrite(self.client, None, self.client.socket())
+
+    def __connectSocket(self, connect, *args) :
+        # Callbacks must run on the event loop: they are installed once the socket is open
+        onSocketOpen, onRegisterWrite = self.client.on_socket_open, self.client.on_socket_register_write
+        self.client.on_socket_open = self.client.on_socket_register_write = None
+        try :
+            connect(*args)
+        finally :
+            self.client.on_socket_open, self.client.on_socket_register_write = onSocketOpen, onRegisterWrite
+
+    def subscribe(self, topic) :
+        if not topic in self.__subscriptions :
+            self.__subscriptions.append(topic)
+        if self.isConnected :
+            self.client.subscribe(topic)
+
+    def publish(self, topic, payload, retain = False) :
+        return self.client.publish(topic, payload, retain = retain)
+
+    def addHandler(self, handler) :
+        '''
+        Registers a function called with (topic, payload) for every received message.
+        '''
+        if not handler in self.__handlers :
+            self.__handlers.append(handler)
+
+    def removeHandler(self, handler) :
+        self.__handlers.remove(handler)
+
+    async def waitForMessage(self, topic, timeout = None) :
+        '''
+        Returns the payload of the next message published on the topic. The topic must be subscribed.
+        '''
+        future = self.expectMessage(topic)
+        return await asyncio.wait_for(future, timeout)
+
+    def expectMessage(self, topic) :
+        '''
+        Returns a future resolved with the payload of the next message on the topic.
+        Creating the future before publishing a request guarantees that its response is not missed.
+        '''
+        future = self.__loop.create_future()
+        self.__waiters.setdefault(topic, []).append(future)
+        return future
+
+    def disconnect(self) :
+        self.__isDisconnecting = True
+        if self.__reconnectTask is not None :
+            self.__reconnectTask.cancel()
+            self.__reconnectTask = None
+        self.client.disconnect()
+
+    def __onConnect(self, client, userData, flags, rc) :
+        if rc == 0 :
+            self.isConnected = True
+            for topic in self.__subscriptions :
+                self.client.subscribe(topic)
+
+    def __onDisconnect(self, client, userData, rc) :
+        self.isConnected = False
+        logging.info("Disconnected with rtn code [%d]" % (rc))
+        if not self.__isDisconnecting and self.__reconnectTask is None :
+            self.__reconnectTask = self.__loop.create_task(self.__reconnect())
+
+    async def __reconnect(self) :
+        # The subscriptions are restored by __onConnect once the broker accepts the connection
+        try :
+            while not self.__isDisconnecting :
+                await asyncio.sleep(AsyncMQTTClient.RECONNECT_DELAY_SECONDS)
+                try :
+                    await self.__openSocket(self.client.reconnect)
+                    return
+                except OSError as error :
+                    logging.warning("Could not reconnect to MQTT broker: %s" % (error))
+        except asyncio.CancelledError :
+            pass
+        finally :
+            self.__reconnectTask = None
+
+    def __onMessage(self, client, userData, msg) :
+        payload = msg.payload.decode('utf-8')
+        for future in self.__waiters.pop(msg.topic, []) :
+            if not future.done() :
+                future.set_result(payload)
+        for handler in self.__handlers :
+            handler(msg.topic, payload)
+
+    def __onSocketOpen(self, client, userData, sock) :
+        self.__loop.add_reader(sock, self.client.loop_read)
+        self.__miscTask = self.__loop.create_task(self.__runMisc())
+
+    def __onSocketClose(self, client, userData, sock) :
+        self.__loop.remove_reader(sock)
+        if self.__miscTask is not None :
+            self.__miscTask.cancel()
+            self.__miscTask = None
+
+    def __onSocketRegisterWrite(self, client, userData, sock) :
+        self.__loop.add_writer(sock, self.client.loop_write)
+
+    def __onSocketUnregisterWrite(self, client, userData, sock) :
+        self.__loop.remove_writer(sock)
+
+    async def __runMisc(self) :
+        # Keep-alive pings and retries of unacknowledged messages
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS :
+            try :
+                await asyncio.sleep(AsyncMQTTClient.MISC_INTERVAL_SECONDS)
+            except asyncio.CancelledError :
+                break
+
+#
+# Class used to encapsulate the MachineMotion controller with awaitable calls
+# @status
+#
+class AsyncMachineMotion :
+    '''
+    Asyncio counterpart of MachineMotion.
+
+    Create it, then await connect() before any other call. Commands that only talk to the
+    controller are coroutines; IO and encoder reads return the last state received over MQTT.
+    '''
+    MotionCompletionTimeout = MotionCompletionTimeout
+
+    STOP_SETTLE_SECONDS = 0.8       # Time during which commands sent after a stop could be flushed
+    POLL_INTERVAL_SECONDS = 0.05    # Initial interval between two motion completion polls
+    MAX_POLL_INTERVAL_SECONDS = 0.25
+
+    def __init__(self, machineIp, loop = None) :
+        self.IP = machineIp
+        self.loop = loop or asyncio.get_event_loop()
+        self.myConnection = AsyncHTTPConnection(machineIp, 8000, self.loop)
+        self.myMqttClient = AsyncMQTTClient(self.loop)
+        self.myMqttClient.addHandler(self.__onMessage)
+
+        self.myIoExpanderAvailabilityState = [ False, False, False, False ]
+        self.myEncoderRealtimePositions = [ 0, 0, 0 ]
+        self.myEncoderStablePositions = [ 0, 0, 0 ]
+        self.digitalInputs = {}
+        self.u_step = ["Axis 0 does not exist", "notInitialized", "notInitialized", "notInitialized"]
+        self.mech_gain = ["Axis 0 does not exist", "notInitialized", "notInitialized", "notInitialized"]
+        self.steps_mm = ["Axis 0 does not exist", "notInitialized", "notInitialized", "notInitialized"]
+
+        def emptyCallBack(data) : pass
+        self.eStopCallback = emptyCallBack
+        self.__isEstopped = False
+        self.__inputWaiters = []    # (device, pin, value, future) awaiting a digital input state
+
+        for topic in ('devices/io-expander/+/available', 'devices/io-expander/+/digital-input/#', 'devices/encoder/+/realtime-position',
+                      'devices/encoder/+/stable-position', MQTT.PATH.ESTOP_STATUS, MQTT.PATH.ESTOP_TRIGGER_RESPONSE,
+                      MQTT.PATH.ESTOP_RELEASE_RESPONSE, MQTT.PATH.ESTOP_SYSTEMRESET_RESPONSE) :
+            self.myMqttClient.subscribe(topic)
+
+    async def connect(self) :
+        '''
+        desc: Connects to the MQTT broker of the controller. The HTTP connection is opened on the first command.
+        '''
+        await self.myMqttClient.connect(self.IP)
+
+    async def close(self) :
+        '''
+        desc: Closes the connections to the controller.
+        '''
+        self.myMqttClient.disconnect()
+        self.myConnection.close()
+
+    async def emit(self, gCode) :
+        '''
+        desc: Sends a raw G-code command and returns the reply of the controller.
+        returnValueType: GCodeReply
+        '''
+        return GCodeReply(await self.myConnection.request("/gcode?gcode=" + urllib.parse.quote_plus(gCode)))
+
+    async def __emitChecked(self, gCode) :
+        reply = await self.emit(gCode)
+
+        if ( reply.isOk ) : pass
+        else : raise Exception('Error in gCode execution')
+
+        return reply
+
+    async def emitgCode(self, gCode) :
+        '''
+        desc: Executes raw gCode on the controller and returns its reply.
+        '''
+        return await self.emit(gCode)
+
+    async def emitStop(self) :
+        '''
+        desc: Immediately stops all motion of all axes.
+        note: Unlike MachineMotion.emitStop, the settling delay after the stop does not block other coroutines.
+        '''
+        await self.__emitChecked("M410")
+
+        # Wait to insure that other commands after the emit stop are not flushed.
+        await asyncio.sleep(AsyncMachineMotion.STOP_SETTLE_SECONDS)
+
+    async def emitHomeAll(self) :
+        await self.__emitChecked("G28")
+
+    async def emitHome(self, axis) :
+        restrictInputValue("axis", axis, AXIS_NUMBER)
+        await self.__emitChecked(GCodeBuilder.home(axis))
+
+    async def emitSpeed(self, speed, units = UNITS_SPEED.mm_per_sec) :
+        restrictInputValue("units", units, UNITS_SPEED)
+        await self.__emitChecked(GCodeBuilder.feedrate(speed if units == UNITS_SPEED.mm_per_min else 60*speed))
+
+    async def emitAcceleration(self, acceleration, units = UNITS_ACCEL.mm_per_sec_sqr) :
+        restrictInputValue("units", units, UNITS_ACCEL)
+        await self.__emitChecked(GCodeBuilder.acceleration(acceleration if units == UNITS_ACCEL.mm_per_sec_sqr else acceleration/3600))
+
+    async def emitAbsoluteMove(self, axis, position) :
+        await self.emitCombinedAxesAbsoluteMove([axis], [position])
+
+    async def emitCombinedAxesAbsoluteMove(self, axes, positions) :
+        for axis in axes :
+            restrictInputValue("axis", axis, AXIS_NUMBER)
+        await self.__emitChecked("G90")
+        await self.__emitChecked(GCodeBuilder.combinedMove(axes, positions))
+
+    async def emitRelativeMove(self, axis, direction, distance) :
+        await self.emitCombinedAxisRelativeMove([axis], [direction], [distance])
+
+    async def emitCombinedAxisRelativeMove(self, axes, directions, distances) :
+        for axis, direction in zip(axes, directions) :
+            restrictInputValue("axis", axis, AXIS_NUMBER)
+            restrictInputValue("direction", direction, DIRECTION)
+        await self.__emitChecked("G91")
+        await self.__emitChecked(GCodeBuilder.combinedMove(axes, [GCodeBuilder.signedDistance(direction, distance) for direction, distance in zip(directions, distances)]))
+
+    async def setPosition(self, axis, position) :
+        restrictInputValue("axis", axis, AXIS_NUMBER)
+        await self.__emitChecked(GCodeBuilder.setPosition(axis, position))
+
+    async def emitDwell(self, milliseconds) :
+        await self.__emitChecked("G4 P" + str(milliseconds))
+
+    async def configAxis(self, axis, uStep, mechGain) :
+        restrictInputValue("axis", axis, AXIS_NUMBER)
+        restrictInputValue("uStep", uStep, MICRO_STEPS)
+
+        self.u_step[axis] = float(uStep)
+        self.mech_gain[axis] = float(mechGain)
+        self.steps_mm[axis] = STEPPER_MOTOR.steps_per_turn * self.u_step[axis] / self.mech_gain[axis]
+
+        await self.__emitChecked(GCodeBuilder.stepsPerMm(axis, self.steps_mm[axis]))
+
+    async def getCurrentPositions(self) :
+        '''
+        desc: Returns the current position of each axis.
+        returnValueType: Dictionary
+        '''
+        reply = await self.__emitChecked("M114")
+        return reply.getPositions()
+
+    async def getEndStopState(self) :
+        '''
+        desc: Returns the current state of all home and end sensors.
+        returnValueType: Dictionary
+        '''
+        reply = await self.__emitChecked("M119")
+        return reply.getEndStopStates()
+
+    async def isMotionCompleted(self) :
+        reply = await self.__emitChecked("V0")
+        return reply.isMotionCompleted()
+
+    async def waitForMotionCompletion(self, timeout = None) :
+        '''
+        desc: Waits until all queued motion is completed. Other coroutines keep running while waiting.
+        params:
+            timeout:
+                desc: Maximum number of seconds to wait, or None to wait without limit.
+                type: Number
+        note: Raises MotionCompletionTimeout if the motion is not completed within the timeout.
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        interval = AsyncMachineMotion.POLL_INTERVAL_SECONDS
+        while not await self.isMotionCompleted() :
+            if deadline is not None and time.time() >= deadline :
+                raise MotionCompletionTimeout("Motion was not completed within %.3f seconds" % timeout)
+            await asyncio.sleep(interval)
+            interval = min(interval * 1.5, AsyncMachineMotion.MAX_POLL_INTERVAL_SECONDS)
+
+    def isIoExpanderAvailable(self, device) :
+        return self.myIoExpanderAvailabilityState[ device-1 ]
+
+    def digitalRead(self, deviceNetworkId, pin) :
+        '''
+        desc: Returns the last received state of a digital input pin.
+        '''
+        return self.digitalInputs.get(deviceNetworkId, {}).get(pin, 0)
+
+    async def waitForDigitalInput(self, deviceNetworkId, pin, value, timeout = None) :
+        '''
+        desc: Waits until a digital input pin reaches the given state.
+        note: Raises asyncio.TimeoutError if the state is not reached within the timeout.
+        '''
+        if self.digitalRead(deviceNetworkId, pin) == value :
+            return
+        future = self.loop.create_future()
+        waiter = (deviceNetworkId, pin, value, future)
+        self.__inputWaiters.append(waiter)
+        try :
+            await asyncio.wait_for(future, timeout)
+        finally :
+            if waiter in self.__inputWaiters :
+                self.__inputWaiters.remove(waiter)
+
+    def digitalWrite(self, deviceNetworkId, pin, value) :
+        self.myMqttClient.publish('devices/io-expander/' + str(deviceNetworkId) + '/digital-output/' + str(pin), '1' if value else '0', retain = True)
+
+    def readEncoder(self, encoder, readingType = ENCODER_TYPE.real_time) :
+        restrictInputValue("readingType", readingType, ENCODER_TYPE)
+        if readingType == ENCODER_TYPE.stable :
+            return self.myEncoderStablePositions[encoder]
+        return self.myEncoderRealtimePositions[encoder]
+
+    def isEstopped(self) :
+        return self.__isEstopped
+
+    def bindeStopEvent(self, callback_function) :
+        self.eStopCallback = callback_function
+
+    async def triggerEstop(self) :
+        '''
+        desc: Triggers the MachineMotion software emergency stop and returns the response of the controller.
+        '''
+        return await self.__estopRequest(MQTT.PATH.ESTOP_TRIGGER_REQUEST, MQTT.PATH.ESTOP_TRIGGER_RESPONSE)
+
+    async def releaseEstop(self) :
+        '''
+        desc: Releases the software E-stop and returns the response of the controller.
+        '''
+        return await self.__estopRequest(MQTT.PATH.ESTOP_RELEASE_REQUEST, MQTT.PATH.ESTOP_RELEASE_RESPONSE)
+
+    async def resetSystem(self) :
+        '''
+        desc: Resets the system after an eStop event and returns the response of the controller.
+        '''
+        return await self.__estopRequest(MQTT.PATH.ESTOP_SYSTEMRESET_REQUEST, MQTT.PATH.ESTOP_SYSTEMRESET_RESPONSE)
+
+    async def __estopRequest(self, requestTopic, responseTopic) :
+        # The response topic is subscribed at construction: no need to wait for a subscription before publishing
+        response = self.myMqttClient.expectMessage(responseTopic)
+        self.myMqttClient.publish(requestTopic, "message is not important")
+        try :
+            return json.loads(await asyncio.wait_for(response, MQTT.TIMEOUT))
+        except asyncio.TimeoutError :
+            raise Exception('MQTT response timeout!')
+
+    def __onMessage(self, topic, payload) :
+        topicParts = topic.split('/')
+
+        if topicParts[0] == MQTT.PATH.ESTOP :
+            if topicParts[1] == "status" :
+                self.__isEstopped = json.loads(payload)
+                self.eStopCallback(self.__isEstopped)
+            return
+
+        if topicParts[0] != 'devices' :
+            return
+
+        try :
+            device = int(topicParts[2])
+            if topicParts[1] == 'io-expander' :
+                if topicParts[3] == 'available' :
+                    self.myIoExpanderAvailabilityState[device-1] = bool(json.loads(payload))
+                elif topicParts[3] == 'digital-input' :
+                    pin, value = int(topicParts[4]), int(payload)
+                    self.digitalInputs.setdefault(device, {})[pin] = value
+                    for waiter in list(self.__inputWaiters) :
+                        if waiter[:3] == (device, pin, value) and not waiter[3].done() :
+                            waiter[3].set_result(value)
+            elif topicParts[1] == 'encoder' :
+                if topicParts[3] == ENCODER_TYPE.real_time :
+                    self.myEncoderRealtimePositions[device] = float(payload)
+                elif topicParts[3] == ENCODER_TYPE.stable :
+                    self.myEncoderStablePositions[device] = float(payload)
+        except (IndexError, ValueError) :
+            return
@@ -3,17 +3,36 @@ import logging
 from internal.notifier import NotificationLevel, sendNotification
 import time
 from internal.mqtt_topic_subscriber import MqttTopicSubscriber
+from internal.controller_group import ControllerGroup
+from internal.telemetry import TelemetryService
+from internal.latency import latencyRecorder
+from internal.interprocess_message import SubprocessToParentMessage, sendSubprocessToParentMsg
 
 # TODO: Hacky wait to ensure that all print statements are immediately flushed up to the super-process
 import functools
 print = functools.partial(print, flush=True)
 
+class MotionParameters:
+    '''
+    Speed and acceleration that a state sets on a MachineMotion when it is entered. Values left
+    to None are not set.
+    '''
+    def __init__(self, machineMotion, speed=None, acceleration=None):
+        self.machineMotion = machineMotion
+        self.speed = speed                  # mm/s, as passed to emitSpeed
+        self.acceleration = acceleration    # mm/s^2, as passed to emitAcceleration
+
 class MachineAppState(ABC):
     '''
     Abstract class that defines a MachineAppState. If you want to create a new state,
     you will inherit this class and implement, at the minimum, the onEnter and onLeave
     methods. See IdleState for an example.
     '''
+
+    # When True, gotoState sends the motion parameters of the next state as soon as it is called.
+    # Set it to False in states that issue moves after calling gotoState, or in onLeave, since those
+    # moves would otherwise run at the speed and acceleration of the next state.
+    prefetchOnGotoState = True
     
     def __init__(self, engine: 'BaseMachineAppEngine'):
         '''
@@ -39,6 +58,31 @@ class MachineAppState(ABC):
         '''
         return self.engine.gotoState(state)
 
+    def prefetchState(self, state):
+        '''
+        Sends the motion parameters of the provided state ahead of time, see BaseMachineAppEngine.prefetchState
+
+        params:
+            state: str
+                name of the state that you are about to transition to
+        returns:
+            bool
+                all of the motion parameters were sent
+        '''
+        return self.engine.prefetchState(state)
+
+    def getMotionParameters(self):
+        '''
+        Declares the speed and acceleration that this state sets in onEnter, so that the
+        previous state can send them ahead of time with prefetchState.
+
+        Default behavior: Nothing to declare
+
+        returns:
+            list<MotionParameters>
+        '''
+        return []
+
     def registerCallback(self, machineMotion: 'MachineMotion', ioName: str, callback):
         ''' 
         Register a callback for a particular topic. Note that you should call removeCallback
@@ -135,10 +179,13 @@ class BaseMachineAppEngine(ABC):
     Base class for the MachineApp engine
     '''
     UPDATE_INTERVAL_SECONDS = 0.16
+    LATENCY_REPORT_INTERVAL_SECONDS = 5.0
 
     def __init__(self):
         self.configuration  = None                                      # Python dictionary containing the loaded configuration payload
         self.logger         = logging.getLogger(__name__)               # Logger used to output information to the local log file and console
+        self.controllerGroup = ControllerGroup()                        # Every MachineMotion registered with addMachineMotion, commanded in parallel
+        self.telemetryServices = []                                     # TelemetryService of every MachineMotion passed to enableTelemetry
         
         # High-Level state variables
         self.__isRunning              = False                           # The MachineApp will execute while this flag is set
@@ -153,6 +200,7 @@ class BaseMachineAppEngine(ABC):
         self.__shouldStop   = False                                     # Tells the MachineApp loop that it should stop on its next update
         self.__shouldPause  = False                                     # Tells the MachineApp loop that it should pause on its next update
         self.__shouldResume = False                                     # Tells the MachineApp loop that it should resume on its next update
+        self.__lastLatencyReportTime = 0                                # Last time the controller latency statistics were sent to the parent process
 
 
     @abstractmethod
@@ -221,9 +269,10 @@ class BaseMachineAppEngine(ABC):
     @abstractmethod
     def onEstop(self):
         '''
-        Called AFTER the MachineMotion has been estopped. Please note that any state
-        that you were using will no longer be available at this point. You should
-        most likely reset all IOs to the OFF position in this method.
+        Called AFTER the MachineMotion has been estopped, in a separate thread, with the MachineMotion
+        instances registered in initialize. The MachineApp is terminated right after, so any state
+        that you were using will no longer be available. You should most likely reset all IOs to
+        the OFF position in this method.
         '''
         pass
 
@@ -231,6 +280,71 @@ class BaseMachineAppEngine(ABC):
         ''' Returns the current configuration '''
         return self.configuration
 
+    def addMachineMotion(self, machineMotion):
+        '''
+        Registers a MachineMotion with the engine, so that group operations such as
+        stopAllMachineMotions reach it. Call this in initialize for every instance you create.
+
+        params:
+            machineMotion: MachineMotion
+                Instance to register
+
+        returns:
+            MachineMotion
+                The registered instance
+        '''
+        return self.controllerGroup.add(machineMotion)
+
+    def getControllerGroup(self):
+        ''' Returns the ControllerGroup of every registered MachineMotion '''
+        return self.controllerGroup
+
+    def stopAllMachineMotions(self):
+        '''
+        Calls emitStop on every registered MachineMotion at the same time, and logs how long each
+        controller took to stop.
+
+        returns:
+            list<ControllerResult>
+        '''
+        results = self.controllerGroup.emitStop()
+        for result in results:
+            if result.succeeded:
+                self.logger.info('Stopped {} in {:.3f}s'.format(getattr(result.machineMotion, 'IP', result.machineMotion), result.latency))
+            else:
+                self.logger.error('Failed to stop {}: {}'.format(getattr(result.machineMotion, 'IP', result.machineMotion), result.error))
+        return results
+
+    def enableTelemetry(self, machineMotion, interval=0.5, pollPositions=True, pollEndStops=True):
+        '''
+        Starts polling the positions and end stop states of a MachineMotion in the background, so
+        that states can read them from the returned service without querying the controller. Changes
+        are sent to the Web Client as NotificationLevel.TELEMETRY notifications. Polling stops when
+        the MachineApp stops running.
+
+        params:
+            machineMotion: MachineMotion
+                Instance to poll
+            interval: float
+                Seconds between two polls
+            pollPositions: bool
+                Poll the axis positions
+            pollEndStops: bool
+                Poll the end stop states
+
+        returns:
+            TelemetryService
+        '''
+        telemetry = TelemetryService(machineMotion, interval, pollPositions, pollEndStops)
+        self.telemetryServices.append(telemetry)
+        telemetry.start()
+        return telemetry
+
+    def __stopTelemetry(self):
+        for telemetry in self.telemetryServices:
+            telemetry.stop()
+        self.telemetryServices = []
+
     def getCurrentState(self):
         '''
         Returns the implementation of MachineAppState that maps to the value of self.__currentState.
@@ -265,8 +379,59 @@ class BaseMachineAppEngine(ABC):
             return False
 
         self.__nextRequestedState = newState
+
+        # Overlaps the setup of the next state with the move that may still be running
+        currentState = self.__stateDictionary.get(self.__currentState)
+        if currentState is None or currentState.prefetchOnGotoState:
+            self.prefetchState(newState)
         return True
 
+    def prefetchState(self, stateName: str):
+        '''
+        Sends the speed and acceleration declared by the getMotionParameters of a state before
+        transitioning to it. gotoState calls it automatically, which overlaps the setup round trips
+        with a move still running at that time. States that wait for their last move before calling
+        gotoState can call it earlier themselves, right before their final waitForMotionCompletion.
+
+        The controller applies a new speed or acceleration to the moves queued after it, not to the
+        running move. Moves issued after the prefetch, in update after gotoState or in onLeave, do
+        run with the parameters of the next state: states doing so set prefetchOnGotoState to False
+        and call prefetchState themselves after their last move, if at all.
+
+        When the next state calls emitSpeed and emitAcceleration with the same values in onEnter,
+        the MachineMotion skips them since the controller is already known to use them.
+
+        params:
+            stateName: str
+                name of the state that you are about to transition to
+        returns:
+            bool
+                all of the motion parameters were sent
+        '''
+        if not stateName in self.__stateDictionary:
+            self.logger.error('Trying to prefetch an unknown state: {}'.format(stateName))
+            return False
+
+        try:
+            parametersList = self.__stateDictionary[stateName].getMotionParameters()
+        except Exception as e:
+            self.logger.warning('Could not get the motion parameters of the {} state: {}'.format(stateName, e))
+            return False
+
+        succeeded = True
+        for parameters in parametersList:
+            try:
+                if parameters.speed != None:
+                    parameters.machineMotion.emitSpeed(parameters.speed)
+                if parameters.acceleration != None:
+                    parameters.machineMotion.emitAcceleration(parameters.acceleration)
+            except Exception as e:
+                # The state sends its parameters itself when it is entered
+                self.logger.warning('Could not prefetch the motion parameters of the {} state: {}'.format(stateName, e))
+                succeeded = False
+
+        return succeeded
+
     def __tryExecuteStateTransition(self):
         '''
         (Internal, for engine use only)
@@ -316,6 +481,8 @@ class BaseMachineAppEngine(ABC):
         self.__inStateStepperMode = inStateStepperMode
         self.configuration = configuration
         self.__isRunning = True
+        self.controllerGroup.clear()
+        self.__stopTelemetry()
 
         # Run initialization sequence
         self.initialize()
@@ -326,6 +493,8 @@ class BaseMachineAppEngine(ABC):
 
         # Inner Loop running the actual MachineApp program
         while self.__isRunning:
+            self.__reportLatencyStats()
+
             if self.__shouldStop:           # Running stop behavior
                 self.__shouldStop = False
                 self.__isRunning = False
@@ -385,10 +554,31 @@ class BaseMachineAppEngine(ABC):
             time.sleep(BaseMachineAppEngine.UPDATE_INTERVAL_SECONDS)
 
         self.logger.info('Exiting MachineApp loop')
+        self.__stopTelemetry()
+        self.__reportLatencyStats(force=True)
         sendNotification(NotificationLevel.APP_COMPLETE, 'MachineApp completed')
         self.afterRun()
         return True
 
+    def __reportLatencyStats(self, force=False):
+        '''
+        Sends the controller latency statistics to the parent process, where they are
+        served on /stats/latency, at most once every LATENCY_REPORT_INTERVAL_SECONDS.
+
+        params:
+            force: bool
+                Send the statistics regardless of when they were last sent
+        '''
+        if not latencyRecorder.enabled:
+            return
+
+        now = time.time()
+        if not force and now - self.__lastLatencyReportTime < BaseMachineAppEngine.LATENCY_REPORT_INTERVAL_SECONDS:
+            return
+
+        self.__lastLatencyReportTime = now
+        sendSubprocessToParentMsg(SubprocessToParentMessage.LATENCY_STATS, latencyRecorder.getStats())
+
     def pause(self):
         '''
         Pauses the MachineApp loop.
@@ -411,6 +601,21 @@ class BaseMachineAppEngine(ABC):
         self.logger.info('Resuming the MachineApp')
         self.__shouldResume = True
 
+    def estop(self):
+        '''
+        Calls onEstop, then tells the parent process that the MachineApp can be terminated.
+
+        Warning: Logic in here is happening in a different thread. You should only 
+        alter this behavior if you know what you are doing. It is recommended that
+        you implement any on-estop behavior in onEstop instead
+        '''
+        self.logger.info('Estopping the MachineApp')
+        try:
+            self.onEstop()
+        except Exception as e:
+            self.logger.error('onEstop failed: {}'.format(e))
+        sendSubprocessToParentMsg(SubprocessToParentMessage.ESTOP_HANDLED)
+
     def stop(self):
         '''
         Stops the MachineApp loop.
@@ -0,0 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import RLock
+import logging
+import time
+
+class ControllerResult:
+    ''' Outcome of an operation on one controller of a ControllerGroup '''
+
+    def __init__(self, machineMotion, value=None, error=None, latency=0.0):
+        self.machineMotion = machineMotion
+        self.value = value          # Value returned by the operation
+        self.error = error          # Exception raised by the operation, if any
+        self.latency = latency      # Seconds taken by the operation on this controller
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+    def toJson(self):
+        return {
+            "ip": getattr(self.machineMotion, 'IP', None),
+            "succeeded": self.succeeded,
+            "error": None if self.error is None else str(self.error),
+            "latency": self.latency
+        }
+
+class ControllerGroupError(Exception):
+    ''' Raised by ControllerGroup.raiseOnError when an operation failed on some controllers '''
+
+    def __init__(self, results):
+        self.results = results
+        failures = [result for result in results if not result.succeeded]
+        super().__init__('Operation failed on {} of {} controllers: {}'.format(
+            len(failures), len(results), ', '.join('{} ({})'.format(result.toJson()['ip'], result.error) for result in failures)))
+
+class ControllerGroup:
+    '''
+    Runs operations on several MachineMotion instances in parallel, one worker thread per controller.
+
+    Every operation returns the list of ControllerResult of the controllers, in the order in which
+    they were added to the group. An operation that fails on one controller is still carried out
+    on the others.
+    '''
+
+    def __init__(self, machineMotions=None):
+        self.__lock = RLock()
+        self.__machineMotions = []
+        self.__executor = None
+        self.logger = logging.getLogger(__name__)
+
+        for machineMotion in (machineMotions or []):
+            self.add(machineMotion)
+
+    def add(self, machineMotion):
+        ''' Adds a controller to the group and returns it '''
+        with self.__lock:
+            if not machineMotion in self.__machineMotions:
+                self.__machineMotions.append(machineMotion)
+                self.__resizeExecutor()
+        return machineMotion
+
+    def remove(self, machineMotion):
+        with self.__lock:
+            self.__machineMotions.remove(machineMotion)
+            self.__resizeExecutor()
+
+    def clear(self):
+        with self.__lock:
+            self.__machineMotions = []
+            self.__resizeExecutor()
+
+    def getMachineMotions(self):
+        with self.__lock:
+            return list(self.__machineMotions)
+
+    def __len__(self):
+        return len(self.__machineMotions)
+
+    def __iter__(self):
+        return iter(self.getMachineMotions())
+
+    def __resizeExecutor(self):
+        if self.__executor != None:
+            self.__executor.shutdown(wait=False)
+        self.__executor = ThreadPoolExecutor(max_workers=len(self.__machineMotions)) if len(self.__machineMotions) > 1 else None
+
+    def call(self, method, *args, **kwargs):
+        '''
+        Calls the method on every controller of the group at the same time.
+
+        params:
+            method: str | func(machineMotion, *args, **kwargs)
+                Name of the MachineMotion method to call, or function called with each controller
+            *args, **kwargs:
+                Arguments passed to the method
+
+        returns:
+            list<ControllerResult>
+        '''
+        with self.__lock:
+            machineMotions = list(self.__machineMotions)
+            executor = self.__executor
+
+        if isinstance(method, str):
+            methodName = method
+            method = lambda machineMotion, *args, **kwargs: getattr(machineMotion, methodName)(*args, **kwargs)
+
+        def run(machineMotion):
+            startTime = time.time()
+            try:
+                return ControllerResult(machineMotion, method(machineMotion, *args, **kwargs), None, time.time() - startTime)
+            except Exception as e:
+                self.logger.warning('Operation failed on controller {}: {}'.format(getattr(machineMotion, 'IP', machineMotion), e))
+                return ControllerResult(machineMotion, None, e, time.time() - startTime)
+
+        # A single controller does not need to pay for the hand-off to a worker thread
+        if executor == None:
+            return [run(machineMotion) for machineMotion in machineMotions]
+        return list(executor.map(run, machineMotions))
+
+    @staticmethod
+    def raiseOnError(results):
+        ''' Raises ControllerGroupError if the operation failed on any controller, otherwise returns the results '''
+        if any(not result.succeeded for result in results):
+            raise ControllerGroupError(results)
+        return results
+
+    def configAxis(self, axis, uStep, mechGain):
+        return self.call('configAxis', axis, uStep, mechGain)
+
+    def configAxisDirection(self, axis, direction):
+        return self.call('configAxisDirection', axis, direction)
+
+    def emitSpeed(self, speed):
+        return self.call('emitSpeed', speed)
+
+    def emitAcceleration(self, acceleration):
+        return self.call('emitAcceleration', acceleration)
+
+    def emitHomeAll(self):
+        return self.call('emitHomeAll')
+
+    def emitStop(self):
+        return self.call('emitStop')
+
+    def waitForMotionCompletion(self):
+        return self.call('waitForMotionCompletion')
+
+    def triggerEstop(self):
+        return self.call('triggerEstop')
+
+    def releaseEstop(self):
+        return self.call('releaseEstop')
+
+    def resetSystem(self):
+        return self.call('resetSystem')
+
+    def close(self):
+        ''' Stops the worker threads of the group '''
+        with self.__lock:
+            if self.__executor != None:
+                self.__executor.shutdown(wait=False)
+                self.__executor = None
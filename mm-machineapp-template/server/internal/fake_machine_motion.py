@@ -21,6 +21,7 @@ class MachineMotion:
         self._complete_batching = False
         self.logger = logging.getLogger(__name__)
         self.mqttCallbacks = []
+        self.mqttConnectCallbacks = []
 
         self.myMqttClient = mqtt.Client()
         self.myMqttClient.on_connect = self.__onConnect
@@ -38,9 +39,18 @@ class MachineMotion:
     def removeMqttCallback(self, func):
         self.mqttCallbacks.remove(func)
 
+    def addMqttConnectCallback(self, func):
+        if not func in self.mqttConnectCallbacks:
+            self.mqttConnectCallbacks.append(func)
+
+    def removeMqttConnectCallback(self, func):
+        self.mqttConnectCallbacks.remove(func)
+
     def __onConnect(self, client, userData, flags, rc):
         if rc == 0:
             self.logger.info('Connected to mqtt')
+            for callback in self.mqttConnectCallbacks:
+                callback()
 
     def __onDisconnect(self, client, userData, rc):
            self.logger.info("Disconnected with rtn code [%d]", rc)
@@ -55,6 +65,9 @@ class MachineMotion:
     def configAxis(self, axis, uStep, mechGain):
         pass
 
+    def configAxisConfigurationCache(self, path):
+        pass
+
     def triggerEstop(self):
         self._is_stopped = True
         pass
@@ -75,6 +88,12 @@ class MachineMotion:
     def waitForMotionCompletion(self):
         sleep(3)
         
+    def setMoveBuffering(self, enabled):
+        pass
+
+    def flushMoves(self):
+        pass
+
     def emitStop(self):
         self.logger.debug("Please Stop...")
         self._complete_batching = True
@@ -103,6 +122,11 @@ class MachineMotion:
         self.logger.debug("Writing (pin={}, networkId={}, value={})".format(pin, deviceNetworkId, value))
         pass
 
+    def digitalWriteMany(self, writes, timeout=1.0):
+        for (deviceNetworkId, pin, value) in writes:
+            self.digitalWrite(deviceNetworkId, pin, value)
+        return 0
+
     def digitalRead(self, deviceNetworkId, pin):
         return 0
 
@@ -139,6 +163,12 @@ class MachineMotion:
     def getCurrentPositions(self):
         return self.current_position
 
+    def getCommandedPositions(self, reconcile = False):
+        return dict(self.current_position)
+
+    def configPositionReconciliation(self, interval = False, driftThreshold = None):
+        pass
+
     def getCurrentSteps(self):
         return self.current_position
 
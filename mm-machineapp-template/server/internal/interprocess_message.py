@@ -5,6 +5,8 @@ class SubprocessToParentMessage:
     ''' Messages sent from the Subprocess to the parent process '''
     NONE            = 0
     NOTIFICATION    = 1
+    LATENCY_STATS   = 2
+    ESTOP_HANDLED   = 3
 
 def sendSubprocessToParentMsg(type, data = None):
     '''
@@ -0,0 +1,98 @@
+from bisect import bisect_left
+from threading import Lock
+import time
+
+class LatencyHistogram:
+    '''
+    Fixed-bucket histogram of latencies, in seconds, over a rolling window.
+
+    Samples are counted in the current window, and percentiles are computed over the current
+    and the previous windows, so they always cover between one and two WINDOW_SECONDS.
+    '''
+    BUCKET_BOUNDS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+    WINDOW_SECONDS = 60.0
+
+    def __init__(self):
+        self.__current = [0] * (len(LatencyHistogram.BUCKET_BOUNDS) + 1)
+        self.__previous = [0] * (len(LatencyHistogram.BUCKET_BOUNDS) + 1)
+        self.__windowStart = time.time()
+        self.count = 0          # Samples recorded since the histogram was created
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        now = time.time()
+        if now - self.__windowStart >= LatencyHistogram.WINDOW_SECONDS:
+            self.__rotate(now)
+        self.__current[bisect_left(LatencyHistogram.BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def __rotate(self, now):
+        # Two windows ago is too old: forget it, and drop the previous window too if it is stale
+        isStale = now - self.__windowStart >= 2 * LatencyHistogram.WINDOW_SECONDS
+        self.__previous = [0] * len(self.__current) if isStale else self.__current
+        self.__current = [0] * len(self.__previous)
+        self.__windowStart = now
+
+    def getPercentile(self, buckets, fraction):
+        '''
+        Returns the upper bound of the bucket holding the given fraction of the samples, or None without samples.
+        '''
+        total = sum(buckets)
+        if total == 0:
+            return None
+        threshold = fraction * total
+        cumulated = 0
+        for index, bucketCount in enumerate(buckets):
+            cumulated += bucketCount
+            if cumulated >= threshold:
+                return LatencyHistogram.BUCKET_BOUNDS[index] if index < len(LatencyHistogram.BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def getStats(self):
+        if time.time() - self.__windowStart >= LatencyHistogram.WINDOW_SECONDS:
+            self.__rotate(time.time())
+        buckets = [current + previous for current, previous in zip(self.__current, self.__previous)]
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count > 0 else None,
+            "max": self.max,
+            "p50": self.getPercentile(buckets, 0.50),
+            "p95": self.getPercentile(buckets, 0.95),
+            "p99": self.getPercentile(buckets, 0.99)
+        }
+
+class LatencyRecorder:
+    '''
+    Latency histograms of the controller I/O, keyed by operation (G-code verb, HTTP path or MQTT topic).
+
+    Callers check 'enabled' before timing anything, so a disabled recorder costs a single attribute lookup.
+    '''
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.__lock = Lock()
+        self.__histograms = {}
+
+    def record(self, key, seconds):
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram == None:
+                histogram = self.__histograms[key] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def getStats(self):
+        '''
+        Returns the latency statistics of every operation, as { key: { count, mean, max, p50, p95, p99 } } in seconds.
+        '''
+        with self.__lock:
+            return { key: histogram.getStats() for key, histogram in self.__histograms.items() }
+
+    def reset(self):
+        with self.__lock:
+            self.__histograms = {}
+
+latencyRecorder = LatencyRecorder()
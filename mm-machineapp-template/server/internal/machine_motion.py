@@ -5,7 +5,7 @@
 #                       ./documentation                             #
 
 # Import standard libraries
-import json, time, threading, sys
+import json, time, threading, sys, collections, math, re, random, os, hashlib, atexit, socket, select, weakref
 
 # Import package dependent libraries
 import paho.mqtt.client as mqtt
@@ -14,13 +14,10 @@ import paho.mqtt.subscribe as MQTTsubscribe
 import logging
 import traceback
 
-import urllib
-# Import if python 2
-if sys.version_info[0] < 3 :
-    import httplib
-# Import if python 3
-else :
-    import http.client
+import urllib.parse
+import http.client
+
+from internal.latency import latencyRecorder
 
 class CONTROL_DEVICE_SIGNALS:
     SIGNAL0 = "SIGNAL0"
@@ -103,14 +100,154 @@ class ENCODER_TYPE:
     real_time = "realtime-position"
     stable = "stable-position"
 
+class COMPLETION_STRATEGY:
+    polling = "polling"
+    encoder = "encoder"
+
 class BRAKE_STATES:
     locked = "locked"
     unlocked = "unlocked"
     unknown = "unknown"
 
+class DATA_DURABILITY:
+    write_through = "write-through"    # Every write is sent before saveData returns
+    write_behind = "write-behind"      # Writes are sent in the background, flushInterval seconds after the first pending one
+    manual = "manual"                  # Writes are only sent by flushData (and when the program exits)
+
+# Commands that change the modal state shadowed by MachineMotion
+MODAL_GCODES = ("G90", "G91", "M92", "M204")
+
+# Path of the HTTP requests carrying G-code, followed by the URL-encoded command
+GCODE_PATH = "/gcode?gcode="
+
+# Commands sent on the priority connection, ahead of the regular traffic
+PRIORITY_GCODES = ("M410", "M112")
+
+# Largest difference between cached steps/mm and those read back with M503, which are rounded
+AXIS_CONFIGURATION_TOLERANCE = 0.01
+
+# Numeric levels of MQTT topics (device ids, pins), grouped together in latency statistics
+MQTT_TOPIC_INDEX = re.compile(r"/[0-9]+(?=/|$)")
+
+# Line number and checksum wrapped around numbered G-code lines, e.g. "N12 G0 X10*85"
+GCODE_LINE_NUMBER = re.compile(r"^\s*N[0-9]+\s+")
+GCODE_CHECKSUM = re.compile(r"\*[0-9]+\s*$")
+
+def getGCodeVerb(gCode) :
+    '''
+    Returns the command word of a G-code line (e.g. "G0"), without its line number and checksum.
+    '''
+    return GCODE_CHECKSUM.sub("", GCODE_LINE_NUMBER.sub("", gCode)).split(" ", 1)[0]
+
 HARDWARE_MIN_HOMING_FEEDRATE =251
 HARDWARE_MAX_HOMING_FEEDRATE= 15999
 
+class InvalidInput(Exception):
+    pass
+
+_validationTables = {}  # Maps constant classes to their valid values and error message
+
+def getValidationTable(argClass) :
+    '''
+    Returns the set of valid values of a constant class and the message listing them, computed on first use.
+    '''
+    table = _validationTables.get(argClass)
+    if table is None :
+        validParams = [i for i in argClass.__dict__.keys() if i[:1] != '_']
+        validValues = frozenset(argClass.__dict__[i] for i in validParams)
+        errorMessage = "Given parameter '%s' must be one of the following values:"
+        for param in validParams:
+            errorMessage = errorMessage + "\n" + argClass.__name__ + "." + param + " (" + str(argClass.__dict__[param]).replace("%", "%%") +")"
+        table = _validationTables[argClass] = (validValues, errorMessage)
+    return table
+
+def restrictInputValue(argName, argValue, argClass) :
+    '''
+    Raises InvalidInput if the value is not one of the values defined by the constant class.
+    '''
+    validValues, errorMessage = getValidationTable(argClass)
+
+    try:
+        if argValue in validValues:
+            return
+    except TypeError:
+        pass
+
+    raise InvalidInput("An invalid selection was made. " + errorMessage % (argName,))
+
+#
+# Class that builds the G-code commands sent by MachineMotion
+# @status
+#
+class GCodeBuilder :
+    '''
+    Builds G-code commands from templates computed once for each axis, instead of concatenating them on every call.
+    '''
+    AXIS_NAMES = { 1 : "X", 2 : "Y", 3 : "Z" }
+
+    AXIS_WORDS = dict((axis, name + "%s") for axis, name in AXIS_NAMES.items())
+    MOVE_TEMPLATES = dict((axis, "G0 " + name + "%s") for axis, name in AXIS_NAMES.items())
+    HOME_COMMANDS = dict((axis, "G28 " + name) for axis, name in AXIS_NAMES.items())
+    SET_POSITION_TEMPLATES = dict((axis, "G92 " + name + "%s") for axis, name in AXIS_NAMES.items())
+    STEPS_MM_TEMPLATES = dict((axis, "M92 " + name + "%s") for axis, name in AXIS_NAMES.items())
+    POSITION_MODE_COMMANDS = dict((axis, "V5 " + name + "1") for axis, name in AXIS_NAMES.items())
+    SPEED_MODE_COMMANDS = dict((axis, "V5 " + name + "2") for axis, name in AXIS_NAMES.items())
+    SPEED_TEMPLATES = dict((axis, "V4 S%s A%s " + name) for axis, name in AXIS_NAMES.items())
+
+    @staticmethod
+    def axisName(axis) :
+        return GCodeBuilder.AXIS_NAMES.get(axis, "Axis Error")
+
+    @staticmethod
+    def signedDistance(direction, distance) :
+        '''
+        Returns the distance as a string, negated for the negative direction.
+        '''
+        if direction == DIRECTION.NEGATIVE :
+            return ("-%s" % (distance,)).replace("--", "")
+        return "%s" % (distance,)
+
+    @staticmethod
+    def move(axis, value) :
+        return GCodeBuilder.MOVE_TEMPLATES[axis] % (value,)
+
+    @staticmethod
+    def combinedMove(axes, values) :
+        words = GCodeBuilder.AXIS_WORDS
+        return "G0 " + " ".join([words[axis] % (value,) for axis, value in zip(axes, values)])
+
+    @staticmethod
+    def home(axis) :
+        return GCodeBuilder.HOME_COMMANDS[axis]
+
+    @staticmethod
+    def setPosition(axis, position) :
+        return GCodeBuilder.SET_POSITION_TEMPLATES[axis] % (position,)
+
+    @staticmethod
+    def stepsPerMm(axis, steps_mm) :
+        return GCodeBuilder.STEPS_MM_TEMPLATES[axis] % (steps_mm,)
+
+    @staticmethod
+    def feedrate(speed_mm_per_min) :
+        return "G0 F%s" % (speed_mm_per_min,)
+
+    @staticmethod
+    def acceleration(accel_mm_per_sec_sqr) :
+        return "M204 T%s" % (accel_mm_per_sec_sqr,)
+
+    @staticmethod
+    def positionMode(axis) :
+        return GCodeBuilder.POSITION_MODE_COMMANDS[axis]
+
+    @staticmethod
+    def speedMode(axis) :
+        return GCodeBuilder.SPEED_MODE_COMMANDS[axis]
+
+    @staticmethod
+    def speed(axis, steps_per_sec, steps_per_sec_sqr) :
+        return GCodeBuilder.SPEED_TEMPLATES[axis] % (steps_per_sec, steps_per_sec_sqr)
+
 class MQTT :
     class PATH :
         ESTOP = "estop"
@@ -127,38 +264,1020 @@ class MQTT :
 
     TIMEOUT = 10.0 # Number of seconds while we wait for MQTT response
 
-def HTTPSend(host, path, data=None) :
-    # Note:
-    #   The intent of retrying upon failure here is primarily to reconnect to a dead or unreachable server.
-    #   The assumption is that an exception at this level reflects a server failure not to be expected by the client.
-    #   This behavior could be made optional.
-    while True :
-        lConn = None
-        try :
-            # Review: use keep-alive
+class ControllerUnavailable(Exception):
+    '''
+    Raised when the controller could not be reached within the retry deadline, or while the circuit breaker is open.
+    When a sequence of commands fails part way, replies holds the replies of the commands acknowledged before the failure.
+    '''
+    def __init__(self, message, replies=None):
+        super().__init__(message)
+        self.replies = [] if replies is None else replies
+
+class RetryPolicy:
+    '''
+    How long and how often a request to an unreachable controller is retried.
+
+    The delay between two attempts grows exponentially from initialDelay up to maxDelay, and is
+    shortened by a random fraction (up to jitter) so that several clients do not retry in lockstep.
+    A deadline of None retries without limit.
+    '''
+
+    def __init__(self, deadline=10.0, initialDelay=0.1, maxDelay=2.0, multiplier=2.0, jitter=0.5):
+        self.deadline = deadline
+        self.initialDelay = initialDelay
+        self.maxDelay = maxDelay
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    def getDelay(self, attempt):
+        '''
+        Returns the number of seconds to wait after the given failed attempt (0 for the first one).
+        '''
+        delay = min(self.maxDelay, self.initialDelay * self.multiplier ** attempt)
+        return delay * (1.0 - self.jitter * random.random())
+
+class CircuitBreaker:
+    '''
+    Fails requests fast while a controller is known to be down.
+
+    The breaker opens after failureThreshold consecutive failed attempts. While it is open,
+    requests are rejected immediately and a background thread tries to connect to the controller
+    every probeInterval seconds; the breaker closes again as soon as a probe succeeds.
+    '''
+    CLOSED = "closed"
+    OPEN = "open"
+
+    def __init__(self, host, failureThreshold=5, probeInterval=1.0, onRecovered=None):
+        self.host = host
+        self.failureThreshold = failureThreshold
+        self.probeInterval = probeInterval
+        self.onRecovered = onRecovered
+        self.state = CircuitBreaker.CLOSED
+        self.consecutiveFailures = 0
+        self.opened = 0         # Times the breaker opened
+        self.probes = 0         # Connection attempts made by the background probe
+        self.recoveries = 0     # Times a probe found the controller back
+
+        self.__lock = threading.Lock()
+
+    def allowRequest(self):
+        return self.state == CircuitBreaker.CLOSED
+
+    def recordSuccess(self):
+        with self.__lock:
+            self.consecutiveFailures = 0
+
+    def recordFailure(self):
+        with self.__lock:
+            self.consecutiveFailures += 1
+            if self.state == CircuitBreaker.OPEN or self.consecutiveFailures < self.failureThreshold:
+                return
+            self.state = CircuitBreaker.OPEN
+            self.opened += 1
+        logging.warning("Controller %s is unreachable: failing requests fast until it answers again" % self.host)
+        lThread = threading.Thread(target=self.__probe)
+        lThread.daemon = True
+        lThread.start()
+
+    def __probe(self):
+        while True:
+            time.sleep(self.probeInterval)
+            lConn = http.client.HTTPConnection(self.host, timeout=self.probeInterval)
+            try:
+                lConn.connect()
+            except Exception:
+                continue
+            finally:
+                lConn.close()
+                with self.__lock:
+                    self.probes += 1
+            break
+
+        with self.__lock:
+            self.state = CircuitBreaker.CLOSED
+            self.consecutiveFailures = 0
+            self.recoveries += 1
+        logging.info("Controller %s is reachable again" % self.host)
+        if self.onRecovered is not None:
+            self.onRecovered()
+
+    def getStats(self):
+        with self.__lock:
+            return {
+                "state": self.state,
+                "consecutiveFailures": self.consecutiveFailures,
+                "opened": self.opened,
+                "probes": self.probes,
+                "recoveries": self.recoveries
+            }
+
+class HTTPConnectionPool:
+    '''
+    Thread-safe pool of keep-alive HTTP connections to a single MachineMotion host.
+
+    Each thread reuses its own persistent connection, so concurrent callers never interleave
+    requests on the same socket. A kept-alive socket that was closed by the controller is
+    detected before use and replaced immediately, without waiting for the retry delay. Failures
+    to send a request are retried according to the retryPolicy, and the circuitBreaker fails
+    requests fast while the controller is down. A request that was sent but not answered is never
+    sent again, since G-code commands are not idempotent: ControllerUnavailable is raised instead.
+    '''
+
+    def __init__(self, host, timeout=None):
+        self.host = host
+        self.timeout = timeout
+        self.retryPolicy = RetryPolicy()
+        self.circuitBreaker = CircuitBreaker(host, onRecovered=self.__notifyReconnect)
+        self.hits = 0           # Requests served on an already open connection
+        self.misses = 0         # Requests that had to open a new connection
+        self.reconnects = 0     # Kept-alive connections found dead and replaced
+        self.successes = 0      # Requests that got a reply
+        self.retries = 0        # Attempts repeated after a failure
+        self.timeouts = 0       # Requests abandoned at their deadline
+        self.rejected = 0       # Requests failed fast by the open circuit breaker
+        self.unanswered = 0     # Requests sent without getting a reply, never resent
+        self.replyTimeout = None    # Seconds to wait for a reply once the request is sent. None waits for as long as the
+                                    # command runs (e.g. homing, long dwells, moves queued behind a full planner)
+
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__connections = {}  # Maps thread identifiers to their open connection
+        self.__reconnectListeners = []
+
+    def __newConnection(self):
+        lConn = http.client.HTTPConnection(self.host, timeout=self.timeout)
+
+        with self.__lock:
+            # Forget the connections of threads that have exited
+            aliveIdents = set(thread.ident for thread in threading.enumerate())
+            for ident in list(self.__connections.keys()):
+                if ident not in aliveIdents:
+                    self.__connections.pop(ident).close()
+            self.__connections[threading.current_thread().ident] = lConn
+
+        return lConn
+
+    def __isStale(self, lConn):
+        # An idle keep-alive socket has nothing to read: if it is readable, the controller closed it
+        if lConn.sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([lConn.sock], [], [], 0)
+        except Exception:
+            return True
+        return len(readable) > 0
+
+    def __acquire(self):
+        lConn = getattr(self.__local, 'connection', None)
+        if lConn is not None and self.__isStale(lConn):
+            self.__discard(lConn)
+            self.__count("reconnects")
+            self.__notifyReconnect()
+            lConn = None
+        if lConn is not None:
+            with self.__lock:
+                self.hits += 1
+            return lConn, True
+
+        lConn = self.__newConnection()
+        self.__local.connection = lConn
+        with self.__lock:
+            self.misses += 1
+        return lConn, False
+
+    def __discard(self, lConn):
+        self.__local.connection = None
+        with self.__lock:
+            if self.__connections.get(threading.current_thread().ident) is lConn:
+                del self.__connections[threading.current_thread().ident]
+        lConn.close()
+
+    def request(self, path, data=None, deadline=None):
+        '''
+        Sends a GET request (or a POST request if data is provided) and returns the raw response body.
+        Raises ControllerUnavailable if the request could not be sent within the deadline (in seconds, the
+        retry policy deadline by default), or right away while the circuit breaker is open. Once sent, the
+        reply is awaited for replyTimeout seconds, without limit by default.
+        '''
+        # Note:
+        #   The intent of retrying upon failure here is primarily to reconnect to a dead or unreachable server.
+        #   The assumption is that an exception at this level reflects a server failure not to be expected by the client.
+        if not self.circuitBreaker.allowRequest() :
+            self.__count("rejected")
+            raise ControllerUnavailable("Controller %s is unreachable" % self.host)
+
+        deadline = self.retryPolicy.deadline if deadline is None else deadline
+        startTime = time.time()
+        attempt = 0
+        wasUnreachable = False
+        while True :
+            # Connecting and sending must not block past the deadline
+            timeout = self.timeout
+            if deadline is not None :
+                timeout = startTime + deadline - time.time()
+                if timeout <= 0 :
+                    self.__count("timeouts")
+                    raise ControllerUnavailable("No reply from controller %s to %s within %.1f seconds" % (self.host, path, deadline))
+            lConn, isReused = self.__acquire()
+            lConn.timeout = timeout
+            if lConn.sock is not None :
+                lConn.sock.settimeout(timeout)
+            isSent = False
+            try :
+                if None == data:
+                    lConn.request("GET", path)
+                else:
+                    lConn.request("POST", path, data, {"Content-type": "application/octet-stream"})
+                isSent = True
+                lConn.sock.settimeout(self.replyTimeout)
+                lResponse = lConn.getresponse()
+                lBody = lResponse.read()
+                if lResponse.will_close :
+                    self.__discard(lConn)
+                self.circuitBreaker.recordSuccess()
+                self.__count("successes")
+                if wasUnreachable :
+                    self.__notifyReconnect()
+                return lBody
+            except Exception as e :
+                self.__discard(lConn)
+                if isSent :
+                    # The controller may have received and run the command: resending it could run it twice
+                    self.circuitBreaker.recordFailure()
+                    self.__count("unanswered")
+                    raise ControllerUnavailable("No reply from controller %s to %s, which may have run: %s" % (self.host, path, e))
+                if isReused :
+                    # The kept-alive socket went stale (e.g. idle timeout on the controller): reconnect right away.
+                    # A controller reboot looks the same, so listeners drop what they cached about it
+                    self.__count("reconnects")
+                    self.__notifyReconnect()
+                    continue
+                if not wasUnreachable :
+                    logging.warning("Could not GET %s: %s" % (path, traceback.format_exc()))
+                wasUnreachable = True
+                self.circuitBreaker.recordFailure()
+                if not self.circuitBreaker.allowRequest() :
+                    self.__count("rejected")
+                    raise ControllerUnavailable("Controller %s is unreachable" % self.host)
+
+                delay = self.retryPolicy.getDelay(attempt)
+                if deadline is not None :
+                    remaining = startTime + deadline - time.time()
+                    if remaining <= 0 :
+                        self.__count("timeouts")
+                        raise ControllerUnavailable("No reply from controller %s to %s within %.1f seconds" % (self.host, path, deadline))
+                    delay = min(delay, remaining)
+                self.__count("retries")
+                attempt += 1
+                time.sleep(delay)
+
+    def __count(self, counter):
+        with self.__lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def addReconnectListener(self, callback):
+        '''
+        Registers a function called without arguments once the host answers again after being unreachable.
+        The controller may have restarted in the meantime, so listeners should drop any state they cached about it.
+        Bound methods are held weakly, so that the pool, which is shared by all clients of the host, does not keep
+        their objects alive.
+        '''
+        listener = self.__listenerReference(callback)
+        with self.__lock:
+            if not listener in self.__reconnectListeners:
+                self.__reconnectListeners.append(listener)
 
-            # If python 2
-            if sys.version_info[0] < 3 :
-                lConn = httplib.HTTPConnection(host)
-            # Else python 3
-            else :
-                lConn = http.client.HTTPConnection(host)
+    def removeReconnectListener(self, callback):
+        listener = self.__listenerReference(callback)
+        with self.__lock:
+            if listener in self.__reconnectListeners:
+                self.__reconnectListeners.remove(listener)
 
-            if None == data:
-                lConn.request("GET", path)
-            else:
-                lConn.request("POST", path, data, {"Content-type": "application/octet-stream"});
-            lResponse = lConn.getresponse()
-            lResponse = lResponse.read()
+    @staticmethod
+    def __listenerReference(callback):
+        if hasattr(callback, "__self__") and hasattr(callback, "__func__"):
+            return weakref.WeakMethod(callback)
+        return callback
+
+    def __notifyReconnect(self):
+        with self.__lock:
+            listeners = []
+            for listener in list(self.__reconnectListeners):
+                callback = listener() if isinstance(listener, weakref.WeakMethod) else listener
+                if callback is None:
+                    # The object of this bound method was garbage collected
+                    self.__reconnectListeners.remove(listener)
+                else:
+                    listeners.append(callback)
+        for callback in listeners:
+            callback()
+
+    def getStats(self):
+        '''
+        Returns the pool counters, the number of open connections and the state of the circuit breaker.
+        '''
+        with self.__lock:
+            return {
+                "host": self.host,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reconnects": self.reconnects,
+                "successes": self.successes,
+                "retries": self.retries,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+                "unanswered": self.unanswered,
+                "openConnections": len(self.__connections),
+                "circuitBreaker": self.circuitBreaker.getStats()
+            }
+
+    def close(self):
+        '''
+        Closes every connection held by the pool. Threads transparently reconnect on their next request.
+        '''
+        with self.__lock:
+            connections = list(self.__connections.values())
+            self.__connections.clear()
+        for lConn in connections:
             lConn.close()
-            return str(lResponse) # Casting as a string is necessary for python3
-        except Exception :
-            logging.warning("Could not GET %s: %s" % (path, traceback.format_exc()))
-            if lConn :
-                lConn.close()
-                lConn = None
-            time.sleep(1)
-    return ""
+        self.__local = threading.local()
+
+class PriorityHTTPConnection:
+    '''
+    Dedicated HTTP connection to a MachineMotion host for commands that must not wait, such as stops.
+
+    The connection is opened ahead of time and reopened in the background after every use, so a
+    request never pays for the TCP handshake, and it has its own lock, so it never queues behind
+    the regular traffic of HTTPConnectionPool. A request gives up after deadline seconds, so that
+    stopping a MachineApp does not hang while the controller is down.
+    '''
+    RETRY_DELAY_SECONDS = 0.05
+    HISTORY_LENGTH = 100
+    DEFAULT_DEADLINE_SECONDS = 2.0
+
+    def __init__(self, host, timeout=DEFAULT_DEADLINE_SECONDS):
+        self.host = host
+        self.timeout = timeout                                              # Default deadline of a request, in seconds
+        self.timeouts = 0                                                   # Requests abandoned at their deadline
+        self.requests = 0
+        self.reconnects = 0                                                 # Stale connections replaced at request time
+        self.latencies = collections.deque(maxlen=PriorityHTTPConnection.HISTORY_LENGTH)   # Seconds from request to reply
+
+        self.__lock = threading.Lock()
+        self.__connection = None
+        self.__openInBackground()
+
+    def __open(self, timeout):
+        lConn = http.client.HTTPConnection(self.host, timeout=timeout)
+        lConn.connect()
+        return lConn
+
+    def __openInBackground(self):
+        def openConnection():
+            try:
+                lConn = self.__open(self.timeout)
+            except Exception:
+                return  # Opened again at request time
+            with self.__lock:
+                if self.__connection is None:
+                    self.__connection = lConn
+                    return
+            lConn.close()
+        lThread = threading.Thread(target=openConnection)
+        lThread.daemon = True
+        lThread.start()
+
+    def request(self, path, deadline=None):
+        '''
+        Sends a GET request on the priority connection and returns the raw response body.
+        Raises ControllerUnavailable if no reply is received within the deadline (in seconds, timeout by default).
+        '''
+        startTime = time.time()
+        deadline = self.timeout if deadline is None else deadline
+        endTime = startTime + deadline
+        wasUnreachable = False
+        if not self.__lock.acquire(timeout=deadline):
+            self.timeouts += 1
+            raise ControllerUnavailable("Priority connection to controller %s busy for %.1f seconds" % (self.host, deadline))
+        try:
+            while True:
+                remaining = endTime - time.time()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise ControllerUnavailable("No reply from controller %s to %s within %.1f seconds" % (self.host, path, deadline))
+                lConn, isReused = self.__connection, self.__connection is not None
+                try:
+                    if not isReused:
+                        lConn = self.__open(remaining)
+                    else:
+                        lConn.sock.settimeout(remaining)
+                    lConn.request("GET", path)
+                    lResponse = lConn.getresponse()
+                    lBody = lResponse.read()
+                    self.__connection = None if lResponse.will_close else lConn
+                    break
+                except Exception:
+                    self.__connection = None
+                    if lConn is not None:
+                        lConn.close()
+                    if isReused:
+                        self.reconnects += 1
+                        continue
+                    if not wasUnreachable:
+                        logging.warning("Could not GET %s on the priority connection: %s" % (path, traceback.format_exc()))
+                    wasUnreachable = True
+                    time.sleep(max(0, min(PriorityHTTPConnection.RETRY_DELAY_SECONDS, endTime - time.time())))
+            self.requests += 1
+            self.latencies.append(time.time() - startTime)
+        finally:
+            self.__lock.release()
+
+        if self.__connection is None:
+            self.__openInBackground()
+        return lBody
+
+    def getStats(self):
+        return {
+            "host": self.host,
+            "requests": self.requests,
+            "reconnects": self.reconnects,
+            "timeouts": self.timeouts,
+            "isOpen": self.__connection is not None
+        }
+
+    def close(self):
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+
+_connectionPools = {}
+_connectionPoolsLock = threading.Lock()
+
+def getConnectionPool(host) :
+    '''
+    Returns the shared connection pool for the given "ip:port" host, creating it on first use.
+    '''
+    with _connectionPoolsLock:
+        if not host in _connectionPools:
+            _connectionPools[host] = HTTPConnectionPool(host)
+        return _connectionPools[host]
+
+def HTTPSend(host, path, data=None, deadline=None) :
+    return str(HTTPRequest(host, path, data, deadline)) # Casting as a string is necessary for python3
+
+def HTTPRequest(host, path, data=None, deadline=None) :
+    '''
+    Sends a request on the shared connection pool of the host and returns the raw response body, as bytes.
+    '''
+    if not latencyRecorder.enabled :
+        return getConnectionPool(host).request(path, data, deadline)
+
+    startTime = time.time()
+    try :
+        return getConnectionPool(host).request(path, data, deadline)
+    finally :
+        latencyRecorder.record("HTTP " + path.split("?", 1)[0], time.time() - startTime)
+
+class GCodeTransport:
+    '''
+    Carries G-code commands to a controller and brings their replies back.
+
+    Transports implement send; sendMany sends the commands one after the other unless the transport
+    can do better. Replies are the raw text (or bytes) returned by the controller.
+    '''
+    name = "base"
+    usesPriorityConnection = False      # Stop commands bypass the transport on the priority HTTP connection
+
+    def send(self, gCode, deadline=None):
+        raise NotImplementedError
+
+    def sendMany(self, gCodes, deadline=None):
+        return [self.send(gCode, deadline) for gCode in gCodes]
+
+    def getStats(self):
+        return {}
+
+    def close(self):
+        pass
+
+class HTTPTransport(GCodeTransport):
+    '''
+    One HTTP GET request per command on the shared HTTPConnectionPool of the host, waiting for each
+    reply before sending the next command.
+    '''
+    name = "http"
+    usesPriorityConnection = True
+
+    def __init__(self, host):
+        self.host = host
+        self.connectionPool = getConnectionPool(host)
+
+    def send(self, gCode, deadline=None):
+        return self.connectionPool.request(GCODE_PATH + urllib.parse.quote_plus(gCode), None, deadline)
+
+    def getStats(self):
+        return self.connectionPool.getStats()
+
+class PipelinedHTTPTransport(GCodeTransport):
+    '''
+    HTTP/1.1 transport that writes the requests of several commands before reading their replies,
+    so that a sequence of commands costs about one round trip instead of one per command.
+
+    Requests are sent on a single keep-alive connection, at most maxInFlight at a time, and the
+    replies are read back in order. Requests following a reply that announces "Connection: close"
+    were not processed, and are sent again on a new connection. Any other failure once the requests
+    are written raises ControllerUnavailable, with the replies of the acknowledged commands, without
+    resending commands that may already have been executed.
+
+    timeout (or the deadline of a call) bounds connecting and writing the requests. The replies are
+    awaited for replyTimeout seconds, without limit by default, since the controller holds the reply
+    of a move until its planner has room for it.
+    '''
+    name = "pipelined-http"
+    usesPriorityConnection = True
+
+    def __init__(self, host, timeout=10.0, maxInFlight=32, replyTimeout=None):
+        self.host = host
+        self.timeout = timeout
+        self.maxInFlight = maxInFlight
+        self.replyTimeout = replyTimeout
+        self.requests = 0       # Commands sent
+        self.batches = 0        # Writes of one or more pipelined requests
+        self.reconnects = 0     # Connections opened after the first one
+
+        hostname, _, port = host.partition(":")
+        self.__address = (hostname, int(port) if port else 80)
+        self.__lock = threading.Lock()
+        self.__socket = None
+        self.__file = None
+
+    def send(self, gCode, deadline=None):
+        return self.sendMany([gCode], deadline)[0]
+
+    def sendMany(self, gCodes, deadline=None):
+        replies = []
+        with self.__lock:
+            while len(replies) < len(gCodes):
+                batch = gCodes[len(replies) : len(replies) + self.maxInFlight]
+                try:
+                    replies.extend(self.__exchange(batch, deadline))
+                except ControllerUnavailable as error:
+                    replies.extend(error.replies)
+                    raise ControllerUnavailable("%s (%d of %d commands acknowledged)" % (error, len(replies), len(gCodes)), replies)
+        return replies
+
+    # Sends a batch of requests and reads as many replies as the connection delivers, at least one
+    def __exchange(self, batch, deadline):
+        isReused = self.__socket is not None
+        try:
+            self.__connect(deadline)
+            request = "".join("GET %s%s HTTP/1.1\r\nHost: %s\r\n\r\n" % (GCODE_PATH, urllib.parse.quote_plus(gCode), self.host) for gCode in batch)
+            self.__socket.sendall(request.encode("ascii"))
+            self.batches += 1
+            self.requests += len(batch)
+        except (IOError, OSError) as error:
+            self.__disconnect()
+            if isReused:
+                # The kept-alive socket went stale before the requests were written: reconnect right away
+                return self.__exchange(batch, deadline)
+            raise ControllerUnavailable("Could not send to controller %s: %s" % (self.host, error))
+
+        replies = []
+        try:
+            self.__socket.settimeout(self.replyTimeout)
+            for _ in batch:
+                body, willClose = self.__readResponse()
+                replies.append(body)
+                if willClose:
+                    break
+        except (IOError, OSError, ValueError) as error:
+            # The unanswered requests may have been received and executed: they must not be sent again
+            self.__disconnect()
+            raise ControllerUnavailable("No reply from controller %s: %s" % (self.host, error), replies)
+
+        if len(replies) < len(batch):
+            # The controller announced it closes the connection: the remaining requests were not processed
+            self.__disconnect()
+        return replies
+
+    def __connect(self, deadline):
+        timeout = self.timeout if deadline is None else deadline
+        if self.__socket is not None and select.select([self.__socket], [], [], 0)[0]:
+            # An idle keep-alive socket has nothing to read: the controller closed it
+            self.__disconnect()
+        if self.__socket is None:
+            if self.batches > 0:
+                self.reconnects += 1
+            self.__socket = socket.create_connection(self.__address, timeout)
+            self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.__file = self.__socket.makefile("rb")
+        self.__socket.settimeout(timeout)
+
+    def __disconnect(self):
+        if self.__socket is not None:
+            try:
+                self.__file.close()
+                self.__socket.close()
+            except (IOError, OSError):
+                pass
+        self.__socket = None
+        self.__file = None
+
+    # Reads one HTTP response and returns its body, and whether the controller closes the connection after it
+    def __readResponse(self):
+        statusLine = self.__file.readline()
+        if not statusLine:
+            raise IOError("Connection closed by the controller")
+        version = statusLine.split(None, 1)[0]
+
+        headers = {}
+        while True:
+            line = self.__file.readline()
+            if not line:
+                raise IOError("Connection closed by the controller")
+            line = line.strip()
+            if not line:
+                break
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+        connection = headers.get(b"connection", b"")
+        willClose = connection == b"close" or (version == b"HTTP/1.0" and connection != b"keep-alive")
+
+        if headers.get(b"transfer-encoding") == b"chunked":
+            chunks = []
+            while True:
+                size = int(self.__file.readline().split(b";", 1)[0], 16)
+                if size == 0:
+                    while self.__file.readline().strip():
+                        pass
+                    break
+                chunks.append(self.__readExactly(size))
+                self.__file.readline()
+            return b"".join(chunks), willClose
+
+        if b"content-length" in headers:
+            return self.__readExactly(int(headers[b"content-length"])), willClose
+
+        # The body ends with the connection
+        return self.__file.read(), True
+
+    def __readExactly(self, size):
+        data = self.__file.read(size)
+        if len(data) < size:
+            raise IOError("Connection closed by the controller")
+        return data
+
+    def getStats(self):
+        with self.__lock:
+            return {
+                "host": self.host,
+                "requests": self.requests,
+                "batches": self.batches,
+                "reconnects": self.reconnects,
+                "isConnected": self.__socket is not None
+            }
+
+    def close(self):
+        with self.__lock:
+            self.__disconnect()
+
+class LoopbackTransport(GCodeTransport):
+    '''
+    In-process transport answering commands without a controller, for tests and benchmarks.
+
+    Replies are looked up by verb in replies, as a text or as a function of the command returning
+    the text. Other commands are acknowledged with "echo:<command>" and "ok". Every command is
+    appended to log.
+    '''
+    name = "loopback"
+
+    DEFAULT_REPLIES = {
+        "M114" : "echo:M114\nX:0.00 Y:0.00 Z:0.00 E:0.00 Count X:0 Y:0 Z:0\nok\n",
+        "M119" : "echo:M119\nReporting endstop status\nx_min: open\nx_max: open\ny_min: open\ny_max: open\nz_min: open\nz_max: open\nok\n",
+        "V0" : "echo:V0\nCOMPLETED\nok\n",
+    }
+
+    def __init__(self, replies=None):
+        self.replies = dict(LoopbackTransport.DEFAULT_REPLIES)
+        self.replies.update(replies or {})
+        self.log = []
+
+    def send(self, gCode, deadline=None):
+        self.log.append(gCode)
+        reply = self.replies.get(getGCodeVerb(gCode))
+        if reply is None:
+            return "echo:%s\nok\n" % gCode
+        return reply(gCode) if callable(reply) else reply
+
+    def getStats(self):
+        return { "requests" : len(self.log) }
+
+#
+# Reply of the controller to a G-code command
+# @status
+#
+class GCodeReply(str) :
+    '''
+    Reply of the controller to a G-code command, decoded once from the raw HTTP response body.
+
+    The reply is the decoded text itself, so it can still be searched and printed like a string. Typed
+    accessors parse the replies of M114, M119 and V0 with a single precompiled pattern each.
+    '''
+    FIELD_PATTERN = re.compile(r"([A-Za-z_]+):[ \t]*([^\s]*)")
+    POSITION_PATTERN = re.compile(r"X:[ \t]*([^\s]+)[ \t]+Y:[ \t]*([^\s]+)[ \t]+Z:[ \t]*([^\s]+)")
+    END_STOP_PATTERN = re.compile(r"([xyz]_m(?:in|ax)):[ \t]*([^\s]*)")
+    END_STOP_FIELDS = ("x_min", "x_max", "y_min", "y_max", "z_min", "z_max")
+    STEPS_MM_PATTERN = re.compile(r"M92[ \t]+X[ \t]*([^\s]+)[ \t]+Y[ \t]*([^\s]+)[ \t]+Z[ \t]*([^\s]+)")
+
+    __slots__ = ()      # Replies are built for every command: no instance dictionary to allocate
+
+    def __new__(cls, body) :
+        if isinstance(body, bytes) :
+            body = body.decode("utf-8", "replace")
+        return str.__new__(cls, body)
+
+    @property
+    def isOk(self) :
+        '''
+        True if the controller echoed and acknowledged the command.
+        '''
+        return "echo" in self and "ok" in self
+
+    @property
+    def error(self) :
+        '''
+        The first error line reported by the controller, or None.
+        '''
+        start = self.find("Error:")
+        if start == -1 :
+            return None
+        end = self.find("\n", start)
+        return self[start:] if end == -1 else self[start:end]
+
+    def getFields(self) :
+        '''
+        Returns a dictionary mapping each "key:value" field of the reply to its first value.
+        '''
+        fields = {}
+        for key, value in GCodeReply.FIELD_PATTERN.findall(self) :
+            fields.setdefault(key, value)
+        return fields
+
+    def getPositions(self) :
+        '''
+        Returns the position of each axis from the reply to M114, as { 1 : x, 2 : y, 3 : z }.
+        '''
+        match = GCodeReply.POSITION_PATTERN.search(self)
+        try :
+            return {1 : float(match.group(1)), 2 : float(match.group(2)), 3 : float(match.group(3))}
+        except (AttributeError, ValueError) :
+            raise Exception('Error in gCode (reply: %s)' % self)
+
+    def getEndStopStates(self) :
+        '''
+        Returns the state of each end stop from the reply to M119, as { "x_min" : "TRIGGERED", ... }.
+        '''
+        states = dict(GCodeReply.END_STOP_PATTERN.findall(self))
+        if len(states) != len(GCodeReply.END_STOP_FIELDS) :
+            raise Exception('Error in gCode')
+        return states
+
+    def isMotionCompleted(self) :
+        '''
+        True if the reply to V0 reports that motion is completed.
+        '''
+        return "COMPLETED" in self
+
+    def getStepsPerMm(self) :
+        '''
+        Returns the steps/mm of each axis from the M92 line of the reply to M503, as { 1 : x, 2 : y, 3 : z }.
+        '''
+        match = GCodeReply.STEPS_MM_PATTERN.search(self)
+        try :
+            return {1 : float(match.group(1)), 2 : float(match.group(2)), 3 : float(match.group(3))}
+        except (AttributeError, ValueError) :
+            raise Exception('Error in gCode (reply: %s)' % self)
+
+class AxisConfigurationCache:
+    '''
+    Local file remembering the steps/mm that were last pushed to each controller.
+
+    Each entry carries a checksum of its values, so that a truncated or hand-edited entry is ignored
+    instead of being trusted. The file is rewritten atomically after every change.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, host):
+        '''
+        Returns the steps/mm last pushed to the controller, as { axis : value sent with M92 }, or None if unknown.
+        '''
+        try :
+            with open(self.path, "r") as f :
+                entry = json.load(f)[host]
+            stepsMm = dict((int(axis), value) for axis, value in entry["steps_mm"].items())
+        except (IOError, ValueError, KeyError, TypeError, AttributeError) :
+            return None
+
+        if entry.get("checksum") != AxisConfigurationCache.checksum(stepsMm) :
+            logging.warning("Ignoring the cached axis configuration of %s: checksum mismatch" % host)
+            return None
+        return stepsMm
+
+    def store(self, host, stepsMm):
+        '''
+        Records the steps/mm last pushed to the controller.
+        '''
+        try :
+            with open(self.path, "r") as f :
+                entries = json.load(f)
+            if not isinstance(entries, dict) :
+                entries = {}
+        except (IOError, ValueError) :
+            entries = {}
+
+        entries[host] = { "steps_mm" : dict((str(axis), value) for axis, value in stepsMm.items()), "checksum" : AxisConfigurationCache.checksum(stepsMm) }
+
+        temporaryPath = self.path + ".tmp"
+        try :
+            with open(temporaryPath, "w") as f :
+                json.dump(entries, f, indent=4, sort_keys=True)
+            os.replace(temporaryPath, self.path)
+        except (IOError, OSError) :
+            logging.warning("Could not save the axis configuration cache to %s: %s" % (self.path, traceback.format_exc()))
+
+    @staticmethod
+    def checksum(stepsMm):
+        canonical = json.dumps(dict((str(axis), value) for axis, value in stepsMm.items()), sort_keys=True)
+        return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+_dataCaches = weakref.WeakSet()     # Caches flushed on a normal exit, held weakly so that replaced caches can be collected
+
+def _flushDataCaches() :
+    for cache in list(_dataCaches) :
+        cache.flush()
+
+atexit.register(_flushDataCaches)
+
+class DataCache:
+    '''
+    Key/value cache in front of the saveData and getData storage of a controller.
+
+    Reads are served from memory once a key has been read or written. Writes update the memory
+    right away and are sent according to the durability policy; successive writes to a key that
+    is not sent yet are coalesced, so only its last value is sent. Writes that fail stay pending
+    and are sent again on the next flush, unless the key was written again in the meantime.
+    '''
+
+    def __init__(self, store, fetch, durability=DATA_DURABILITY.write_behind, flushInterval=1.0):
+        self.durability = durability
+        self.flushInterval = flushInterval      # Seconds between the first pending write and its flush, in write-behind mode
+        self.reads = 0
+        self.hits = 0
+        self.writes = 0
+        self.coalesced = 0                      # Writes replaced by a later write to the same key before being sent
+        self.sent = 0
+        self.failures = 0
+
+        self.__store = store                    # Function(key, text) sending a value to the controller
+        self.__fetch = fetch                    # Function(key) -> text reading a value from the controller
+        self.__values = {}
+        self.__pending = collections.OrderedDict()
+        self.__pendingSince = None
+        self.__flushLock = threading.Lock()     # Serializes flushes, so that the writes to a key are sent in order
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__isClosed = False
+
+        _dataCaches.add(self)
+
+    def get(self, key):
+        '''
+        Returns the value of the key, from memory if it is known, otherwise from the controller.
+        '''
+        with self.__condition:
+            self.reads += 1
+            if key in self.__values:
+                self.hits += 1
+                return self.__values[key]
+
+        value = self.__fetch(key)
+
+        with self.__condition:
+            # A write made while fetching is more recent than the fetched value
+            return self.__values.setdefault(key, value)
+
+    def set(self, key, value):
+        '''
+        Updates the value of the key, and sends it according to the durability policy.
+        '''
+        with self.__condition:
+            self.writes += 1
+            self.__values[key] = value
+            if key in self.__pending:
+                self.coalesced += 1
+            self.__pending[key] = value
+            if self.__pendingSince is None:
+                self.__pendingSince = time.time()
+
+            if self.durability == DATA_DURABILITY.write_behind:
+                self.__startFlusher()
+                self.__condition.notify_all()
+
+        if self.durability == DATA_DURABILITY.write_through:
+            self.flush(raiseOnError=True)
+
+    def invalidate(self, key=None):
+        '''
+        Forgets the value of one key, or of every key, so that it is read from the controller again.
+        Pending writes are kept.
+        '''
+        with self.__condition:
+            if key is None:
+                self.__values = dict(self.__pending)
+            elif not key in self.__pending:
+                self.__values.pop(key, None)
+
+    def getPendingCount(self):
+        with self.__condition:
+            return len(self.__pending)
+
+    def close(self):
+        '''
+        Flushes the pending writes and stops the background flusher. The cache is no longer flushed on exit.
+        '''
+        with self.__condition:
+            self.__isClosed = True
+            self.__condition.notify_all()
+        _dataCaches.discard(self)
+        return self.flush()
+
+    def flush(self, raiseOnError=False):
+        '''
+        Sends every pending write to the controller.
+
+        params:
+            raiseOnError: bool
+                Raise the error of the first failed write instead of logging it
+
+        returns:
+            bool
+                True if every pending write was sent
+        '''
+        with self.__flushLock:
+            with self.__condition:
+                pending = self.__pending
+                self.__pending = collections.OrderedDict()
+                self.__pendingSince = None
+
+            for index, (key, value) in enumerate(pending.items()):
+                try:
+                    self.__store(key, value)
+                    self.sent += 1
+                except Exception as error:
+                    self.failures += 1
+                    self.__requeue(list(pending.items())[index:])
+                    if raiseOnError:
+                        raise
+                    logging.warning("Could not save data %s, it will be sent again on the next flush: %s" % (key, error))
+                    return False
+
+        return True
+
+    def __requeue(self, items):
+        with self.__condition:
+            for key, value in reversed(items):
+                if not key in self.__pending:
+                    self.__pending[key] = value
+                    self.__pending.move_to_end(key, last=False)
+            if len(self.__pending) > 0 and self.__pendingSince is None:
+                self.__pendingSince = time.time()
+
+    def __startFlusher(self):
+        if self.__thread is None:
+            self.__thread = threading.Thread(name='DataCacheFlusher', target=self.__run)
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__isClosed and (self.__pendingSince is None or self.durability != DATA_DURABILITY.write_behind):
+                    self.__condition.wait()
+                if self.__isClosed:
+                    return
+                delay = self.__pendingSince + self.flushInterval - time.time()
+
+            if delay > 0:
+                time.sleep(delay)
+                continue
+
+            if not self.flush():
+                # Leave the controller alone for a full interval before retrying
+                time.sleep(self.flushInterval)
 
 #
 # Class that handles all gCode related communications
@@ -171,7 +1290,7 @@ class GCode:
     # @param socket --- Description: The GCode class requires a socket object to communicate with the controller. The socket object is passed at contruction time.
     # @status
     #
-    def __init__(self, ip):
+    def __init__(self, ip, transport=None):
         # Passing in the socket instance at construction
         self.myIp = ip
         self.libPort = ":8000"
@@ -180,6 +1299,9 @@ class GCode:
         self.lastPacket = {"data": "null", "lineNumber": "null"}
         self.gCodeErrors = {"checksum": "Error:checksum mismatch, Last Line: ", "lineNumber": "Error:Line Number is not Last Line Number+1, Last Line: "}
         self.userCallback = None
+        self.myConnectionPool = getConnectionPool(self.myIp + self.libPort)
+        self.myPriorityConnection = PriorityHTTPConnection(self.myIp + self.libPort)
+        self.myTransport = HTTPTransport(self.myIp + self.libPort) if transport is None else transport
         self.steps_per_mm = {
             1 : None,
             2 : None,
@@ -195,32 +1317,33 @@ class GCode:
     # @status
     #
     def __getTrueAxis__(self, axis):
-        if axis == 1: return "X"
-        elif axis == 2: return "Y"
-        elif axis == 3: return "Z"
-        else: return "Axis Error"
+        return GCodeBuilder.axisName(axis)
 
     #
     # Function that packages the data in a JSON object and sends to the MachineMotion server over a socket connection.
     # PRIVATE
     #
-    def __send__(self, cmd, data=None) :
+    def __send__(self, cmd, data=None, deadline=None) :
 
-        return HTTPSend(self.myIp + self.libPort, cmd, data)
+        return GCodeReply(self.myConnectionPool.request(cmd, data, deadline))
 
     #
     # Function to send a raw G-Code ASCII command
     # @param gCode --- Description: gCode is string representing the G-Code command to send to the controller. Type: string.
     # @status
     #
-    def __emit__(self, gCode) :
+    def __emit__(self, gCode, deadline=None) :
+
+        verb = getGCodeVerb(gCode)
+        startTime = time.time() if latencyRecorder.enabled else None
 
-        # If python 2
-        if sys.version_info[0] < 3 :
-            rep = self.__send__("/gcode?%s" % urllib.urlencode({"gcode": "%s" % gCode}))
-        # Else python 3
+        if verb in PRIORITY_GCODES and self.myTransport.usesPriorityConnection :
+            rep = GCodeReply(self.myPriorityConnection.request(GCODE_PATH + urllib.parse.quote_plus(gCode), deadline))
         else :
-            rep = self.__send__("/gcode?%s" % urllib.parse.urlencode({"gcode": "%s" % gCode}))
+            rep = GCodeReply(self.myTransport.send(gCode, deadline))
+
+        if startTime is not None :
+            latencyRecorder.record(verb, time.time() - startTime)
 
         # Call user callback only if relevant
         if self.__userCallback__ is None : pass
@@ -229,9 +1352,76 @@ class GCode:
 
         return rep
 
+    #
+    # Function to send several raw G-Code ASCII commands in one go, pipelined if the transport supports it
+    # @param gCodes --- Description: The G-Code commands, in order. Type: list of strings.
+    # @param transport --- Description: The transport to send them with, myTransport by default. Type: GCodeTransport.
+    # @return --- The reply to each command, in the same order
+    # @status
+    #
+    def __emitMany__(self, gCodes, deadline=None, transport=None) :
+
+        startTime = time.time() if latencyRecorder.enabled else None
+        transport = self.myTransport if transport is None else transport
+
+        reps = [GCodeReply(reply) for reply in transport.sendMany(list(gCodes), deadline)]
+
+        if startTime is not None and len(reps) > 0 :
+            # Pipelined commands complete together, share their duration
+            duration = (time.time() - startTime) / len(reps)
+            for gCode in gCodes :
+                latencyRecorder.record(getGCodeVerb(gCode), duration)
+
+        if self.__userCallback__ is None : pass
+        else :
+            for rep in reps :
+                self.__userCallback__(rep)
+
+        return reps
+
     @staticmethod
     def __userCallback__(data): return
 
+    #
+    # Function that prefixes a G-Code line with its line number and appends its checksum, so that the controller can detect lost or corrupted lines
+    # PRIVATE
+    # @param gCode --- Description: The G-Code command. Type: string.
+    # @param lineNumber --- Description: Line number, consecutive since the last "M110 N0". Type: int.
+    # @status
+    #
+    def __numberLine__(self, gCode, lineNumber) :
+
+        line = "N%d %s" % (lineNumber, gCode)
+        checksum = 0
+        for character in line :
+            checksum ^= ord(character)
+
+        self.lineNumber = lineNumber
+        self.lastPacket = {"data": gCode, "lineNumber": lineNumber}
+
+        return "%s*%d" % (line, checksum)
+
+    #
+    # Function that extracts the line number that the controller asks to resend from its reply
+    # PRIVATE
+    # @param reply --- Description: The reply of the controller. Type: string.
+    # @return --- The line number to resend, or None if the line was accepted
+    # @status
+    #
+    def __getResendLine__(self, reply) :
+
+        match = re.search(r"Resend:\s*(\d+)", reply)
+        if match is not None :
+            return int(match.group(1))
+
+        # Without an explicit resend request, restart after the last line the controller accepted
+        for error in self.gCodeErrors.values() :
+            match = re.search(re.escape(error) + r"(\d+)", reply)
+            if match is not None :
+                return int(match.group(1)) + 1
+
+        return None
+
     #
     # Function that executes upon reception of messages from the motion controller. The user configured callback in ran after this function.
     # PUBLIC
@@ -275,6 +1465,330 @@ class GCode:
 
         return
 
+class MotionCompletionTimeout(Exception):
+    '''
+    Raised when a motion does not complete before the deadline given to waitForMotionCompletion.
+    '''
+    pass
+
+class MotionCompletionWaiter:
+    '''
+    A thread waiting on the MotionCompletionPoller.
+    '''
+    def __init__(self, sequence, deadline, pollAfter, predictedEnd, isSettled):
+        self.sequence = sequence            # Only polls started after this one may resolve the waiter
+        self.deadline = deadline
+        self.pollAfter = pollAfter          # The controller is not polled for this waiter before this time
+        self.predictedEnd = predictedEnd    # Predicted end of the motion, if known
+        self.isSettled = isSettled          # Optional function telling whether pushed feedback shows the motion is over
+        self.isDone = False
+        self.isCompleted = False
+        self.error = None
+
+def trapezoidalMoveDuration(distance, speed, acceleration) :
+    '''
+    Returns the duration in seconds of a move following a trapezoidal speed profile.
+
+    params:
+        distance: float
+            Travel in mm
+        speed: float
+            Cruise speed in mm/s
+        acceleration: float
+            Acceleration and deceleration in mm/s^2
+    '''
+    if distance <= 0:
+        return 0.0
+    if acceleration <= 0:
+        return distance / speed
+
+    # Distance covered while accelerating to the cruise speed and decelerating back to rest
+    rampDistance = speed * speed / acceleration
+    if distance >= rampDistance:
+        return distance / speed + speed / acceleration
+
+    # Triangular profile: the cruise speed is never reached
+    return 2.0 * math.sqrt(distance / acceleration)
+
+class MotionCompletionPoller:
+    '''
+    Waits for motion completion on behalf of any number of threads.
+
+    A single background thread polls the controller while at least one thread is waiting, starting at
+    pollInterval and backing off up to maxPollInterval. Every waiter is resolved by the same poll,
+    and a stop can interrupt all of them at once.
+
+    When the end of the motion is predicted, the poller sleeps until just before it and then starts
+    polling at fastPollInterval. The difference between the observed and predicted completion times
+    is recorded so that the prediction can be calibrated.
+
+    Waiters may also be resolved without polling, by calling notifySettled whenever pushed feedback
+    (e.g. an encoder position) may satisfy their isSettled function.
+    '''
+    HISTORY_LENGTH = 100
+
+    def __init__(self, isMotionCompleted, pollInterval=0.05, maxPollInterval=0.25, backoff=1.5, fastPollInterval=0.02):
+        self.pollInterval = pollInterval
+        self.maxPollInterval = maxPollInterval
+        self.backoff = backoff
+        self.fastPollInterval = fastPollInterval
+        self.waitDurations = collections.deque(maxlen=MotionCompletionPoller.HISTORY_LENGTH)
+        self.predictionErrors = collections.deque(maxlen=MotionCompletionPoller.HISTORY_LENGTH)
+
+        self.__isMotionCompleted = isMotionCompleted
+        self.__condition = threading.Condition()
+        self.__waiters = []
+        self.__sequence = 0
+        self.__thread = None
+        self.__logger = logging.getLogger(__name__)
+
+    def configure(self, pollInterval=None, maxPollInterval=None, backoff=None, fastPollInterval=None):
+        if pollInterval is not None: self.pollInterval = pollInterval
+        if maxPollInterval is not None: self.maxPollInterval = maxPollInterval
+        if backoff is not None: self.backoff = backoff
+        if fastPollInterval is not None: self.fastPollInterval = fastPollInterval
+
+    def wait(self, timeout=None, predictedEnd=None, pollAfter=None, isSettled=None):
+        '''
+        Blocks until the controller reports that motion is completed.
+
+        params:
+            timeout: float
+                Maximum number of seconds to wait, MotionCompletionTimeout is raised when it expires
+            predictedEnd: float
+                (Optional) Time at which the motion is predicted to end
+            pollAfter: float
+                (Optional) Time before which the controller does not need to be polled
+            isSettled: func() -> bool
+                (Optional) Tells whether pushed feedback shows that the motion is over, checked on notifySettled
+
+        returns:
+            bool
+                True if the motion completed, False if the wait was interrupted
+        '''
+        startTime = time.time()
+        deadline = None if timeout is None else startTime + timeout
+
+        with self.__condition:
+            waiter = MotionCompletionWaiter(self.__sequence, deadline, startTime if pollAfter is None else pollAfter, predictedEnd, isSettled)
+            self.__waiters.append(waiter)
+            self.__resolveSettled()
+            if self.__thread is None:
+                self.__thread = threading.Thread(name='MotionCompletionPoller', target=self.__run)
+                self.__thread.daemon = True
+                self.__thread.start()
+            self.__condition.notify_all()
+
+            while not waiter.isDone:
+                if deadline is None:
+                    self.__condition.wait()
+                    continue
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.__waiters.remove(waiter)
+                    self.__condition.notify_all()
+                    raise MotionCompletionTimeout("Motion did not complete within %.3f seconds" % timeout)
+                self.__condition.wait(remaining)
+
+        self.waitDurations.append(time.time() - startTime)
+
+        if waiter.error is not None:
+            raise waiter.error
+        return waiter.isCompleted
+
+    def interrupt(self):
+        '''
+        Releases every waiting thread without waiting for the controller, e.g. after a stop.
+        '''
+        with self.__condition:
+            self.__resolve(self.__waiters, False)
+
+    def notifySettled(self):
+        '''
+        Resolves, without polling the controller, the waiters whose isSettled function returns True.
+        '''
+        with self.__condition:
+            self.__resolveSettled()
+
+    def getStats(self):
+        return MotionCompletionPoller.summarize(self.waitDurations)
+
+    def getPredictionStats(self):
+        stats = MotionCompletionPoller.summarize(self.predictionErrors)
+        stats["meanAbsolute"] = MotionCompletionPoller.summarize([abs(error) for error in self.predictionErrors])["mean"]
+        return stats
+
+    @staticmethod
+    def summarize(values):
+        values = list(values)
+        return {
+            "count": len(values),
+            "last": values[-1] if len(values) > 0 else None,
+            "mean": sum(values) / len(values) if len(values) > 0 else None,
+            "max": max(values) if len(values) > 0 else None
+        }
+
+    def __resolveSettled(self):
+        settledWaiters = [waiter for waiter in self.__waiters if waiter.isSettled is not None and waiter.isSettled()]
+        if len(settledWaiters) > 0:
+            self.__recordPredictionErrors(settledWaiters, time.time())
+            self.__resolve(settledWaiters, True)
+
+    def __recordPredictionErrors(self, waiters, completionTime):
+        for waiter in waiters:
+            if waiter.predictedEnd is not None:
+                self.predictionErrors.append(completionTime - waiter.predictedEnd)
+
+    def __resolve(self, waiters, isCompleted, error=None):
+        for waiter in list(waiters):
+            waiter.isDone = True
+            waiter.isCompleted = isCompleted
+            waiter.error = error
+            self.__waiters.remove(waiter)
+        self.__condition.notify_all()
+
+    def __run(self):
+        interval = None
+        while True:
+            with self.__condition:
+                if len(self.__waiters) == 0:
+                    self.__thread = None
+                    return
+
+                # Sleep until the earliest time at which one of the waiters needs the controller polled
+                delay = min(waiter.pollAfter for waiter in self.__waiters) - time.time()
+                if delay > 0:
+                    self.__condition.wait(delay)
+                    continue
+
+                if interval is None:
+                    isPredicted = any(waiter.predictedEnd is not None for waiter in self.__waiters)
+                    interval = self.fastPollInterval if isPredicted else self.pollInterval
+
+                self.__sequence += 1
+                pollSequence = self.__sequence
+
+            pollTime = time.time()
+            isCompleted, error = False, None
+            try:
+                isCompleted = self.__isMotionCompleted()
+            except Exception as e:
+                error = e
+
+            with self.__condition:
+                # Waiters that arrived while the poll was in flight may have issued a new move since
+                polledWaiters = [waiter for waiter in self.__waiters if waiter.sequence < pollSequence]
+                if error is not None:
+                    self.__resolve(polledWaiters, False, error)
+                elif isCompleted:
+                    self.__recordPredictionErrors(polledWaiters, pollTime)
+                    self.__resolve(polledWaiters, True)
+
+                if error is not None or isCompleted:
+                    interval = None     # Any waiter left is fresh: poll it promptly
+                    continue
+
+                self.__logger.debug("Motion not completed, polling again in %.3f s" % interval)
+                self.__condition.wait(interval)
+                interval = min(interval * self.backoff, self.maxPollInterval)
+
+#
+# Class that compiles a sequence of motion commands into a single G-code program
+# @status
+#
+class GCodeProgram :
+    '''
+    Builds a G-code program that MachineMotion.emitProgram streams to the controller in one go.
+
+    Every method appends commands to the program and returns the program, so that calls can be
+    chained. Positioning mode, speed and acceleration are only emitted when they change within the
+    program.
+    '''
+
+    def __init__(self, machineMotion) :
+        self.__machineMotion = machineMotion
+        self.__lines = []
+        self.__positioning = None
+        self.__feedrate = None
+        self.__acceleration = None
+
+    def __len__(self) :
+        return len(self.__lines)
+
+    def __setPositioning(self, positioning) :
+        if self.__positioning != positioning :
+            self.__lines.append(positioning)
+            self.__positioning = positioning
+
+    def speed(self, speed, units = UNITS_SPEED.mm_per_sec) :
+        self.__machineMotion._restrictInputValue("units", units, UNITS_SPEED)
+        feedrate = speed if units == UNITS_SPEED.mm_per_min else 60*speed
+        if self.__feedrate != feedrate :
+            self.__lines.append(GCodeBuilder.feedrate(feedrate))
+            self.__feedrate = feedrate
+        return self
+
+    def acceleration(self, acceleration, units = UNITS_ACCEL.mm_per_sec_sqr) :
+        self.__machineMotion._restrictInputValue("units", units, UNITS_ACCEL)
+        accel_mm_per_sec_sqr = acceleration if units == UNITS_ACCEL.mm_per_sec_sqr else acceleration/3600
+        if self.__acceleration != accel_mm_per_sec_sqr :
+            self.__lines.append(GCodeBuilder.acceleration(accel_mm_per_sec_sqr))
+            self.__acceleration = accel_mm_per_sec_sqr
+        return self
+
+    def absoluteMove(self, axis, position) :
+        return self.combinedAbsoluteMove([axis], [position])
+
+    def combinedAbsoluteMove(self, axes, positions) :
+        for axis in axes :
+            self.__machineMotion._restrictInputValue("axis", axis, AXIS_NUMBER)
+        self.__setPositioning("G90")
+        self.__lines.append(GCodeBuilder.combinedMove(axes, positions))
+        return self
+
+    def relativeMove(self, axis, direction, distance) :
+        return self.combinedRelativeMove([axis], [direction], [distance])
+
+    def combinedRelativeMove(self, axes, directions, distances) :
+        for axis, direction in zip(axes, directions) :
+            self.__machineMotion._restrictInputValue("axis", axis, AXIS_NUMBER)
+            self.__machineMotion._restrictInputValue("direction", direction, DIRECTION)
+        self.__setPositioning("G91")
+        self.__lines.append(GCodeBuilder.combinedMove(axes, [GCodeBuilder.signedDistance(direction, distance) for direction, distance in zip(directions, distances)]))
+        return self
+
+    def home(self, axis = None) :
+        if axis is None :
+            self.__lines.append("G28")
+        else :
+            self.__machineMotion._restrictInputValue("axis", axis, AXIS_NUMBER)
+            self.__lines.append(GCodeBuilder.home(axis))
+        return self
+
+    def dwell(self, milliseconds) :
+        self.__lines.append("G4 P" + str(milliseconds))
+        return self
+
+    def gCode(self, gCode) :
+        # Raw G-code may change the modal state: emit it again the next time it is needed
+        self.__lines.append(gCode)
+        self.__positioning = self.__feedrate = self.__acceleration = None
+        return self
+
+    def repeat(self, count) :
+        '''
+        Repeats the whole program the given number of times, e.g. to run a batch of identical cycles.
+        '''
+        self.__lines = self.__lines * count
+        return self
+
+    def compile(self) :
+        '''
+        Returns the list of G-code lines of the program.
+        '''
+        return list(self.__lines)
+
 #
 # Class used to encapsulate the MachineMotion controller
 # @status
@@ -288,8 +1802,15 @@ class MachineMotion :
     class HomingSpeedOutOfBounds(Exception):
         pass
 
+    InvalidInput = InvalidInput
+    MotionCompletionTimeout = MotionCompletionTimeout
+    ControllerUnavailable = ControllerUnavailable
+
+    MAX_BATCH_RESENDS = 10                  # Number of resend requests tolerated while streaming a batch
+    BATCH_WINDOW_SIZE = 16                  # Numbered lines sent ahead of their replies while streaming a batch
+
     # Class constructor
-    def __init__(self, machineIp, gCodeCallback=None) :
+    def __init__(self, machineIp, gCodeCallback=None, transport=None) :
 
         self.myConfiguration = {"machineIp": "notInitialized", "machineGateway": "notInitialized", "machineNetmask": "notInitialized"}
         self.myGCode = "notInitialized"
@@ -306,6 +1827,7 @@ class MachineMotion :
 
         # MQTT
         self.mqttCallbacks = []                         # Custom MachineApp template variable
+        self.mqttConnectCallbacks = []                  # Custom MachineApp template variable
         self.myMqttClient = None
         self.myMqttClient = mqtt.Client()
         self.myMqttClient.on_connect = self.__onConnect
@@ -320,6 +1842,7 @@ class MachineMotion :
         #Set callback to default until user initialize it
         self.eStopCallback = emptyCallBack
         self.__isEstopped = False
+        self.__isBatchAborted = False
 
         # Initializing axis parameters
         self.steps_mm = ["Axis 0 does not exist", "notInitialized", "notInitialized", "notInitialized"]
@@ -327,6 +1850,51 @@ class MachineMotion :
         self.mech_gain = ["Axis 0 does not exist", "notInitialized", "notInitialized", "notInitialized"]
         self.direction = ["Axis 0 does not exist", "notInitialized", "notInitialized", "notInitialized"]
 
+        # Shadow of the controller's modal state, used to skip commands that would not change it
+        self.redundantCommandsSkipped = 0
+        self.invalidateModalState()
+
+        # Shared service that polls for motion completion on behalf of every waiting thread
+        self.myMotionCompletionPoller = MotionCompletionPoller(self.isMotionCompleted)
+
+        # Kinematic prediction of the end of the queued motion
+        self.predictionEnabled = True
+        self.predictionGuardTime = 0.05     # Polling starts at least this many seconds before the predicted end...
+        self.predictionGuardRatio = 0.1     # ...or this fraction of the predicted duration before it, whichever is longer
+        self.predictionScale = 1.0          # Calibration factor applied to predicted durations
+        self.__commandedPositions = { 1 : None, 2 : None, 3 : None }
+
+        # Reconciliation of the commanded positions with the positions reported by the controller
+        self.positionReconcileInterval = None   # Seconds after which getCommandedPositions queries the controller again, None to only reconcile on demand
+        self.positionDriftThreshold = 0.05      # Difference in mm between the commanded and reported positions that is reported as drift
+        self.positionDrift = {}                 # Maps each axis to the last drift detected on it (reported - commanded position, in mm)
+        self.positionDriftCount = 0             # Number of reconciliations that detected drift
+        self.__lastReconciliationTime = None
+        self.__positionSequence = 0             # Incremented whenever the commanded positions change, so that replies to older queries are not reconciled
+
+        # Cache of the saveData storage, disabled until configDataCache is called
+        self.dataCache = None
+
+        # Cache of the axis configuration pushed to the controller, disabled until configAxisConfigurationCache is called
+        self.__axisConfigurationCache = None
+        self.__pushedStepsMm = None             # Steps/mm last pushed to each axis, once the cache is loaded
+
+        # Merging of consecutive moves into combined moves
+        self.moveBufferingEnabled = False
+        self.movesMerged = 0                    # Number of move commands saved by merging buffered moves
+        self.__discardBufferedMoves()
+
+        # Encoder-based motion completion
+        self.completionStrategy = COMPLETION_STRATEGY.polling
+        self.encoderFallbackDelay = 0.5     # Seconds after the predicted end (or the start of the wait) before falling back to polling
+        self.__axisEncoders = {}            # Maps axes to the configuration of their encoder
+        self.__encoderRestPositions = {}    # Maps axes to the encoder position they were confirmed to stop at
+        self.__encoderStableTimes = [ 0, 0, 0 ]
+        self.__resetMotionPrediction()
+
+        self.__transport = transport        # Transport of the G-code commands, HTTP requests on the connection pool when None
+        self.__streamTransport = None       # Pipelined transport streaming batches while the default HTTP transport is in use
+
         if(gCodeCallback):
             self.__establishConnection(False, gCodeCallback)
         else:
@@ -337,23 +1905,280 @@ class MachineMotion :
 
     #Takes tuples of parameter variables and the class they belong to.
     #If the parameter does not belong to the class, it raises a descriptive error.
+    #The valid values of each class are computed once, by getValidationTable.
     def _restrictInputValue(self, argName, argValue, argClass):
+        restrictInputValue(argName, argValue, argClass)
 
-        validParams = [i for i in argClass.__dict__.keys() if i[:1] != '_']
-        validValues = [argClass.__dict__[i] for i in validParams]
+    # ------------------------------------------------------------------------
+    # Sends a modal command unless the controller is already known to be in the requested state.
+    #
+    # @param {str} key    - Entry of the modal state shadow ("positioning", "feedrate", "acceleration" or "steps_mm")
+    # @param value        - Value that the entry takes once the command is executed
+    # @param {str} gCode  - Command that puts the controller in the requested state
+    # @param {int} axis   - Axis of the entry, for per-axis entries only
+    def __emitModal(self, key, value, gCode, axis = None) :
+        current = self.__modalState[key] if axis is None else self.__modalState[key][axis]
+        if current is not None and current == value :
+            self.redundantCommandsSkipped += 1
+            return
 
-        if argValue in validValues:
-            pass
-        else:
-            class InvalidInput(Exception):
-                pass
-            errorMessage = "An invalid selection was made. Given parameter '" + str(argName) + "' must be one of the following values:"
-            for param in validParams:
-                errorMessage = errorMessage + "\n" + argClass.__name__ + "." + param + " (" + str(argClass.__dict__[param]) +")"
-            raise InvalidInput(errorMessage)
+        reply = self.__emit(gCode)
+
+        if ( reply.isOk ) : pass
+        else : raise Exception('Error in gCode execution')
+
+        if axis is None :
+            self.__modalState[key] = value
+        else :
+            self.__modalState[key][axis] = value
 
         return
 
+    # ------------------------------------------------------------------------
+    # Sends a command to the controller, after the buffered moves that must run before it.
+    #
+    # @param {str} gCode        - Command to send
+    # @param {float} deadline   - Seconds after which ControllerUnavailable is raised, see GCode.__emit__
+    def __emit(self, gCode, deadline = None) :
+        if len(self.__bufferedMoves) > 0 :
+            self.flushMoves()
+        return self.myGCode.__emit__(gCode, deadline)
+
+    # ------------------------------------------------------------------------
+    # Sends a command that changes the commanded positions. Position queries that overlap with it
+    # are not reconciled, since their reply may or may not include its effect.
+    #
+    # @param {str} gCode - Move, homing or position override command
+    def __emitPositionCommand(self, gCode) :
+        if len(self.__bufferedMoves) > 0 :
+            self.flushMoves()
+        self.__positionSequence += 1
+        return self.myGCode.__emit__(gCode)
+
+    # ------------------------------------------------------------------------
+    # Adds moves to the move buffer when move buffering is enabled. Moves that conflict with the
+    # buffered ones, because they use another positioning mode or an axis that already has a
+    # buffered move, flush the buffer first.
+    #
+    # @param {dict} targets     - Maps each moving axis to its target position (absolute moves) or signed distance (relative moves), in mm
+    # @param {bool} isRelative  - True for relative moves
+    # @return {bool}            - True if the moves were buffered, False if they must be sent now
+    def __bufferMoves(self, targets, isRelative) :
+        if not self.moveBufferingEnabled :
+            return False
+
+        if len(self.__bufferedMoves) > 0 :
+            if self.__isBufferRelative != isRelative or any(axis in self.__bufferedMoves for axis in targets) :
+                self.flushMoves()
+
+        self.__bufferedMoves.update(targets)
+        self.__isBufferRelative = isRelative
+        self.__bufferedCommands += 1
+        return True
+
+    def setMoveBuffering(self, enabled):
+        '''
+        desc: Enables or disables move buffering. While it is enabled, absolute and relative moves are not sent right away: consecutive moves on different axes are merged into a single combined move, sent before the next command or wait.
+        params:
+            enabled:
+                desc: True to buffer moves, False to send them right away. Disabling move buffering flushes the buffered moves.
+                type: Boolean
+        note: Merged moves run at the same time instead of one after the other, and follow the straight line between their start and end points at the current speed. A move on an axis that already has a buffered move, or using the other positioning mode, flushes the buffer first. Stops and E-stops discard the buffered moves. The number of commands saved is counted in movesMerged.
+        '''
+        if not enabled :
+            self.flushMoves()
+        self.moveBufferingEnabled = enabled
+
+    def flushMoves(self):
+        '''
+        desc: Sends the buffered moves to the controller as a single move. Does nothing if no move is buffered.
+        note: This is done automatically before any other command is sent, and before waiting for motion completion.
+        '''
+        if len(self.__bufferedMoves) == 0 :
+            return
+
+        targets = self.__bufferedMoves
+        isRelative = self.__isBufferRelative
+        commandCount = self.__bufferedCommands
+        self.__discardBufferedMoves()
+
+        self.__emitModal("positioning", "G91" if isRelative else "G90", "G91" if isRelative else "G90")
+
+        axes = sorted(targets)
+        reply = self.__emitPositionCommand(GCodeBuilder.combinedMove(axes, [targets[axis] for axis in axes]))
+
+        if ( reply.isOk ) : pass
+        else : raise Exception('Error in gCode execution')
+
+        self.movesMerged += commandCount - 1
+        self.__recordMove(targets, isRelative)
+
+    # ------------------------------------------------------------------------
+    # Forgets the buffered moves without sending them.
+    def __discardBufferedMoves(self) :
+        self.__bufferedMoves = {}
+        self.__isBufferRelative = False
+        self.__bufferedCommands = 0
+
+    # ------------------------------------------------------------------------
+    # Forgets the predicted end of motion, once the queued motion is known to be over.
+    def __resetMotionPrediction(self) :
+        self.__isMotionPredictable = True
+        self.__predictedMotionStart = None
+        self.__predictedMotionEnd = None
+        self.__encoderTargets = {}          # Maps moving axes to their expected encoder position, None if it cannot be known
+
+    # ------------------------------------------------------------------------
+    # Marks the queued motion as impossible to predict until the next completed wait.
+    #
+    # @param {list} axes - Axes whose commanded position is no longer known
+    def __forgetMotionPrediction(self, axes = ()) :
+        self.__isMotionPredictable = False
+        self.__positionSequence += 1
+        for axis in axes:
+            self.__commandedPositions[axis] = None
+            self.__encoderTargets[axis] = None
+        if len(axes) == 0:
+            # The motion involves axes that are not known, encoders cannot tell when it is over
+            self.__encoderTargets[None] = None
+
+    # ------------------------------------------------------------------------
+    # Updates the commanded positions after a move and extends the predicted end of motion.
+    #
+    # @param {dict} targets     - Maps each moving axis to its target position (absolute moves) or signed distance (relative moves), in mm
+    # @param {bool} isRelative  - True for relative moves
+    def __recordMove(self, targets, isRelative) :
+        distances = {}
+        for axis, value in targets.items():
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                self.__forgetMotionPrediction(targets.keys())
+                return
+
+            current = self.__commandedPositions[axis]
+            if isRelative:
+                distances[axis] = abs(value)
+                self.__commandedPositions[axis] = None if current is None else current + value
+                self.__trackEncoder(axis, value)
+            else:
+                distances[axis] = None if current is None else abs(value - current)
+                self.__commandedPositions[axis] = value
+                self.__trackEncoder(axis, None if current is None else value - current)
+
+        self.__positionSequence += 1
+        self.__predictMove(distances)
+
+    # ------------------------------------------------------------------------
+    # Updates the encoder position expected at the end of the queued motion of an axis.
+    #
+    # @param {int} axis         - Moving axis
+    # @param {float} distance   - Signed travel of the axis in mm, None if unknown
+    def __trackEncoder(self, axis, distance) :
+        if not axis in self.__axisEncoders:
+            self.__encoderTargets[axis] = None
+            return
+
+        encoderConfig = self.__axisEncoders[axis]
+        if not axis in self.__encoderTargets:
+            # First move since the axis was last at rest: start from where it stopped, or from its settled position
+            self.__encoderTargets[axis] = self.__encoderRestPositions.get(axis, self.myEncoderStablePositions[encoderConfig["encoder"]])
+        if distance is None or self.__encoderTargets[axis] is None or self.mech_gain[axis] == "notInitialized":
+            self.__encoderTargets[axis] = None
+            return
+
+        counts = distance / self.mech_gain[axis] * encoderConfig["countsPerTurn"]
+        self.__encoderTargets[axis] += -counts if encoderConfig["reverse"] else counts
+        encoderConfig["issuedAt"] = time.time()
+
+    # ------------------------------------------------------------------------
+    # Returns a function telling whether the encoders of every moving axis settled at their target,
+    # or None if the queued motion cannot be confirmed by encoders.
+    def __getEncoderSettledCheck(self) :
+        if self.completionStrategy != COMPLETION_STRATEGY.encoder or len(self.__encoderTargets) == 0:
+            return None
+
+        checks = []
+        for axis, target in self.__encoderTargets.items():
+            if target is None:
+                return None
+            encoderConfig = self.__axisEncoders[axis]
+            checks.append((encoderConfig["encoder"], target, encoderConfig["tolerance"], encoderConfig["issuedAt"]))
+
+        def isSettled():
+            for encoder, target, tolerance, issuedAt in checks:
+                if self.__encoderStableTimes[encoder] < issuedAt:
+                    return False
+                if abs(self.myEncoderStablePositions[encoder] - target) > tolerance:
+                    return False
+            return True
+
+        return isSettled
+
+    # ------------------------------------------------------------------------
+    # Extends the predicted end of motion by the duration of a move, using the last speed and
+    # acceleration sent to the controller and a trapezoidal speed profile.
+    #
+    # @param {dict} distances - Maps each moving axis to its travel in mm, None if unknown
+    def __predictMove(self, distances) :
+        feedrate = self.__modalState["feedrate"]
+        acceleration = self.__modalState["acceleration"]
+        if not self.__isMotionPredictable or feedrate is None or acceleration is None:
+            self.__isMotionPredictable = False
+            return
+
+        # Combined moves follow the straight line between the start and end points
+        squaredDistance = 0.0
+        for axis, distance in distances.items():
+            steps_mm = self.steps_mm[axis]
+            if distance is None or not isinstance(steps_mm, (int, float)) or steps_mm == 0:
+                self.__isMotionPredictable = False
+                return
+            # The controller can only travel whole steps
+            steps_mm = abs(steps_mm)
+            squaredDistance += (round(distance * steps_mm) / steps_mm) ** 2
+
+        duration = self.predictionScale * trapezoidalMoveDuration(math.sqrt(squaredDistance), float(feedrate) / 60, float(acceleration))
+        self.__extendMotionPrediction(duration)
+
+    # ------------------------------------------------------------------------
+    # Queues a known duration after the motion that is already predicted.
+    #
+    # @param {float} duration - Duration in seconds
+    def __extendMotionPrediction(self, duration) :
+        if not self.__isMotionPredictable:
+            return
+
+        now = time.time()
+        if self.__predictedMotionEnd is None or self.__predictedMotionEnd < now:
+            self.__predictedMotionStart = now
+            self.__predictedMotionEnd = now
+        self.__predictedMotionEnd += duration
+
+    def invalidateModalState(self):
+        '''
+        desc: Forgets the cached positioning mode, feedrate, acceleration and steps/mm of the controller, so that the next commands setting them are always sent.
+        note: This is done automatically after emitStop, an E-stop event and a reconnection to the controller. Call it after changing these settings outside of this API.
+        '''
+        self.__modalState = {
+            "positioning"   : None,
+            "feedrate"      : None,
+            "acceleration"  : None,
+            "steps_mm"      : { 1 : None, 2 : None, 3 : None }
+        }
+
+        return
+
+    def getModalState(self):
+        '''
+        desc: Returns the modal state that the controller is known to be in. Unknown entries are None.
+        returnValue: A dictionary with the "positioning" mode ("G90" or "G91"), the "feedrate" in mm/min, the "acceleration" in mm/s^2 and the "steps_mm" of each axis.
+        returnValueType: Dictionary
+        '''
+        state = dict(self.__modalState)
+        state["steps_mm"] = dict(self.__modalState["steps_mm"])
+        return state
+
     def setContinuousMove(self, axis, speed, accel = 100) :
 
         '''
@@ -375,25 +2200,22 @@ class MachineMotion :
         # Verify argument type to avoid sending garbage in the GCODE
         self._restrictInputValue("axis", axis, AXIS_NUMBER)
 
-        if sys.version_info[0] < 3 :
-            if not isinstance(speed, (int, long, float)) : raise Exception('Error in speed variable type')
-            if not isinstance(accel, (int, long, float)) : raise Exception('Error in accel variable type')
-        else:
-            if not isinstance(speed, (int, float)) : raise Exception('Error in speed variable type')
-            if not isinstance(accel, (int, float)) : raise Exception('Error in accel variable type')
+        if not isinstance(speed, (int, float)) : raise Exception('Error in speed variable type')
+        if not isinstance(accel, (int, float)) : raise Exception('Error in accel variable type')
 
         # set motor to speed mode
-        reply = self.myGCode.__emit__("V5 " + self.getAxisName(axis) + "2")
+        self.__forgetMotionPrediction([axis])
+        reply = self.__emit(GCodeBuilder.speedMode(axis))
 
-        if ( "echo" in reply and "ok" in reply ) : pass
+        if ( reply.isOk ) : pass
         else :
             raise Exception('Error in gCode execution')
             return False
 
         # Send speed command with accel
-        reply = self.myGCode.__emit__("V4 S" + str(speed / self.mech_gain[axis] * STEPPER_MOTOR.steps_per_turn * self.u_step[axis]) + " A" + str(accel / self.mech_gain[axis] * STEPPER_MOTOR.steps_per_turn * self.u_step[axis]) + " " + self.getAxisName(axis))
+        reply = self.__emit(GCodeBuilder.speed(axis, speed / self.mech_gain[axis] * STEPPER_MOTOR.steps_per_turn * self.u_step[axis], accel / self.mech_gain[axis] * STEPPER_MOTOR.steps_per_turn * self.u_step[axis]))
 
-        if ( "echo" in reply and "ok" in reply ) : pass
+        if ( reply.isOk ) : pass
         else :
             raise Exception('Error in gCode execution')
             return False
@@ -416,15 +2238,13 @@ class MachineMotion :
 
         # Verify argument type to avoid sending garbage in the GCODE
         self._restrictInputValue("axis", axis, AXIS_NUMBER)
-        if sys.version_info[0] < 3 :
-            if not isinstance(accel, (int, long, float)) : raise Exception('Error in accel variable type')
-        else:
-            if not isinstance(accel, (int, float)) : raise Exception('Error in accel variable type')
+        if not isinstance(accel, (int, float)) : raise Exception('Error in accel variable type')
 
         # Send speed command with accel
-        reply = self.myGCode.__emit__("V4 S0" + " A" + str(accel / self.mech_gain[axis] * STEPPER_MOTOR.steps_per_turn * self.u_step[axis]) + " " + self.getAxisName(axis))
+        self.__forgetMotionPrediction([axis])
+        reply = self.__emit(GCodeBuilder.speed(axis, 0, accel / self.mech_gain[axis] * STEPPER_MOTOR.steps_per_turn * self.u_step[axis]))
 
-        if ( "echo" in reply and "ok" in reply ) : pass
+        if ( reply.isOk ) : pass
         else :
             raise Exception('Error in gCode execution')
             return False
@@ -444,50 +2264,37 @@ class MachineMotion :
 
     def move(self, motor, rotation = None, speed = None, accel = None, reference = "absolute", type = "synchronous") :
 
+        self.__forgetMotionPrediction([motor])
+
         if rotation is not None :
             # set motor to position mode
-            reply = self.myGCode.__emit__("V5 " + self.getAxisName(motor) + "1")
+            reply = self.__emit(GCodeBuilder.positionMode(motor))
 
-            if ( "echo" in reply and "ok" in reply ) : pass
+            if ( reply.isOk ) : pass
             else :
                 raise Exception('Error in gCode execution')
                 return False
 
             if speed is not None :
                 # send speed command (need to convert rotation/s to mm/min )
-                reply = self.myGCode.__emit__("G0 F" + str(speed * 60 * self.mech_gain[motor]))
-
-                if ( "echo" in reply and "ok" in reply ) : pass
-                else :
-                    raise Exception('Error in gCode execution')
-                    return False
-
+                feedrate = speed * 60 * self.mech_gain[motor]
+                self.__emitModal("feedrate", feedrate, GCodeBuilder.feedrate(feedrate))
 
             if accel is not None :
                 # send accel command (need to convert rotation/s^2 to mm/s^2)
-                reply = self.myGCode.__emit__("M204 T" + str(accel * self.mech_gain[motor]))
-
-                if ( "echo" in reply and "ok" in reply ) : pass
-                else :
-                    raise Exception('Error in gCode execution')
-                    return False
+                acceleration = accel * self.mech_gain[motor]
+                self.__emitModal("acceleration", acceleration, GCodeBuilder.acceleration(acceleration))
 
             if reference is "absolute" :
                 # send absolute move command
 
                 # Set to absolute motion mode
-                reply = self.myGCode.__emit__("G90")
-
-                if ( "echo" in reply and "ok" in reply ) :
-
-                    # Transmit move command
-                    reply = self.myGCode.__emit__("G0 " + self.getAxisName(motor) + str(rotation * self.mech_gain[motor]))
+                self.__emitModal("positioning", "G90", "G90")
 
-                    if ( "echo" in reply and "ok" in reply ) : pass
-                    else :
-                        raise Exception('Error in gCode execution')
-                        return False
+                # Transmit move command
+                reply = self.__emit(GCodeBuilder.move(motor, rotation * self.mech_gain[motor]))
 
+                if ( reply.isOk ) : pass
                 else :
                     raise Exception('Error in gCode execution')
                     return False
@@ -495,17 +2302,12 @@ class MachineMotion :
             elif reference is "relative" :
                 # send relative move command
                 # Set to relative motion mode
-                reply = self.myGCode.__emit__("G91")
+                self.__emitModal("positioning", "G91", "G91")
 
-                if ( "echo" in reply and "ok" in reply ) :
-                    # Transmit move command
-                    reply = self.myGCode.__emit__("G0 " + self.getAxisName(motor) + str(rotation * self.mech_gain[motor]))
-
-                    if ( "echo" in reply and "ok" in reply ) : pass
-                    else :
-                        raise Exception('Error in gCode execution')
-                        return False
+                # Transmit move command
+                reply = self.__emit(GCodeBuilder.move(motor, rotation * self.mech_gain[motor]))
 
+                if ( reply.isOk ) : pass
                 else :
                     raise Exception('Error in gCode execution')
                     return False
@@ -522,17 +2324,17 @@ class MachineMotion :
         else :
             if speed is not None and accel is not None :
                 # set motor to speed mode
-                reply = self.myGCode.__emit__("V5 " + self.getAxisName(motor) + "2")
+                reply = self.__emit(GCodeBuilder.speedMode(motor))
 
-                if ( "echo" in reply and "ok" in reply ) : pass
+                if ( reply.isOk ) : pass
                 else :
                     raise Exception('Error in gCode execution')
                     return False
 
                 # Send speed command
-                reply = self.myGCode.__emit__("V4 S" + str(speed * STEPPER_MOTOR.steps_per_turn * self.u_step[motor]) + " A" + str(accel * STEPPER_MOTOR.steps_per_turn * self.u_step[motor]) + " " + self.getAxisName(motor))
+                reply = self.__emit(GCodeBuilder.speed(motor, speed * STEPPER_MOTOR.steps_per_turn * self.u_step[motor], accel * STEPPER_MOTOR.steps_per_turn * self.u_step[motor]))
 
-                if ( "echo" in reply and "ok" in reply ) : pass
+                if ( reply.isOk ) : pass
                 else :
                     raise Exception('Error in gCode execution')
                     return False
@@ -549,10 +2351,7 @@ class MachineMotion :
     # @status
     #
     def getAxisName(self, drive):
-        if drive == 1: return "X"
-        elif drive == 2: return "Y"
-        elif drive == 3: return "Z"
-        else: return "Axis Error"
+        return GCodeBuilder.axisName(drive)
 
 
     # ------------------------------------------------------------------------
@@ -615,18 +2414,80 @@ class MachineMotion :
             3 : None
         }
 
-        reply = self.myGCode.__emit__("M114")
-
-        if ( "echo" in reply and "ok" in reply ) :
+        # Buffered moves are sent first, so that the reply accounts for them
+        if len(self.__bufferedMoves) > 0 :
+            self.flushMoves()
+        sequence = self.__positionSequence
+        reply = self.__emit("M114")
 
-            positions[1] = float(reply[reply.find('X')+2:(reply.find('Y')-1)])
-            positions[2] = float(reply[reply.find('Y')+2:(reply.find('Z')-1)])
-            positions[3] = float(reply[reply.find('Z')+2:(reply.find('E')-1)])
+        if ( reply.isOk ) :
+            positions.update(reply.getPositions())
 
         else : raise Exception('Error in gCode execution')
 
+        # Positions commanded by another thread while the query was in flight are more recent
+        if sequence == self.__positionSequence :
+            self.__reconcilePositions(positions)
+
         return positions
 
+    def getCommandedPositions(self, reconcile = False):
+        '''
+        desc: Returns the position that each axis was last commanded to reach, tracked from the moves, homing and setPosition commands sent by this instance, without querying the controller.
+        params:
+            reconcile:
+                desc: Query the controller for its positions before returning them, as getCurrentPositions does.
+                type: Boolean
+                defaultValue: False
+        returnValue: A dictionary containing the commanded position of each axis. Positions that are not known, e.g. before homing or after a stop, are None.
+        returnValueType: Dictionary
+        note: The positions are the end points of the queued motion, like those reported by the controller. They are reconciled with the controller on every getCurrentPositions call, and by this function once positionReconcileInterval seconds have elapsed since the last reconciliation (see configPositionReconciliation).
+        '''
+        if reconcile :
+            self.getCurrentPositions()
+        elif self.positionReconcileInterval is not None :
+            if self.__lastReconciliationTime is None or time.time() - self.__lastReconciliationTime >= self.positionReconcileInterval :
+                self.getCurrentPositions()
+
+        return dict(self.__commandedPositions)
+
+    def configPositionReconciliation(self, interval = False, driftThreshold = None):
+        '''
+        desc: Configures how the positions returned by getCommandedPositions are reconciled with the controller. Parameters left out keep their current value.
+        params:
+            interval:
+                desc: Seconds after which getCommandedPositions queries the controller again, or None to only reconcile on demand.
+                type: Number
+            driftThreshold:
+                desc: Difference in mm between the commanded and reported position of an axis above which drift is reported.
+                type: Number
+        note: Detected drift is logged, counted in positionDriftCount and stored by axis in positionDrift. The reported positions then replace the commanded ones.
+        '''
+        if interval is not False : self.positionReconcileInterval = interval
+        if driftThreshold is not None : self.positionDriftThreshold = driftThreshold
+
+    # ------------------------------------------------------------------------
+    # Replaces the commanded positions by the positions reported by the controller, recording
+    # the axes whose commanded position drifted from the reported one.
+    #
+    # @param {dict} positions - Maps each axis to the position reported by the controller
+    def __reconcilePositions(self, positions) :
+        drift = {}
+        for axis, position in positions.items():
+            if position is None:
+                continue
+            commanded = self.__commandedPositions[axis]
+            if commanded is not None and abs(position - commanded) > self.positionDriftThreshold:
+                drift[axis] = position - commanded
+            self.__commandedPositions[axis] = position
+
+        self.__lastReconciliationTime = time.time()
+
+        if len(drift) > 0:
+            self.positionDrift.update(drift)
+            self.positionDriftCount += 1
+            logging.warning("Commanded positions drifted from the controller positions: " + ", ".join("axis %d by %.3f mm" % (axis, drift[axis]) for axis in sorted(drift)))
+
     def getEndStopState(self):
         '''
         desc: Returns the current state of all home and end sensors.
@@ -644,74 +2505,10 @@ class MachineMotion :
             'z_max' : None,
         }
 
-        def trimUntil(S, key) :
-            return S[S.find(key) + len(key) :]
-
-        reply = self.myGCode.__emit__("M119")
-
-        if ( "echo" in reply and "ok" in reply ) :
-            #Remove first line (echo line)
-            reply = trimUntil(reply, "\n")
-
-            if "x_min" in reply :
-                keyB = "x_min: "
-                keyE = " \n"
-                states['x_min'] = reply[(reply.find(keyB) + len(keyB)) : (reply.find(keyE))]
-
-                #Remove x_min line
-                reply = trimUntil(reply, "\n")
-
-            else : raise Exception('Error in gCode')
-
-            if "x_max" in reply :
-                keyB = "x_max: "
-                keyE = " \n"
-                states['x_max'] = reply[(reply.find(keyB) + len(keyB)) : (reply.find(keyE))]
-
-                #Remove x_max line
-                reply = trimUntil(reply, "\n")
-
-            else : raise Exception('Error in gCode')
-
-            if "y_min" in reply :
-                keyB = "y_min: "
-                keyE = " \n"
-                states['y_min'] = reply[(reply.find(keyB) + len(keyB)) : (reply.find(keyE))]
-
-                #Remove y_min line
-                reply = trimUntil(reply, "\n")
-
-            else : raise Exception('Error in gCode')
-
-            if "y_max" in reply :
-                keyB = "y_max: "
-                keyE = " \n"
-                states['y_max'] = reply[(reply.find(keyB) + len(keyB)) : (reply.find(keyE))]
-
-                #Remove y_max line
-                reply = trimUntil(reply, "\n")
-
-            else : raise Exception('Error in gCode')
-
-            if "z_min" in reply :
-                keyB = "z_min: "
-                keyE = " \n"
-                states['z_min'] = reply[(reply.find(keyB) + len(keyB)) : (reply.find(keyE))]
+        reply = self.__emit("M119")
 
-                #Remove z_min line
-                reply = trimUntil(reply, "\n")
-
-            else : raise Exception('Error in gCode')
-
-            if "z_max" in reply :
-                keyB = "z_max: "
-                keyE = " \n"
-                states['z_max'] = reply[(reply.find(keyB) + len(keyB)) : (reply.find(keyE))]
-
-                #Remove z_max line
-                reply = trimUntil(reply, "\n")
-
-            else : raise Exception('Error in gCode')
+        if ( reply.isOk ) :
+            states.update(reply.getEndStopStates())
 
         else : raise Exception('Error in gCode execution')
 
@@ -726,9 +2523,17 @@ class MachineMotion :
 
         reply = self.myGCode.__emit__("M410")
 
-        if ( "echo" in reply and "ok" in reply ) : pass
+        if ( reply.isOk ) : pass
         else : raise Exception('Error in gCode execution')
 
+        self.__isBatchAborted = True
+        self.__discardBufferedMoves()
+        self.invalidateModalState()
+        self.__forgetMotionPrediction([1, 2, 3])
+        self.__resetMotionPrediction()
+        self.__encoderRestPositions = {}
+        self.myMotionCompletionPoller.interrupt()
+
         # Wait to insure that other commands after the emit stop are not flushed.
         time.sleep(0.800) # 300 ms is the minimum allowable command
 
@@ -740,11 +2545,16 @@ class MachineMotion :
         exampleCodePath: emitHomeAll.py
         '''
 
-        reply = self.myGCode.__emit__("G28")
+        reply = self.__emitPositionCommand("G28")
 
-        if ( "echo" in reply and "ok" in reply ) : pass
+        if ( reply.isOk ) : pass
         else : raise Exception('Error in gCode execution')
 
+        # The duration of homing cannot be predicted, but every axis ends up at 0
+        self.__forgetMotionPrediction()
+        self.__commandedPositions = { 1 : 0.0, 2 : 0.0, 3 : 0.0 }
+        self.__positionSequence += 1
+
         return
 
     def emitHome(self, axis):
@@ -759,11 +2569,16 @@ class MachineMotion :
         '''
         self._restrictInputValue("axis", axis, AXIS_NUMBER)
 
-        reply = self.myGCode.__emit__("G28 " + self.myGCode.__getTrueAxis__(axis))
+        reply = self.__emitPositionCommand(GCodeBuilder.home(axis))
 
-        if ( "echo" in reply and "ok" in reply ) : pass
+        if ( reply.isOk ) : pass
         else : raise Exception('Error in gCode execution')
 
+        # The duration of homing cannot be predicted, but the axis ends up at 0
+        self.__forgetMotionPrediction()
+        self.__commandedPositions[axis] = 0.0
+        self.__positionSequence += 1
+
         return
 
     def emitSpeed(self, speed, units = UNITS_SPEED.mm_per_sec):
@@ -787,10 +2602,7 @@ class MachineMotion :
         elif units == UNITS_SPEED.mm_per_sec:
             speed_mm_per_min = 60*speed
 
-        reply = self.myGCode.__emit__("G0 F" +str(speed_mm_per_min))
-
-        if ( "echo" in reply and "ok" in reply ) : pass
-        else : raise Exception('Error in gCode execution')
+        self.__emitModal("feedrate", speed_mm_per_min, GCodeBuilder.feedrate(speed_mm_per_min))
 
         return
 
@@ -816,10 +2628,7 @@ class MachineMotion :
         elif units == UNITS_ACCEL.mm_per_min_sqr:
             accel_mm_per_sec_sqr = acceleration/3600
 
-        reply = self.myGCode.__emit__("M204 T" + str(accel_mm_per_sec_sqr))
-
-        if ( "echo" in reply and "ok" in reply ) : pass
-        else : raise Exception('Error in gCode execution')
+        self.__emitModal("acceleration", accel_mm_per_sec_sqr, GCodeBuilder.acceleration(accel_mm_per_sec_sqr))
 
         return
 
@@ -838,20 +2647,19 @@ class MachineMotion :
         '''
         self._restrictInputValue("axis", axis, AXIS_NUMBER)
 
-        # Set to absolute motion mode
-        reply = self.myGCode.__emit__("G90")
-
-        if ( "echo" in reply and "ok" in reply ) :
-
-            # Transmit move command
-            reply = self.myGCode.__emit__("G0 " + self.myGCode.__getTrueAxis__(axis) + str(position))
+        if self.__bufferMoves({ axis : position }, False) : return
 
-            if ( "echo" in reply and "ok" in reply ) : pass
+        # Set to absolute motion mode
+        self.__emitModal("positioning", "G90", "G90")
 
-            else : raise Exception('Error in gCode execution')
+        # Transmit move command
+        reply = self.__emitPositionCommand(GCodeBuilder.move(axis, position))
 
+        if ( reply.isOk ) : pass
         else : raise Exception('Error in gCode execution')
 
+        self.__recordMove({ axis : position }, False)
+
         return
 
     def emitCombinedAxesAbsoluteMove(self, axes, positions):
@@ -874,22 +2682,19 @@ class MachineMotion :
         for axis in axes:
             self._restrictInputValue("axis", axis, AXIS_NUMBER)
 
-        # Set to absolute motion mode
-        reply = self.myGCode.__emit__("G90")
-
-        if ( "echo" in reply and "ok" in reply ) :
-            # Transmit move command
-            command = "G0 "
-            for axis, position in zip(axes, positions):
-                command += self.myGCode.__getTrueAxis__(axis) + str(position) + " "
+        if self.__bufferMoves(dict(zip(axes, positions)), False) : return
 
-            reply = self.myGCode.__emit__(command)
+        # Set to absolute motion mode
+        self.__emitModal("positioning", "G90", "G90")
 
-            if ( "echo" in reply and "ok" in reply ) : pass
-            else : raise Exception('Error in gCode execution')
+        # Transmit move command
+        reply = self.__emitPositionCommand(GCodeBuilder.combinedMove(axes, positions))
 
+        if ( reply.isOk ) : pass
         else : raise Exception('Error in gCode execution')
 
+        self.__recordMove(dict(zip(axes, positions)), False)
+
         return
 
     def emitRelativeMove(self, axis, direction, distance):
@@ -911,24 +2716,20 @@ class MachineMotion :
         self._restrictInputValue("axis",axis, AXIS_NUMBER)
         self._restrictInputValue("direction", direction, DIRECTION)
 
-        # Set to relative motion mode
-        reply = self.myGCode.__emit__("G91")
-
-        if ( "echo" in reply and "ok" in reply ) :
+        distance = GCodeBuilder.signedDistance(direction, distance)
+        if self.__bufferMoves({ axis : distance }, True) : return
 
-            if direction == DIRECTION.POSITIVE :
-                distance = "" + str(distance)
-            elif direction  == DIRECTION.NEGATIVE :
-                distance = "-" + str(distance)
-
-            # Transmit move command
-            reply = self.myGCode.__emit__("G0 " + self.myGCode.__getTrueAxis__(axis) + str(distance))
+        # Set to relative motion mode
+        self.__emitModal("positioning", "G91", "G91")
 
-            if ( "echo" in reply and "ok" in reply ) : pass
-            else : raise Exception('Error in gCode execution')
+        # Transmit move command
+        reply = self.__emitPositionCommand(GCodeBuilder.move(axis, distance))
 
+        if ( reply.isOk ) : pass
         else : raise Exception('Error in gCode execution')
 
+        self.__recordMove({ axis : distance }, True)
+
         return
 
     def emitCombinedAxisRelativeMove(self, axes, directions, distances):
@@ -951,26 +2752,24 @@ class MachineMotion :
         if (not isinstance(axes, list) or not isinstance(directions, list) or not isinstance(distances, list)):
             raise TypeError("Axes, Postions and Distances must be lists")
 
-        # Set to relative motion mode
-        reply = self.myGCode.__emit__("G91")
+        for axis, direction in zip(axes, directions):
+            self._restrictInputValue("axis", axis, AXIS_NUMBER)
+            self._restrictInputValue("direction", direction, DIRECTION)
 
-        if ( "echo" in reply and "ok" in reply ) :
-            # Transmit move command
-            command = "G0 "
-            for axis, direction, distance in zip(axes, directions, distances):
-                if direction == DIRECTION.POSITIVE :
-                    distance = "" + str(distance)
-                elif direction  == DIRECTION.NEGATIVE :
-                    distance = "-" + str(distance)
-                command += self.myGCode.__getTrueAxis__(axis) + str(distance) + " "
+        distances = [GCodeBuilder.signedDistance(direction, distance) for direction, distance in zip(directions, distances)]
+        if self.__bufferMoves(dict(zip(axes, distances)), True) : return
 
-            reply = self.myGCode.__emit__(command)
+        # Set to relative motion mode
+        self.__emitModal("positioning", "G91", "G91")
 
-            if ( "echo" in reply and "ok" in reply ) : pass
-            else : raise Exception('Error in gCode execution')
+        # Transmit move command
+        reply = self.__emitPositionCommand(GCodeBuilder.combinedMove(axes, distances))
 
+        if ( reply.isOk ) : pass
         else : raise Exception('Error in gCode execution')
 
+        self.__recordMove(dict(zip(axes, distances)), True)
+
         return
 
     def setPosition(self, axis, position):
@@ -988,30 +2787,210 @@ class MachineMotion :
         self._restrictInputValue("axis", axis, AXIS_NUMBER)
 
         # Transmit move command
-        reply = self.myGCode.__emit__("G92 " + self.myGCode.__getTrueAxis__(axis) + str(position))
+        reply = self.__emitPositionCommand(GCodeBuilder.setPosition(axis, position))
 
-        if ( "echo" in reply and "ok" in reply ) : pass
+        if ( reply.isOk ) : pass
         else : raise Exception('Error in gCode execution')
 
-    def emitgCode(self, gCode):
+        try:
+            self.__commandedPositions[axis] = float(position)
+        except (TypeError, ValueError):
+            self.__commandedPositions[axis] = None
+        self.__positionSequence += 1
+
+    def emitgCode(self, gCode, deadline = None):
         '''
         desc: Executes raw gCode on the controller.
         params:
             gCode:
                 desc: The g-code that will be passed directly to the controller.
                 type: string
+            deadline:
+                desc: Seconds after which ControllerUnavailable is raised if the controller did not reply. Defaults to the deadline set with configConnectionRetries.
+                type: Number
         note: All movement commands sent to the controller are by default in mm.
         exampleCodePath: emitgCode.py
 
         '''
 
-        reply = self.myGCode.__emit__(gCode)
+        reply = self.__emit(gCode, deadline)
 
-        if ( "echo" in reply and "ok" in reply ) : pass
+        # Raw G-code may change the modal state behind our back
+        words = gCode.split()
+        if len(words) > 0 and (words[0] in MODAL_GCODES or (words[0] in ("G0", "G1") and any(word.startswith("F") for word in words))) :
+            self.invalidateModalState()
+        if len(words) > 0 and words[0].startswith("G") :
+            self.__forgetMotionPrediction([1, 2, 3])
+
+        if ( reply.isOk ) : pass
         else : raise Exception('Error in gCode execution (reply: %s)' % reply)
 
         return
 
+    def emitgCodes(self, gCodes, deadline = None):
+        '''
+        desc: Executes several raw gCode commands on the controller, in order. With a pipelined transport (see configTransport), they are all sent before waiting for the first reply.
+        params:
+            gCodes:
+                desc: The g-code commands that will be passed directly to the controller.
+                type: List of Strings
+            deadline:
+                desc: Seconds after which ControllerUnavailable is raised if the controller did not reply. Defaults to the deadline set with configConnectionRetries, or to the timeout of the transport.
+                type: Number
+        note: Every command is sent even if an earlier one fails; an exception is raised afterwards if any of them was not acknowledged.
+        '''
+        gCodes = list(gCodes)
+        if len(gCodes) == 0 :
+            return
+
+        if len(self.__bufferedMoves) > 0 :
+            self.flushMoves()
+        replies = self.myGCode.__emitMany__(gCodes, deadline)
+
+        # Raw G-code may change the modal state behind our back
+        self.invalidateModalState()
+        if any(gCode.split(" ", 1)[0].startswith("G") for gCode in gCodes) :
+            self.__forgetMotionPrediction([1, 2, 3])
+
+        for gCode, reply in zip(gCodes, replies) :
+            if ( reply.isOk ) : pass
+            else : raise Exception('Error in gCode execution of %s (reply: %s)' % (gCode, reply))
+
+        return
+
+    def configTransport(self, transport):
+        '''
+        desc: Selects how G-code commands are carried to the controller.
+        params:
+            transport:
+                desc: An HTTPTransport (one request per command, the default), a PipelinedHTTPTransport (several requests in flight on one connection, used by emitgCodes), a LoopbackTransport (no controller, for tests) or any GCodeTransport. None restores the default.
+                type: GCodeTransport
+        note: Stop commands are still sent on the priority HTTP connection, except with transports that do not talk to a controller. Run "python3 benchmark.py transports" to compare the transports.
+        '''
+        if self.__transport is not None and self.__transport is not transport :
+            self.__transport.close()
+        if self.__streamTransport is not None :
+            self.__streamTransport.close()
+            self.__streamTransport = None
+
+        self.__transport = transport
+        self.myGCode.myTransport = HTTPTransport(self.IP + self.myGCode.libPort) if transport is None else transport
+        self.invalidateModalState()
+
+    def createProgram(self):
+        '''
+        desc: Creates an empty G-code program. Moves, speed and acceleration changes and dwells added to the program are sent to the controller in a single stream by emitProgram.
+        returnValue: The program, whose methods (speed, acceleration, absoluteMove, combinedAbsoluteMove, relativeMove, combinedRelativeMove, home, dwell, gCode, repeat) can be chained.
+        returnValueType: GCodeProgram
+        '''
+        return GCodeProgram(self)
+
+    def emitProgram(self, program, onProgress = None):
+        '''
+        desc: Streams a program built with createProgram to the controller.
+        params:
+            program:
+                desc: The program to run.
+                type: GCodeProgram
+            onProgress:
+                desc: Function called with the index and the text of each line once the controller accepted it.
+                type: function
+        returnValue: True if the whole program was sent, False if it was aborted by emitStop or an E-stop.
+        returnValueType: Boolean
+        note: This function returns once the last line is queued on the controller. Use waitForMotionCompletion to wait for the end of the motion.
+        '''
+        def onDataReceived(data) :
+            if onProgress is not None :
+                for item in data :
+                    onProgress(item["index"], item["line"])
+
+        return self.emitgCodeBatch(program.compile(), onDataReceived)
+
+    def emitgCodeBatch(self, gCodeList, onDataReceived = None, onKillFuncReceived = None):
+        '''
+        desc: Streams a list of G-code lines to the controller. Lines are numbered and checksummed, and lines that the controller asks for are resent. Up to BATCH_WINDOW_SIZE lines are sent before waiting for their replies, pipelined on a single connection unless another transport was selected with configTransport.
+        params:
+            gCodeList:
+                desc: The G-code lines to send.
+                type: List of Strings
+            onDataReceived:
+                desc: Function called with [{ "index": index, "line": line }] once the controller accepted each line.
+                type: function
+            onKillFuncReceived:
+                desc: Function called without arguments if the stream is aborted by emitStop or an E-stop.
+                type: function
+        returnValue: True if every line was sent, False if the stream was aborted.
+        returnValueType: Boolean
+        '''
+        self.__isBatchAborted = False
+
+        # Restart line numbering on the controller
+        reply = self.__emit("M110 N0")
+
+        if ( reply.isOk ) : pass
+        else : raise Exception('Error in gCode execution')
+
+        # Moves are queued on the controller: nothing is known about its state until the program is over
+        self.invalidateModalState()
+        self.__forgetMotionPrediction([1, 2, 3])
+
+        def isAborted() :
+            if self.__isBatchAborted or self.__isEstopped :
+                if onKillFuncReceived is not None :
+                    onKillFuncReceived()
+                return True
+            return False
+
+        transport = self.__getStreamTransport()
+        resendCount = 0
+        index = 0
+        while index < len(gCodeList) :
+            if isAborted() :
+                return False
+
+            window = gCodeList[index : index + MachineMotion.BATCH_WINDOW_SIZE]
+            lines = [self.myGCode.__numberLine__(gCode, index + offset + 1) for offset, gCode in enumerate(window)]
+            replies = self.myGCode.__emitMany__(lines, None, transport)
+
+            for offset, reply in enumerate(replies) :
+                # The lines of the window already sent are dropped by the stop that aborted the stream
+                if isAborted() :
+                    return False
+
+                lineIndex = index + offset
+
+                # The controller drops every line after the one it asks for: the rest of the window is sent again
+                resendLine = self.myGCode.__getResendLine__(reply)
+                if resendLine is not None :
+                    resendCount += 1
+                    if resendCount > MachineMotion.MAX_BATCH_RESENDS or resendLine < 1 or resendLine > lineIndex + 1 :
+                        raise Exception('Error in gCode execution (line %d could not be resent, reply: %s)' % (resendLine, reply))
+                    logging.warning("Controller requested to resend line %d" % resendLine)
+                    index = resendLine - 1
+                    break
+
+                if ( reply.isOk ) : pass
+                else : raise Exception('Error in gCode execution (line %d, reply: %s)' % (lineIndex + 1, reply))
+
+                if onDataReceived is not None :
+                    onDataReceived([ { "index": lineIndex, "line": gCodeList[lineIndex] } ])
+            else :
+                index += len(replies)
+
+        return True
+
+    # ------------------------------------------------------------------------
+    # Returns the transport streaming batches: the selected one, or a pipelined connection in place of plain HTTP requests
+    def __getStreamTransport(self) :
+        transport = self.myGCode.myTransport
+        if not isinstance(transport, HTTPTransport) :
+            return transport
+        if self.__streamTransport is None or self.__streamTransport.host != transport.host :
+            if self.__streamTransport is not None :
+                self.__streamTransport.close()
+            self.__streamTransport = PipelinedHTTPTransport(transport.host, maxInFlight=MachineMotion.BATCH_WINDOW_SIZE)
+        return self.__streamTransport
+
     def configAxisDirection(self, axis, direction):
         '''
         desc: Configures a single axis to operate in either clockwise (normal) or counterclockwise (reverse) mode. Refer to the Automation System Diagram for the correct axis setting.
@@ -1033,12 +3012,11 @@ class MachineMotion :
         self.direction[axis] = direction
 
         if(direction == DIRECTION.NORMAL):
-            reply = self.myGCode.__emit__("M92 " + self.myGCode.__getTrueAxis__(axis) + str(self.steps_mm[axis]))
+            steps_mm = str(self.steps_mm[axis])
         elif (direction == DIRECTION.REVERSE):
-            reply = self.myGCode.__emit__("M92 " + self.myGCode.__getTrueAxis__(axis) + "-"+ str(self.steps_mm[axis]))
+            steps_mm = "-"+ str(self.steps_mm[axis])
 
-        if ( "echo" in reply and "ok" in reply ) : pass
-        else : raise Exception('Error in gCode execution')
+        self.__emitStepsPerMm(axis, steps_mm)
 
         return
 
@@ -1050,6 +3028,61 @@ class MachineMotion :
         return True
         #return self.myGCode.__isReady__()
 
+    def getConnectionPoolStats(self):
+        '''
+        desc: Returns the counters of the keep-alive connection pool used to send G-code to the controller.
+        returnValue: A dictionary with the pool "hits" (reused connections), "misses" (newly opened connections), "reconnects" (stale connections replaced), "successes", "retries", "timeouts" (requests abandoned at their deadline), "rejected" (requests failed fast by the circuit breaker), "openConnections" and the "circuitBreaker" state and counters.
+        returnValueType: Dictionary
+        '''
+        return self.myGCode.myConnectionPool.getStats()
+
+    def configConnectionRetries(self, deadline = False, initialDelay = None, maxDelay = None, multiplier = None, jitter = None, failureThreshold = None, probeInterval = None):
+        '''
+        desc: Configures how requests to an unreachable controller are retried. Parameters left out keep their current value.
+        params:
+            deadline:
+                desc: Seconds after which a request that got no reply raises ControllerUnavailable, or None to retry without limit.
+                type: Number
+            initialDelay:
+                desc: Seconds to wait after the first failed attempt.
+                type: Number
+            maxDelay:
+                desc: Longest wait between two attempts, in seconds.
+                type: Number
+            multiplier:
+                desc: Factor applied to the wait after each failed attempt.
+                type: Number
+            jitter:
+                desc: Largest random fraction removed from each wait, between 0 and 1.
+                type: Number
+            failureThreshold:
+                desc: Number of consecutive failed attempts after which requests fail fast until the controller answers again.
+                type: Number
+            probeInterval:
+                desc: Seconds between two background checks of an unreachable controller.
+                type: Number
+        note: The settings are shared by every MachineMotion instance connected to the same controller. Stop commands are sent on a dedicated connection and are not failed fast.
+        '''
+        lPool = self.myGCode.myConnectionPool
+        if deadline is not False : lPool.retryPolicy.deadline = deadline
+        if initialDelay is not None : lPool.retryPolicy.initialDelay = initialDelay
+        if maxDelay is not None : lPool.retryPolicy.maxDelay = maxDelay
+        if multiplier is not None : lPool.retryPolicy.multiplier = multiplier
+        if jitter is not None : lPool.retryPolicy.jitter = jitter
+        if failureThreshold is not None : lPool.circuitBreaker.failureThreshold = failureThreshold
+        if probeInterval is not None : lPool.circuitBreaker.probeInterval = probeInterval
+
+    def getStopLatencyStats(self):
+        '''
+        desc: Returns how long the recent stop commands took from the request to the acknowledgement of the controller.
+        returnValue: A dictionary with the "count", "last", "mean" and "max" latencies in seconds, and the "requests" and "reconnects" counters of the priority connection.
+        returnValueType: Dictionary
+        note: Stop commands are sent on a dedicated, pre-opened connection that never waits behind other G-code traffic.
+        '''
+        stats = MotionCompletionPoller.summarize(self.myGCode.myPriorityConnection.latencies)
+        stats.update(self.myGCode.myPriorityConnection.getStats())
+        return stats
+
     def isMotionCompleted(self):
         '''
         desc: Indicates if the last move command has completed.
@@ -1058,39 +3091,176 @@ class MachineMotion :
         '''
 
         #Sending gCode V0 command to
-        reply = self.myGCode.__emit__("V0")
+        reply = self.__emit("V0")
 
         #Check if not error message
-        if ( "echo" in reply and "ok" in reply ) :
-            if ("COMPLETED" in reply) : return True
-            else : return False
+        if ( reply.isOk ) :
+            return reply.isMotionCompleted()
         else : raise Exception('Error in gCode execution')
 
         return
 
-    def waitForMotionCompletion(self):
+    def waitForMotionCompletion(self, timeout = None):
         '''
         desc: Pauses python program execution until machine has finished its current movement.
+        params:
+            timeout:
+                desc: Maximum number of seconds to wait. MotionCompletionTimeout is raised when it expires.
+                defaultValue: None (wait forever)
+                type: Number
+        returnValue: True if the motion completed, False if the wait was interrupted by emitStop.
+        returnValueType: Boolean
         exampleCodePath: waitForMotionCompletion.py
 
         '''
-        #Sending gCode V0 command to
-        reply = self.myGCode.__emit__("V0")
+        self.flushMoves()
+
+        predictedEnd, pollAfter = None, None
+        if self.predictionEnabled and self.__isMotionPredictable and self.__predictedMotionEnd is not None:
+            predictedEnd = self.__predictedMotionEnd
+            guard = max(self.predictionGuardTime, self.predictionGuardRatio * (predictedEnd - self.__predictedMotionStart))
+            pollAfter = predictedEnd - guard
+
+        # When encoders can confirm the motion, only poll if they have not settled well after the expected end
+        isSettled = self.__getEncoderSettledCheck()
+        if isSettled is not None:
+            pollAfter = (time.time() if predictedEnd is None else predictedEnd) + self.encoderFallbackDelay
+
+        isCompleted = self.myMotionCompletionPoller.wait(timeout, predictedEnd, pollAfter, isSettled)
+        if isCompleted:
+            # The stable position of an encoder may be published after the controller reports completion
+            for axis, target in self.__encoderTargets.items():
+                if target is None:
+                    self.__encoderRestPositions.pop(axis, None)
+                else:
+                    self.__encoderRestPositions[axis] = target
+            self.__resetMotionPrediction()
 
-        #Check if not error message
-        if ( "echo" in reply and "ok" in reply ) :
+        return isCompleted
 
-            #Recursively calls the function until motion is completed
-            if ("COMPLETED" in reply) : return
-            else :
-                print( "Motion not completed : " + str(self.IP))
-                time.sleep(0.5)
-                return self.waitForMotionCompletion()
+    def configMotionCompletion(self, pollInterval = None, maxPollInterval = None, backoff = None, strategy = None, encoderFallbackDelay = None):
+        '''
+        desc: Configures how often the controller is polled while waiting for motion completion.
+        params:
+            pollInterval:
+                desc: Delay between the first polls, in seconds.
+                defaultValue: 0.05
+                type: Number
+            maxPollInterval:
+                desc: Upper bound of the delay between polls, in seconds.
+                defaultValue: 0.25
+                type: Number
+            backoff:
+                desc: Factor applied to the delay after each poll that finds the machine still moving.
+                defaultValue: 1.5
+                type: Number
+            strategy:
+                desc: Either COMPLETION_STRATEGY.polling or COMPLETION_STRATEGY.encoder. With the encoder strategy, a motion whose axes all have an encoder (see configAxisEncoder) completes when every encoder settles at its target, without polling the controller.
+                defaultValue: COMPLETION_STRATEGY.polling
+                type: String
+            encoderFallbackDelay:
+                desc: With the encoder strategy, number of seconds after the predicted end of motion (or after the start of the wait, if it is not predicted) before the controller is polled anyway.
+                defaultValue: 0.5
+                type: Number
+        '''
+        if strategy is not None :
+            self._restrictInputValue("strategy", strategy, COMPLETION_STRATEGY)
+            self.completionStrategy = strategy
+        if encoderFallbackDelay is not None : self.encoderFallbackDelay = encoderFallbackDelay
+        self.myMotionCompletionPoller.configure(pollInterval, maxPollInterval, backoff)
 
-        else : raise Exception('Error in gCode execution')
+        return
+
+    def configAxisEncoder(self, axis, encoder, tolerance = 1.0, countsPerTurn = 3600, reverse = False):
+        '''
+        desc: Associates an encoder with an axis, so that its motion can be confirmed by the encoder when the completion strategy is COMPLETION_STRATEGY.encoder.
+        params:
+            axis:
+                desc: The axis the encoder is mounted on.
+                type: Number
+            encoder:
+                desc: The identifier of the encoder.
+                type: Integer
+            tolerance:
+                desc: Maximum distance between the settled encoder position and the target, in mm.
+                defaultValue: 1.0
+                type: Number
+            countsPerTurn:
+                desc: Encoder counts per revolution of the motor.
+                defaultValue: 3600
+                type: Integer
+            reverse:
+                desc: Set to True if the encoder counts down when the axis moves in the positive direction.
+                defaultValue: False
+                type: Boolean
+        note: configAxis must be called first, since the mechanical gain of the axis converts mm to encoder counts.
+        '''
+        self._restrictInputValue("axis", axis, AXIS_NUMBER)
+        if (not self.isEncoderIdValid(encoder)):
+            raise Exception('unexpected encoder identifier: encoderId= ' + str(encoder))
+        if self.mech_gain[axis] == "notInitialized":
+            raise Exception('configAxis must be called for axis ' + str(axis) + ' before configAxisEncoder')
+
+        self.__axisEncoders[axis] = {
+            "encoder"       : encoder,
+            "tolerance"     : float(tolerance) / self.mech_gain[axis] * countsPerTurn,
+            "countsPerTurn" : countsPerTurn,
+            "reverse"       : reverse,
+            "issuedAt"      : 0
+        }
+
+        return
+
+    def configMotionPrediction(self, enabled = None, guardTime = None, guardRatio = None, fastPollInterval = None, scale = None):
+        '''
+        desc: Configures how waitForMotionCompletion uses the predicted duration of moves. The duration is computed from the commanded distance, the last speed and acceleration sent and the steps/mm of each axis, assuming a trapezoidal speed profile.
+        params:
+            enabled:
+                desc: When False, the controller is polled from the start of the wait.
+                defaultValue: True
+                type: Boolean
+            guardTime:
+                desc: Minimum number of seconds before the predicted end at which polling starts.
+                defaultValue: 0.05
+                type: Number
+            guardRatio:
+                desc: Fraction of the predicted duration before the predicted end at which polling starts, when longer than guardTime.
+                defaultValue: 0.1
+                type: Number
+            fastPollInterval:
+                desc: Delay between the polls issued near the predicted end, in seconds.
+                defaultValue: 0.02
+                type: Number
+            scale:
+                desc: Calibration factor applied to predicted durations. See getMotionPredictionStats.
+                defaultValue: 1.0
+                type: Number
+        note: Moves whose duration cannot be predicted (homing, raw G-code, continuous moves, absolute moves from an unknown position) fall back to regular polling.
+        '''
+        if enabled is not None : self.predictionEnabled = enabled
+        if guardTime is not None : self.predictionGuardTime = guardTime
+        if guardRatio is not None : self.predictionGuardRatio = guardRatio
+        if scale is not None : self.predictionScale = scale
+        self.myMotionCompletionPoller.configure(fastPollInterval = fastPollInterval)
 
         return
 
+    def getMotionPredictionStats(self):
+        '''
+        desc: Returns the difference between the time at which completion was observed and the predicted end of motion, for recent predicted waits.
+        returnValue: A dictionary with the "count" of recorded errors, the "last", "mean" and "max" errors and the "meanAbsolute" error, in seconds. Positive errors mean that motion ended later than predicted.
+        returnValueType: Dictionary
+        '''
+        return self.myMotionCompletionPoller.getPredictionStats()
+
+    def getMotionCompletionStats(self):
+        '''
+        desc: Returns how long the recent calls to waitForMotionCompletion lasted.
+        returnValue: A dictionary with the "count" of recorded waits and the "last", "mean" and "max" durations in seconds.
+        returnValueType: Dictionary
+        '''
+        return self.myMotionCompletionPoller.getStats()
+
     def configMachineMotionIp(self, mode = None, machineIp = None, machineNetmask = None, machineGateway = None):
         '''
         desc: Set up the required network information for the Machine Motion controller. The router can be configured in either DHCP mode or static mode.
@@ -1176,9 +3346,9 @@ class MachineMotion :
 
             gCodeCommand = gCodeCommand + " " + self.myGCode.__getTrueAxis__(axis) + str(speed_mm_per_min)
 
-        reply = self.myGCode.__emit__(gCodeCommand)
+        reply = self.__emit(gCodeCommand)
 
-        if ( "echo" in reply and "ok" in reply ) : pass
+        if ( reply.isOk ) : pass
         else : raise Exception('Error in gCode execution')
 
         return
@@ -1217,9 +3387,9 @@ class MachineMotion :
             gCodeCommand = gCodeCommand + " " + self.myGCode.__getTrueAxis__(axis) + str(min_speed_mm_per_min) + ":" + str(max_speed_mm_per_min)
 
 
-        reply = self.myGCode.__emit__(gCodeCommand)
+        reply = self.__emit(gCodeCommand)
 
-        if ( "echo" in reply and "ok" in reply ) : pass
+        if ( reply.isOk ) : pass
         else : raise Exception('Error in gCode execution')
 
         return
@@ -1249,13 +3419,67 @@ class MachineMotion :
         self.mech_gain[axis] = float(mechGain)
 
         self.steps_mm[axis] = STEPPER_MOTOR.steps_per_turn * self.u_step[axis] / self.mech_gain[axis]
-        reply = self.myGCode.__emit__("M92 " + self.myGCode.__getTrueAxis__(axis) + str(self.steps_mm[axis]))
-
-        if ( "echo" in reply and "ok" in reply ) : pass
-        else : raise Exception('Error in gCode execution')
+        self.__emitStepsPerMm(axis, str(self.steps_mm[axis]))
 
         return
 
+    def configAxisConfigurationCache(self, path):
+        '''
+        desc: Remembers the steps/mm pushed by configAxis and configAxisDirection in a local file, so that later runs skip sending the configuration that the controller still has.
+        params:
+            path:
+                desc: Path of the cache file, shared by every controller. None disables the cache.
+                type: String
+        note: Call this before configAxis. The first configuration call of a run reads the steps/mm of the controller back with M503, and only trusts the cached values if they match the readback; otherwise everything is sent again.
+        '''
+        self.__axisConfigurationCache = None if path is None else AxisConfigurationCache(path)
+        self.__pushedStepsMm = None
+
+    # ------------------------------------------------------------------------
+    # Sets the steps/mm of an axis, unless the controller is known to use them already.
+    #
+    # @param {int} axis         - Axis to configure
+    # @param {str} steps_mm     - Signed steps/mm, as sent with M92
+    def __emitStepsPerMm(self, axis, steps_mm) :
+        if self.__axisConfigurationCache is not None and self.__pushedStepsMm is None :
+            self.__pushedStepsMm = self.__loadAxisConfiguration()
+
+        self.__emitModal("steps_mm", steps_mm, GCodeBuilder.stepsPerMm(axis, steps_mm), axis)
+
+        if self.__pushedStepsMm is not None and self.__pushedStepsMm.get(axis) != steps_mm :
+            self.__pushedStepsMm[axis] = steps_mm
+            self.__axisConfigurationCache.store(self.IP, self.__pushedStepsMm)
+
+    # ------------------------------------------------------------------------
+    # Loads the cached steps/mm of the controller and, if M503 confirms that the controller still
+    # uses them, marks them as already sent.
+    #
+    # @return {dict} - Steps/mm that are known to be pushed to each axis
+    def __loadAxisConfiguration(self) :
+        cached = self.__axisConfigurationCache.load(self.IP)
+        if cached is None :
+            return {}
+
+        try :
+            reply = self.__emit("M503")
+            reported = reply.getStepsPerMm()
+        except Exception :
+            logging.warning("Could not read the axis configuration back, sending it again: %s" % traceback.format_exc())
+            return {}
+
+        for axis, steps_mm in cached.items() :
+            try :
+                matches = abs(float(steps_mm) - reported[axis]) <= AXIS_CONFIGURATION_TOLERANCE
+            except (KeyError, ValueError) :
+                matches = False
+            if not matches :
+                logging.info("The axis configuration of %s changed since it was cached, sending it again" % self.IP)
+                return {}
+
+        for axis, steps_mm in cached.items() :
+            self.__modalState["steps_mm"][axis] = steps_mm
+        return cached
+
     def saveData(self, key, data) :
         '''
         desc: Saves/persists data within the MachineMotion Controller in key - data pairs.
@@ -1275,6 +3499,10 @@ class MachineMotion :
         dataPack["fileName"] = key
         dataPack["data"] = data
 
+        if self.dataCache is not None :
+            self.dataCache.set(key, data)
+            return
+
         # Send the request to MachineMotion
         HTTPSend(self.IP + ":8000", "/saveData", json.dumps(dataPack))
         time.sleep(0.05)
@@ -1295,10 +3523,70 @@ class MachineMotion :
         returnValue: A dictionary containing the saved data.
         returnValueType: Dictionary
         '''
+        if self.dataCache is not None :
+            callback(self.dataCache.get(key))
+            return
+
         callback(HTTPSend(self.IP + ":8000", "/getData", key))
 
         return
 
+    def configDataCache(self, durability = DATA_DURABILITY.write_behind, flushInterval = 1.0):
+        '''
+        desc: Serves getData from memory and coalesces saveData writes, which are then sent to the controller according to the durability policy.
+        params:
+            durability:
+                desc: When writes are sent. DATA_DURABILITY.write_through sends each write before saveData returns, DATA_DURABILITY.write_behind sends them in the background flushInterval seconds after the first unsent write, and DATA_DURABILITY.manual only sends them on flushData. None disables the cache, after flushing it.
+                defaultValue: DATA_DURABILITY.write_behind
+                type: String
+            flushInterval:
+                desc: Seconds during which writes are collected before being sent, in write-behind mode.
+                defaultValue: 1.0
+                type: Number
+        note: The cache assumes that this MachineMotion is the only writer of its keys. While it is enabled, getData passes the callback the data given to saveData, decoded from the reply of the controller when it is not in memory, instead of the raw reply. Unsent writes are lost if the program is killed; they are flushed on a normal exit. The counters of the cache (reads, hits, writes, coalesced, sent, failures) are available on dataCache.
+        '''
+        if durability is None :
+            if self.dataCache is not None :
+                self.dataCache.close()
+            self.dataCache = None
+            return
+
+        self._restrictInputValue("durability", durability, DATA_DURABILITY)
+
+        if self.dataCache is None :
+            def store(key, data) :
+                HTTPSend(self.IP + ":8000", "/saveData", json.dumps({ "fileName" : key, "data" : data }))
+            def fetch(key) :
+                # Cache the data as saveData was given it, not the raw reply
+                reply = HTTPRequest(self.IP + ":8000", "/getData", key).decode("utf-8")
+                try :
+                    pack = json.loads(reply)
+                except ValueError :
+                    return reply
+                if isinstance(pack, dict) and "data" in pack :
+                    return pack["data"]
+                return pack
+            self.dataCache = DataCache(store, fetch, durability, flushInterval)
+        else :
+            self.dataCache.flush()
+            self.dataCache.durability = durability
+            self.dataCache.flushInterval = flushInterval
+
+    def flushData(self, raiseOnError = False):
+        '''
+        desc: Sends the writes held by the data cache to the controller. Does nothing if the data cache is disabled.
+        params:
+            raiseOnError:
+                desc: Raise the error of the first failed write instead of keeping it for the next flush.
+                defaultValue: False
+                type: Boolean
+        returnValue: True if every write was sent.
+        returnValueType: Boolean
+        '''
+        if self.dataCache is None :
+            return True
+        return self.dataCache.flush(raiseOnError)
+
     # ------------------------------------------------------------------------
     # Determines if the io-expander with the given id is available
     #
@@ -1384,10 +3672,48 @@ class MachineMotion :
         if ( not self.isIoExpanderOutputIdValid( deviceNetworkId, pin ) ):
             logging.warning("DEBUG: unexpected digitalOutput parameters: device= " + str(deviceNetworkId) + " pin= " + str(pin))
             return
-        resp = self.myMqttClient.publish('devices/io-expander/' + str(deviceNetworkId) + '/digital-output/' +  str(pin), '1' if value else '0', retain=True)
+        self.__publish('devices/io-expander/' + str(deviceNetworkId) + '/digital-output/' +  str(pin), '1' if value else '0', retain=True)
 
         return
 
+    def digitalWriteMany(self, writes, timeout=1.0) :
+        '''
+        desc: Sets several digital output pins, on one or more IO modules, with a single call. The pins are written in the given order.
+        params:
+            writes:
+                desc: The pins to write, as (deviceNetworkId, pin, value) tuples. See digitalWrite for the meaning of each field.
+                type: List
+            timeout:
+                desc: The maximum time in seconds to wait for the writes to be handed to the network.
+                type: Number
+        returnValue: The time in seconds from the first write until the last one was handed to the network, or None if a write was invalid.
+        returnValueType: Number
+        note: No pin is written if any of the writes is invalid. The latency is also recorded by getLatencyStats as "MQTT digital-output batch".
+
+        '''
+
+        for (deviceNetworkId, pin, value) in writes :
+            if ( not self.isIoExpanderOutputIdValid( deviceNetworkId, pin ) ):
+                logging.warning("DEBUG: unexpected digitalOutput parameters: device= " + str(deviceNetworkId) + " pin= " + str(pin))
+                return None
+
+        startTime = time.time()
+        lastMessage = None
+        for (deviceNetworkId, pin, value) in writes :
+            lastMessage = self.__publish('devices/io-expander/' + str(deviceNetworkId) + '/digital-output/' +  str(pin), '1' if value else '0', retain=True)
+
+        # QoS 0 messages are published once written to the socket. Disconnected writes never are, hence the timeout.
+        if ( lastMessage is not None and lastMessage.rc == mqtt.MQTT_ERR_SUCCESS ) :
+            deadline = startTime + timeout
+            while ( not lastMessage.is_published() and time.time() < deadline ) :
+                time.sleep(0.001)
+
+        latency = time.time() - startTime
+        if ( latencyRecorder.enabled ) :
+            latencyRecorder.record("MQTT digital-output batch", latency)
+
+        return latency
+
     def emitDwell(self, milliseconds) :
         '''
         desc: Pauses motion for a specified time. This function is non-blocking; your program may accomplish other tasks while the machine is dwelling.
@@ -1398,11 +3724,13 @@ class MachineMotion :
         note: The timer starts after all previous MachineMotion movement commands have finished execution.
         exampleCodePath: emitDwell.py
         '''
-        reply = self.myGCode.__emit__("G4 P"+str(milliseconds))
+        reply = self.__emit("G4 P"+str(milliseconds))
 
-        if ( "echo" in reply and "ok" in reply ) : pass
+        if ( reply.isOk ) : pass
         else : raise Exception('Error in gCode execution')
 
+        self.__extendMotionPrediction(float(milliseconds) / 1000)
+
         return
 
     def readEncoder(self, encoder, readingType=ENCODER_TYPE.real_time) :
@@ -1448,6 +3776,14 @@ class MachineMotion :
 
     def eStopEvent(self, status) :
         self.__isEstopped = status
+        self.__discardBufferedMoves()
+        self.invalidateModalState()
+        if status :
+            # Like emitStop: the queued motion is dropped, so the commanded positions and the predicted end are unknown
+            self.__forgetMotionPrediction([1, 2, 3])
+            self.__resetMotionPrediction()
+            self.__encoderRestPositions = {}
+            self.myMotionCompletionPoller.interrupt()
         self.eStopCallback(status)
         return
 
@@ -1475,7 +3811,7 @@ class MachineMotion :
         time.sleep(0.2)
 
         # Publish trigger request on MQTT
-        self.myMqttClient.publish(MQTT.PATH.ESTOP_TRIGGER_REQUEST, "message is not important")
+        self.__publish(MQTT.PATH.ESTOP_TRIGGER_REQUEST, "message is not important")
 
         mqttResponseThread.join(MQTT.TIMEOUT)
 
@@ -1508,7 +3844,7 @@ class MachineMotion :
         time.sleep(0.2)
 
         # Publish release request on MQTT
-        self.myMqttClient.publish(MQTT.PATH.ESTOP_RELEASE_REQUEST, "message is not important")
+        self.__publish(MQTT.PATH.ESTOP_RELEASE_REQUEST, "message is not important")
 
         mqttResponseThread.join(MQTT.TIMEOUT)
 
@@ -1542,7 +3878,7 @@ class MachineMotion :
         time.sleep(0.2)
 
         # Publish reset system request on MQTT
-        self.myMqttClient.publish(MQTT.PATH.ESTOP_SYSTEMRESET_REQUEST, "message is not important")
+        self.__publish(MQTT.PATH.ESTOP_SYSTEMRESET_REQUEST, "message is not important")
 
         mqttResponseThread.join(MQTT.TIMEOUT)
 
@@ -1584,7 +3920,7 @@ class MachineMotion :
             raise Exception('unexpected lockBrake parameters: aux_port_number= ' + str(aux_port_number))
             return
         topic = MQTT.PATH.AUX_PORT_SAFETY if safety_adapter_presence else MQTT.PATH.AUX_PORT_POWER
-        self.myMqttClient.publish(topic + '/' + str(aux_port_number) + '/request', '0V')
+        self.__publish(topic + '/' + str(aux_port_number) + '/request', '0V')
 
         return
 
@@ -1607,7 +3943,7 @@ class MachineMotion :
             raise Exception('unexpected unlockBrake parameters: aux_port_number= ' + str(aux_port_number))
             return
         topic = MQTT.PATH.AUX_PORT_SAFETY if safety_adapter_presence else MQTT.PATH.AUX_PORT_POWER
-        self.myMqttClient.publish(topic + '/' + str(aux_port_number) + '/request', '24V')
+        self.__publish(topic + '/' + str(aux_port_number) + '/request', '24V')
 
         return
 
@@ -1640,6 +3976,31 @@ class MachineMotion :
         else                    : return BRAKE_STATES.unknown
 
 
+    # ------------------------------------------------------------------------
+    # Publishes an MQTT message, recording how long the client took to accept it.
+    #
+    # @param {str} topic   - Topic of the message
+    # @param {str} payload - Payload of the message
+    # @param {bool} retain - Whether the broker retains the message
+    def __publish(self, topic, payload, retain = False) :
+        if not latencyRecorder.enabled :
+            return self.myMqttClient.publish(topic, payload, retain=retain)
+
+        startTime = time.time()
+        try :
+            return self.myMqttClient.publish(topic, payload, retain=retain)
+        finally :
+            latencyRecorder.record("MQTT " + MQTT_TOPIC_INDEX.sub("/+", topic), time.time() - startTime)
+
+    def getLatencyStats(self) :
+        '''
+        desc: Returns the latency of the recent controller I/O, by G-code verb (e.g. "G0", "V0"), HTTP path (e.g. "HTTP /getData") and MQTT topic (e.g. "MQTT devices/io-expander/+/digital-output/+").
+        returnValue: A dictionary mapping each operation to its "count", "mean", "max", "p50", "p95" and "p99" latencies in seconds. Percentiles cover the last one to two minutes.
+        returnValueType: Dictionary
+        note: The statistics are shared by every MachineMotion instance of the process. Set latencyRecorder.enabled to False in internal.latency to stop recording.
+        '''
+        return latencyRecorder.getStats()
+
     # ------------------------------------------------------------------------
     # Register to the MQTT broker on each connection.
     #
@@ -1658,6 +4019,10 @@ class MachineMotion :
             self.myMqttClient.subscribe(MQTT.PATH.AUX_PORT_SAFETY + '/+/status')
             self.myMqttClient.subscribe(MQTT.PATH.AUX_PORT_POWER + '/+/status')
 
+            # Custom callback list for MachineApps, called on every (re)connection
+            for callback in self.mqttConnectCallbacks:
+                callback()
+
         return
 
     # ------------------------------------------------------------------------
@@ -1703,6 +4068,8 @@ class MachineMotion :
                     self.myEncoderRealtimePositions[device] = position
                 elif position_type == ENCODER_TYPE.stable :
                     self.myEncoderStablePositions[device] = position
+                    self.__encoderStableTimes[device] = time.time()
+                    self.myMotionCompletionPoller.notifySettled()
                 return
             except:
                 return
@@ -1732,7 +4099,12 @@ class MachineMotion :
     def __establishConnection(self, isReconnection, callback):
 
         # Create the web socket
-        self.myGCode = GCode(self.IP)
+        if isReconnection :
+            self.myGCode.myConnectionPool.removeReconnectListener(self.invalidateModalState)
+            self.myGCode.myPriorityConnection.close()
+            self.invalidateModalState()
+        self.myGCode = GCode(self.IP, self.__transport)
+        self.myGCode.myConnectionPool.addReconnectListener(self.invalidateModalState)
 
         # Set the callback to the user specified function. This callback is used to process incoming messages from the machineMotion controller
         self.myGCode.__setUserCallback__(callback)
@@ -1747,6 +4119,13 @@ class MachineMotion :
     def removeMqttCallback(self, func):
         self.mqttCallbacks.remove(func)
 
+    def addMqttConnectCallback(self, func):
+        if not func in self.mqttConnectCallbacks:
+            self.mqttConnectCallbacks.append(func)
+
+    def removeMqttConnectCallback(self, func):
+        self.mqttConnectCallbacks.remove(func)
+
     def registerInput(self, name, digitalIo, pin):
         self.__registeredInputMap[name] = 'devices/io-expander/' + str(digitalIo) + '/digital-input/' + str(pin)
 
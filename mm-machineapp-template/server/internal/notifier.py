@@ -24,6 +24,7 @@ class NotificationLevel:
     ERROR               = 'error'
     IO_STATE            = 'io_state'
     UI_INFO             = 'ui_info'
+    TELEMETRY           = 'telemetry'
 
 def sendNotification(level, message, customPayload=None):
     '''
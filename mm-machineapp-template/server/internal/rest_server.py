@@ -12,7 +12,6 @@ import sys
 import signal
 from internal.notifier import getNotifier, NotificationLevel
 from internal.interprocess_message import SubprocessToParentMessage
-from machine_app import MachineAppEngine
 import paho.mqtt.subscribe as MQTTsubscribe
 import paho.mqtt.client as mqtt
 import traceback
@@ -21,6 +20,8 @@ class RestServer(Bottle):
     '''
     RESTful server that handles control of the MachineApp and configuration IO
     '''
+    ESTOP_TIMEOUT_SECONDS = 5.0     # Time given to the MachineApp to run onEstop before it is terminated
+
     def __init__(self):
         super(RestServer, self).__init__()
     
@@ -44,6 +45,7 @@ class RestServer(Bottle):
         self.route('/run/releaseEstop', method='POST', callback=self.releaseEstop)
         self.route('/run/resetSystem', method='POST', callback=self.resetSystem)
         self.route('/run/state', method='GET', callback=self.getState)
+        self.route('/stats/latency', method='GET', callback=self.getLatencyStats)
 
         self.route('/kill', method='GET', callback=self.kill)
         self.route('/logs', method='GET', callback=self.getLog)
@@ -124,6 +126,9 @@ class RestServer(Bottle):
             "isPaused": self.isPaused
         }
 
+    def getLatencyStats(self):
+        return self.__subprocess.getLatencyStats()
+
     def kill(self):
         self.__subprocess.terminate()
         os.kill(os.getpid(), signal.SIGTERM)
@@ -132,13 +137,11 @@ class RestServer(Bottle):
     def onEstopEntered(self):
         try:
             if self.__subprocess.isRunning():
-                self.__subprocess.terminate()
                 self.isPaused = False
-                
-                # Create a temporary MachineAppEngine and call onEstop
-                temporaryApp = MachineAppEngine()
-                temporaryApp.initialize()
-                temporaryApp.onEstop()
+
+                # The running MachineApp calls onEstop with the MachineMotion instances it already has
+                if not self.__subprocess.estop(RestServer.ESTOP_TIMEOUT_SECONDS):
+                    self.__notifier.sendMessage(NotificationLevel.ERROR, 'onEstop did not complete within {} seconds. Check the internal logs for more info.'.format(RestServer.ESTOP_TIMEOUT_SECONDS))
         except Exception as e:
             logging.warning("Failed to call onEstop: %s" % (traceback.format_exc()))
             self.__notifier.sendMessage(NotificationLevel.ERROR, 'Failed to call onEstop for the MachineApp. Check the internal logs for more info.')
@@ -298,6 +301,8 @@ class MachineAppSubprocessManager:
         self.__stderr = None
         self.__logger = logging.getLogger(__name__)
         self.__notifier = getNotifier()
+        self.__latencyStats = {}
+        self.__estopHandled = threading.Event()
 
         self.__stdthread = Thread(name='subprocess_stdout', target=self.__update)
         self.__stdthread.daemon = True
@@ -366,12 +371,33 @@ class MachineAppSubprocessManager:
                         if msgType == SubprocessToParentMessage.NOTIFICATION:
                             notification = content["data"]
                             self.__notifier.sendMessage(notification['level'], notification['message'], notification['customPayload'])
+                        elif msgType == SubprocessToParentMessage.LATENCY_STATS:
+                            self.__latencyStats = content["data"]
+                        elif msgType == SubprocessToParentMessage.ESTOP_HANDLED:
+                            self.__estopHandled.set()
                     except:
                         print(line)
 
             time.sleep(1.0)
 
 
+    def estop(self, timeout):
+        '''
+        Asks the MachineApp to run onEstop, then terminates it
+
+        params:
+            timeout: float
+                Seconds to wait for onEstop to complete
+
+        returns:
+            bool
+                onEstop completed within the timeout
+        '''
+        self.__estopHandled.clear()
+        handled = self.sendMsgToSubprocess({ 'request': 'estop' }) and self.__estopHandled.wait(timeout)
+        self.terminate()
+        return handled
+
     def terminate(self):
         '''
         Terminates the subprocess immediately
@@ -390,6 +416,13 @@ class MachineAppSubprocessManager:
     def isRunning(self):
         return self.__isRunning
 
+    def getLatencyStats(self):
+        '''
+        Returns the latest controller latency statistics reported by the MachineApp, keyed
+        by G-code verb, HTTP path or MQTT topic. They are kept after the MachineApp stops.
+        '''
+        return self.__latencyStats
+
 def runServer():
     restServer = RestServer()
     restServer.run(host='0.0.0.0', port=3011, server='paste')
\ No newline at end of file
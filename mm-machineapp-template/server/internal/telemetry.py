@@ -0,0 +1,122 @@
+from threading import Thread, Event
+import logging
+import time
+from internal.notifier import NotificationLevel, sendNotification
+
+class TelemetrySnapshot:
+    ''' Axis positions and end stop states of a controller at one point in time. Never modified once published. '''
+
+    def __init__(self, timeSeconds=None, positions=None, endStops=None, error=None):
+        self.timeSeconds = timeSeconds  # Time of the last successful poll, None before the first one
+        self.positions = positions      # Maps each axis to its position in mm, None if not polled
+        self.endStops = endStops        # Maps each end stop (x_min, x_max...) to its state, None if not polled
+        self.error = error              # Error of the last poll, if it failed
+
+    def toJson(self):
+        return {
+            "timeSeconds": self.timeSeconds,
+            "positions": self.positions,
+            "endStops": self.endStops,
+            "error": self.error
+        }
+
+class TelemetryService:
+    '''
+    Polls the axis positions and end stop states of a MachineMotion from a single background thread.
+
+    The latest values are published as an immutable TelemetrySnapshot, swapped in as a whole after
+    each poll, so that any number of readers can call getSnapshot without locking and without
+    querying the controller. Changes are pushed to the Web Client through the Notifier.
+    '''
+
+    def __init__(self, machineMotion, interval=0.5, pollPositions=True, pollEndStops=True, notifyChanges=True):
+        self.machineMotion = machineMotion
+        self.interval = interval                # Seconds between the start of two polls
+        self.pollPositions = pollPositions
+        self.pollEndStops = pollEndStops
+        self.notifyChanges = notifyChanges      # Send a NotificationLevel.TELEMETRY notification when a value changes
+        self.pollCount = 0
+        self.logger = logging.getLogger(__name__)
+
+        self.__snapshot = TelemetrySnapshot()
+        self.__stopEvent = Event()
+        self.__thread = None
+
+    def start(self):
+        ''' Starts polling, if not already started '''
+        if self.isRunning():
+            return
+
+        self.__stopEvent.clear()
+        self.__thread = Thread(name='TelemetryService', target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self, timeout=None):
+        '''
+        Stops polling. The last snapshot remains available.
+
+        params:
+            timeout: float
+                (Optional) Maximum number of seconds to wait for the poll in progress, if any
+        '''
+        self.__stopEvent.set()
+        if self.__thread != None:
+            self.__thread.join(timeout)
+            self.__thread = None
+
+    def isRunning(self):
+        return self.__thread != None and self.__thread.is_alive()
+
+    def getSnapshot(self):
+        '''
+        Returns the latest TelemetrySnapshot, without querying the controller.
+        '''
+        return self.__snapshot
+
+    def getPositions(self):
+        ''' Latest polled position of each axis, or None before the first poll '''
+        return self.__snapshot.positions
+
+    def getEndStopState(self):
+        ''' Latest polled state of each end stop, or None before the first poll '''
+        return self.__snapshot.endStops
+
+    def pollNow(self):
+        '''
+        Polls the controller immediately from the calling thread, and returns the new snapshot.
+        '''
+        previous = self.__snapshot
+        positions = previous.positions
+        endStops = previous.endStops
+
+        try:
+            if self.pollPositions:
+                positions = self.machineMotion.getCurrentPositions()
+            if self.pollEndStops:
+                endStops = self.machineMotion.getEndStopState()
+        except Exception as e:
+            if previous.error == None:
+                self.logger.warning('Telemetry poll failed, keeping the last values: {}'.format(e))
+            self.__snapshot = TelemetrySnapshot(previous.timeSeconds, positions, endStops, str(e))
+            return self.__snapshot
+
+        if previous.error != None:
+            self.logger.info('Telemetry poll succeeded again')
+
+        self.pollCount += 1
+        self.__snapshot = TelemetrySnapshot(time.time(), positions, endStops)
+
+        if self.notifyChanges and (positions != previous.positions or endStops != previous.endStops):
+            sendNotification(NotificationLevel.TELEMETRY, 'Telemetry updated', self.__snapshot.toJson())
+
+        return self.__snapshot
+
+    def __run(self):
+        nextPollTime = time.time()
+        while not self.__stopEvent.is_set():
+            self.pollNow()
+
+            # Keep a steady rate, but never queue up polls behind a slow controller
+            nextPollTime = max(nextPollTime + self.interval, time.time())
+            self.__stopEvent.wait(nextPollTime - time.time())
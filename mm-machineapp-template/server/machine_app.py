@@ -3,13 +3,14 @@
 from env import env
 import logging
 import time
-from internal.base_machine_app import MachineAppState, BaseMachineAppEngine
+from internal.base_machine_app import MachineAppState, BaseMachineAppEngine, MotionParameters
 #new from template needed in this program 
 from internal.notifier import NotificationLevel, sendNotification, getNotifier
 from internal.io_monitor import IOMonitor
 from sensor import Sensor
 from digital_out import Digital_Out
 from pneumatic import Pneumatic
+from device_registry import DeviceRegistry, DEVICE_TYPE
 #from math import ceil, sqrt #we will not need math
 
 
@@ -62,7 +63,8 @@ class MachineAppEngine(BaseMachineAppEngine):
         return 'Initialize'
             
     def onEstop(self):
-        pass
+        # Clears the moves still queued on the controllers, so that they do not resume when the estop is released
+        self.stopAllMachineMotions()
     
     def onResume(self):
         pass
@@ -87,7 +89,8 @@ class MachineAppEngine(BaseMachineAppEngine):
 
         
         # Create and configure your machine motion instances
-        self.MachineMotion = MachineMotion(mm_IP)
+        self.MachineMotion = self.addMachineMotion(MachineMotion(mm_IP))
+        self.MachineMotion.configAxisConfigurationCache('./internal/axis_configuration.json') # Skips re-sending the axis configuration the controller still has
 
         # Timing Belt
         self.timing_belt_axis = 1 #is this the actuator number? Yes
@@ -99,16 +102,21 @@ class MachineAppEngine(BaseMachineAppEngine):
         self.MachineMotion.configAxis(self.roller_axis, 8, 319.186/5) 
         self.MachineMotion.configAxisDirection(self.roller_axis, 'positive')
         
-        #pneumatics
+        #pneumatics and outputs, all sharing the MQTT connection of the machine motion
         dio1 = mm_IP
         dio2 = mm_IP
         
-        self.knife_pneumatic = Pneumatic("Knife Pneumatic", ipAddress=dio1, networkId=1, pushPin=0, pullPin=1)     
-        self.roller_pneumatic = Pneumatic("Roller Pneumatic", ipAddress=dio2, networkId=2, pushPin=0, pullPin=1) 
-        self.plate_pneumatic = Pneumatic("Plate Pneumatic", ipAddress=dio2, networkId=2, pushPin=2, pullPin=3)
-        
-        #outputs
-        self.knife_output = Digital_Out("Knife Output", ipAddress=dio1, networkId=1, pin=0) 
+        self.deviceRegistry = DeviceRegistry(self.MachineMotion)
+        devices = self.deviceRegistry.build({
+            'knife_pneumatic'  : { 'type': DEVICE_TYPE.PNEUMATIC,   'name': "Knife Pneumatic",  'networkId': 1, 'pushPin': 0, 'pullPin': 1 },
+            'roller_pneumatic' : { 'type': DEVICE_TYPE.PNEUMATIC,   'name': "Roller Pneumatic", 'networkId': 2, 'pushPin': 0, 'pullPin': 1 },
+            'plate_pneumatic'  : { 'type': DEVICE_TYPE.PNEUMATIC,   'name': "Plate Pneumatic",  'networkId': 2, 'pushPin': 2, 'pullPin': 3 },
+            'knife_output'     : { 'type': DEVICE_TYPE.DIGITAL_OUT, 'name': "Knife Output",     'networkId': 1, 'pin': 0 },
+        })
+        self.knife_pneumatic = devices['knife_pneumatic']
+        self.roller_pneumatic = devices['roller_pneumatic']
+        self.plate_pneumatic = devices['plate_pneumatic']
+        self.knife_output = devices['knife_output']
         
         #inputs
         #how do I monitor my digital inputs? IO1 PIN 0 Value 0
@@ -128,6 +136,8 @@ class MachineAppEngine(BaseMachineAppEngine):
         self.Roller_accel = 120
         self.TapeCut_speed = 850
         self.TapeCut_accel = 850
+        self.TimingBelt_speed = 850     # Knife carriage, used when homing and cutting
+        self.TimingBelt_accel = 850
         self.Grip_speed = 850
         self.Grip_accel = 850
         self.scrap_distance = 20 #mm 
@@ -175,7 +185,7 @@ class MachineAppEngine(BaseMachineAppEngine):
         Warning: This logic is happening in a separate thread. EmitStops are allowed in
         this method.
         '''
-        self.MachineMotion.emitStop()
+        self.stopAllMachineMotions()
         self.knife_output.low() #knife goes down
         self.plate_pneumatic.pull() #plate up 
         #self.MachineMotion.emitHome(self.timing_belt_axis) #knife goes to home
@@ -189,7 +199,7 @@ class MachineAppEngine(BaseMachineAppEngine):
         Warning: This logic is happening in a separate thread. EmitStops are allowed in
         this method.
         '''
-        self.MachineMotion.emitStop() 
+        self.stopAllMachineMotions()
     
     def beforeRun(self):
         '''
@@ -326,7 +336,7 @@ class PrepareNewRollState(MachineAppState):
         pass    
 
 class ReplaceTapeState(MachineAppState):
-     ''' Lifts clamp and positions tape applicator where it can be refed. '''
+    ''' Lifts clamp and positions tape applicator where it can be refed. '''
     
     def __init__(self, engine):
         super().__init__(engine)
@@ -347,7 +357,7 @@ class ReplaceTapeState(MachineAppState):
         pass    
 
 class CutTapeState(MachineAppState):
-     ''' Engages tape knife and break so tape can be trimmed. '''
+    ''' Engages tape knife and break so tape can be trimmed. '''
     
     def __init__(self, engine):
         super().__init__(engine)
@@ -448,6 +458,9 @@ class HomingState(MachineAppState):
     def __init__(self, engine):
         super().__init__(engine)
 
+    def getMotionParameters(self):
+        return [ MotionParameters(self.engine.MachineMotion, self.engine.TimingBelt_speed, self.engine.TimingBelt_accel) ]
+
     def onEnter(self):
         
         self.engine.t0 = time.time()
@@ -496,6 +509,9 @@ class Feed(MachineAppState):
     def __init__(self, engine):
         super().__init__(engine) 
 
+    def getMotionParameters(self):
+        return [ MotionParameters(self.engine.MachineMotion, self.engine.Roller_speed, self.engine.Roller_accel) ]
+
     def onEnter(self):
         #ToCheck
         # self.engine.sensor_value = self.engine.MachineMotion.digitalRead(1, 0) #(networkid,pin)
@@ -520,6 +536,7 @@ class Feed(MachineAppState):
         self.engine.MachineMotion.emitSpeed(self.engine.Roller_speed)
         self.engine.MachineMotion.emitAcceleration(self.engine.Roller_accel)
         self.engine.MachineMotion.emitRelativeMove(self.engine.roller_axis, "positive", self.engine.material_length_mm)#Distance will be pulled from Global Variable Length input
+        self.prefetchState('Cut') # Clamp does not move: send the cutting speed while the rollers turn
         self.engine.MachineMotion.waitForMotionCompletion()
        
         self.gotoState('Clamp')
@@ -560,6 +577,9 @@ class Clamp(MachineAppState):
 class Cut(MachineAppState):
     def __init__(self, engine):
         super().__init__(engine) 
+
+    def getMotionParameters(self):
+        return [ MotionParameters(self.engine.MachineMotion, self.engine.TimingBelt_speed, self.engine.TimingBelt_accel) ]
         
     def onEnter(self):
         # self.engine.MachineMotion.emitAbsoluteMove(self.engine.timing_belt_axis,0)
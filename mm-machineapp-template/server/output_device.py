@@ -0,0 +1,131 @@
+import logging
+log = logging.getLogger(__name__)
+import paho.mqtt.client as mqtt
+import threading
+import time
+from internal.latency import latencyRecorder
+
+
+# Base of the devices driving io-expander digital outputs (Pneumatic, Digital_Out).
+# Keeps a shadow of the last confirmed value of each output, so that writes that would not change it are skipped,
+# unless force is True. DeviceRegistry.writeOutputs batches the writes of several devices through _begin_write and
+# _wait_for_confirmation.
+class OutputDevice ():
+
+    # Fixed settle time, waited whenever no sensor confirms a write
+    FALLBACK_DELAY = 0
+
+    def __onConnect(self, client, userData, flags, rc):
+        if rc == 0:
+            self.connected = True
+            self.invalidateOutputState()
+        return
+
+    # Only the echo of a pending write updates the shadow. Any other message on the topic (digitalWrite, the UI,
+    # another device on the same pin, a stale retained value) makes the output state unknown until the next write.
+    def __onOutputEcho(self, topic, payload):
+        with self.echoCondition:
+            if self.pendingWrites.get(topic) == str(payload):
+                del self.pendingWrites[topic]
+                self.outputShadow[topic] = str(payload)
+                self.echoCondition.notify_all()
+            else:
+                self.outputShadow[topic] = None
+
+    # Forgets the shadow output state, so that the next writes are all sent.
+    # Called on reconnection and estop, since the outputs may have changed behind our back.
+    def invalidateOutputState(self):
+        with self.echoCondition:
+            self.outputShadow.clear()
+
+    def _has_output_state(self, values):
+        with self.echoCondition:
+            return all(self.outputShadow.get(self.pinTopics[pin]) == msg for pin, msg in values)
+
+    def _set_output_state(self, values):
+        with self.echoCondition:
+            for pin, msg in values:
+                self.outputShadow[self.pinTopics[pin]] = msg
+
+    # Publishes the writes that would change the output state, and returns them as (pin, msg) tuples.
+    # Returns None if nothing had to be written.
+    def _begin_write(self, values, force):
+        values = [(pin, '1' if int(value) else '0') for pin, value in values]
+        if not force and self._has_output_state(values):
+            return None
+        with self.echoCondition:
+            for pin, msg in values:
+                self.outputShadow[self.pinTopics[pin]] = None
+                self.pendingWrites[self.pinTopics[pin]] = msg
+        for pin, msg in values:
+            self.outputClient.publish(self.pinTopics[pin], msg)
+        return values
+
+    # Writes several pins of this device, in order, and waits once for all of them to be confirmed.
+    # values is a list of (pin, value) tuples. Returns False if the writes were not confirmed in time.
+    # The time from the first publish to the confirmation is recorded in internal.latency as 'IO <name>'.
+    def write(self, values, force=False, sensor=None, fallbackDelay=None):
+        startTime = time.time()
+        values = self._begin_write(values, force)
+        if values is None:
+            return True
+        confirmed = self._wait_for_confirmation(values, sensor, self.FALLBACK_DELAY if fallbackDelay is None else fallbackDelay)
+        if latencyRecorder.enabled:
+            latencyRecorder.record('IO ' + self.name, time.time() - startTime)
+        return confirmed
+
+    # Waits for the confirmation sensor if there is one. Otherwise waits for the echo of every written pin, which only
+    # proves the broker delivered the writes, and then for the fixed settle time.
+    # Returns False if the confirmation did not arrive within confirmationTimeout, leaving the output state unknown.
+    def _wait_for_confirmation(self, values, sensor, fallbackDelay):
+        if sensor is not None:
+            confirmed = sensor.wait_for_state(1, self.confirmationTimeout)
+            if confirmed:
+                self._set_output_state(values)
+        elif self.echoesAvailable:
+            with self.echoCondition:
+                confirmed = self.echoCondition.wait_for(
+                    lambda: all(self.outputShadow.get(self.pinTopics[pin]) == msg for pin, msg in values),
+                    self.confirmationTimeout)
+            if confirmed:
+                time.sleep(fallbackDelay)
+        else:
+            time.sleep(fallbackDelay)
+            self._set_output_state(values)
+            return True
+
+        if not confirmed:
+            log.warning("{} was not confirmed within {} seconds".format(self.name, self.confirmationTimeout))
+        return confirmed
+
+    # Pass a DeviceRegistry to share its MQTT connection instead of opening one for this device.
+    def __init__(self, name, ipAddress, networkId, pins, registry=None, confirmationTimeout=1):
+        self.connected=False
+        self.networkId = networkId
+        self.name = name
+        self.confirmationTimeout = confirmationTimeout
+        self.pinTopics = {}
+        for pin in pins:
+            self.pinTopics[pin] = "devices/io-expander/{id}/digital-output/{pin}".format(id=networkId, pin=pin)
+        self.outputShadow = {}                  # Last confirmed value of each output topic, None while unknown
+        self.pendingWrites = {}                 # Value written to each output topic, until its echo arrives
+        self.echoCondition = threading.Condition()
+        self.echoesAvailable = registry is not None
+        self.outputClient = None
+        if registry is not None:
+            self.outputClient = registry.mqttClient
+            for topic in self.pinTopics.values():
+                registry.subscribe(topic, self.__onOutputEcho)
+            self.connected = True
+            return
+        self.outputClient = mqtt.Client()
+        self.outputClient.on_connect = self.__onConnect
+        self.outputClient.connect(ipAddress)
+        self.outputClient.loop_start()
+        # Block initialization until mqtt client has established connection
+        t0 = time.time()
+        while self.connected==False:
+            if time.time()-t0 > 15:
+                raise Exception("System timeout during connection to to {}".format(self.name))
+
+            time.sleep(0.2)
@@ -2,12 +2,13 @@ import logging
 log = logging.getLogger(__name__)
 import paho.mqtt.client as mqtt
 import paho.mqtt.subscribe as MQTTsubscribe
+import threading
 import time
 
+# Edges are counted by monotonic counters, guarded by a condition variable notified from the MQTT thread.
+# Waiters compare the counters with the number of edges already consumed, so an edge arriving
+# before a wait is never lost, and is consumed only once.
 class Sensor():
-    _on_rising_edge_flag = False
-    _on_falling_edge_flag = False
-    
     _on_rising_edge_cb = None
     _on_falling_edge_cb = None
     _on_state_change_cb = None
@@ -20,47 +21,72 @@ class Sensor():
         
     def __onConnect(self, client, userData, flags, rc):
         if rc == 0:
-            self.mqtt_topic = 'devices/io-expander/'+ str(self.networkId) +'/digital-input/'+ str(self.pin)
             self.sensorClient.subscribe(self.mqtt_topic)
             self.connected=True
             log.info(self.name + " connected to pin " + str(self.pin))
         
 
     def __onMessage(self, client, userData, msg):
-        print("{} received msg {}".format(self.name, msg.payload))
-        value = msg.payload
-        self.state = int(value)
+        return self.__onValue(msg.payload)
+
+    def __onRegistryMessage(self, topic, payload):
+        return self.__onValue(payload)
+
+    def __onValue(self, value):
+        print("{} received msg {}".format(self.name, value))
         ret = ""
         
+        # The first message only gives the current state (e.g. a retained value), not an edge
+        with self._condition:
+            previousState = self.state
+            self.state = int(value)
+            state = self.state
+            isEdge = self.has_received_first_message and state != previousState
+            self.has_received_first_message = True
+            if isEdge and state == 1:
+                self.risingEdgeCount += 1
+            elif isEdge and state == 0:
+                self.fallingEdgeCount += 1
+            self._condition.notify_all()
         
-        if not self.has_received_first_message:
+        if not isEdge:
             return
         
-        if self.state == 1:
-            self._on_rising_edge_flag = True
-            if self._on_rising_edge_cb is not None:
-                ret = self._on_rising_edge_cb()
-        elif self.state ==0:
-            self._on_falling_edge_flag = True
-            if self._on_falling_edge_cb is not None:
-                ret = self._on_falling_edge_cb()
-        elif self._on_state_change_cb is not None:
+        if state == 1 and self._on_rising_edge_cb is not None:
+            ret = self._on_rising_edge_cb()
+        elif state == 0 and self._on_falling_edge_cb is not None:
+            ret = self._on_falling_edge_cb()
+        if self._on_state_change_cb is not None:
             ret = self._on_state_change_cb()
         return ret
         
         
 
-    def __init__(self, name, ipAddress, networkId, pin):
+    # Pass a DeviceRegistry to share its MQTT connection instead of opening one for this sensor
+    def __init__(self, name, ipAddress, networkId, pin, registry=None):
         self.connected=False
         self.networkId = networkId
         self.pin = pin
         self.name = name
+        self.mqtt_topic = 'devices/io-expander/'+ str(self.networkId) +'/digital-input/'+ str(self.pin)
+        self.state = None
+        self.has_received_first_message = False
+        self.risingEdgeCount = 0            # Edges seen since creation, never decremented
+        self.fallingEdgeCount = 0
+        self._risingEdgesConsumed = 0       # Edges already returned by wait_for_*_edge and seen_*_edge
+        self._fallingEdgesConsumed = 0
+        self._condition = threading.Condition()
         self.sensorClient = None
+        if registry is not None:
+            self.sensorClient = registry.mqttClient
+            registry.subscribe(self.mqtt_topic, self.__onRegistryMessage)
+            self.connected = True
+            log.info(self.name + " connected to pin " + str(self.pin))
+            return
         self.sensorClient = mqtt.Client()
         self.sensorClient.on_connect = self.__onConnect
         self.sensorClient.on_message = self.__onMessage
         self.sensorClient.connect(ipAddress)
-        self.has_received_first_message = False
         self.sensorClient.loop_start()
         
         t0 = time.time()
@@ -79,38 +105,42 @@ class Sensor():
     def register_on_value_change(self, cb):
         self._on_state_change_cb = cb
         
-    #Returns true after rising edge has been detected
-    def wait_for_rising_edge(self, timeout = None):
+    #Returns after a rising edge has been detected. Edges that arrived since the last consumed one count,
+    #or, if since is given, only the edges after risingEdgeCount had that value (read it before acting).
+    def wait_for_rising_edge(self, timeout = None, since = None):
         print("{} waiting for rising edge\n\t{}".format(self.name, self.mqtt_topic))
-        #Wait for the rising edge flag to trigger True. 
-        t0 = time.time()
-        while self._on_rising_edge_flag == False:
-            if timeout is not None and time.time()-t0 > timeout:
+        with self._condition:
+            consumed = self._risingEdgesConsumed if since is None else since
+            if not self._condition.wait_for(lambda: self.risingEdgeCount > consumed, timeout):
                 raise self.timeoutException("system timeout wait_for_rising_edge {}".format(self.name))
-            time.sleep(0.5)
-        self._on_rising_edge_flag = False
+            self._risingEdgesConsumed = self.risingEdgeCount
         return
     
-    def wait_for_falling_edge(self, timeout = None):
-        #Wait for the rising edge flag to trigger True. 
-        t0 = time.time()
-        while self._on_falling_edge_flag == False:
-            if timeout is not None and time.time()-t0 > timeout:
-                raise Exception("system timeout wait_for_falling_edge {}".format(self.name))
-            time.sleep(0.5)
-        self._on_falling_edge_flag = False
+    def wait_for_falling_edge(self, timeout = None, since = None):
+        with self._condition:
+            consumed = self._fallingEdgesConsumed if since is None else since
+            if not self._condition.wait_for(lambda: self.fallingEdgeCount > consumed, timeout):
+                raise self.timeoutException("system timeout wait_for_falling_edge {}".format(self.name))
+            self._fallingEdgesConsumed = self.fallingEdgeCount
         return
+
+    #Returns True as soon as the sensor reads value, False if it did not within timeout
+    def wait_for_state(self, value, timeout = None):
+        with self._condition:
+            return self._condition.wait_for(lambda: self.state == value, timeout)
     
     def seen_rising_edge(self):
-        if self._on_rising_edge_flag:
-            self._on_rising_edge_flag = False
-            return True
+        with self._condition:
+            if self.risingEdgeCount > self._risingEdgesConsumed:
+                self._risingEdgesConsumed = self.risingEdgeCount
+                return True
         return False
 
     def seen_falling_edge(self):
-        if self._on_falling_edge_flag:
-            self._on_falling_edge_flag = False
-            return True
+        with self._condition:
+            if self.fallingEdgeCount > self._fallingEdgesConsumed:
+                self._fallingEdgesConsumed = self.fallingEdgeCount
+                return True
         return False
 
 # example code
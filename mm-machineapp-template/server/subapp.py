@@ -48,6 +48,8 @@ def run():
                         machineApp.pause()
                     elif message['request'] == 'resume':
                         machineApp.resume()
+                    elif message['request'] == 'estop':
+                        machineApp.estop()
                     else:
                         logging.warning('Unknown parent process request: {}'.format(message['request']))
                 except:
@@ -0,0 +1,74 @@
+import socket
+import threading
+import urllib.parse
+
+def reply(connection, body, close=False):
+    ''' Writes one HTTP/1.1 response, announcing "Connection: close" if close is True '''
+    head = 'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n%s\r\n' % (len(body), 'Connection: close\r\n' if close else '')
+    connection.sendall(head.encode('ascii') + body.encode('utf-8'))
+
+class RawController:
+    '''
+    Local HTTP server handing each request to behaviour(controller, connection, gCode), on raw sockets,
+    so that tests control exactly what each connection answers. Requests are recorded in gCodes, and
+    the number of accepted connections in connections. behaviour returns True to close the connection.
+    '''
+
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.gCodes = []
+        self.connections = 0
+
+        self.__socket = socket.socket()
+        self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__socket.bind(('127.0.0.1', 0))
+        self.__socket.listen()
+        self.host = '127.0.0.1:%d' % self.__socket.getsockname()[1]
+
+        thread = threading.Thread(target=self.__accept)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self.__socket.close()
+
+    def __accept(self):
+        while True:
+            try:
+                connection, _ = self.__socket.accept()
+            except OSError:
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self.__serve, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def __serve(self, connection):
+        buffer = b''
+        with connection:
+            while True:
+                try:
+                    data = connection.recv(65536)
+                except OSError:
+                    return
+                if not data:
+                    return
+                buffer += data
+                while b'\r\n\r\n' in buffer:
+                    request, buffer = buffer.split(b'\r\n\r\n', 1)
+                    path = request.split(b'\r\n', 1)[0].split(b' ')[1].decode('ascii')
+                    gCode = urllib.parse.unquote_plus(path.partition('gcode=')[2])
+                    self.gCodes.append(gCode)
+                    if self.behaviour(self, connection, gCode):
+                        self.__drain(connection)
+                        return
+
+    def __drain(self, connection):
+        # Closing with unread requests would reset the connection and lose the replies already written
+        connection.shutdown(socket.SHUT_WR)
+        connection.settimeout(1.0)
+        try:
+            while connection.recv(65536):
+                pass
+        except OSError:
+            pass
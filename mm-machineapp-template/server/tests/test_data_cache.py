@@ -0,0 +1,79 @@
+import unittest
+
+from internal.machine_motion import DATA_DURABILITY, DataCache
+
+class DataCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stored = []
+        self.fetched = []
+        self.failingKeys = set()
+        self.cache = DataCache(self.store, self.fetch, DATA_DURABILITY.manual)
+
+    def tearDown(self):
+        self.failingKeys.clear()
+        self.cache.close()
+
+    def store(self, key, value):
+        if key in self.failingKeys:
+            raise IOError('controller unreachable')
+        self.stored.append((key, value))
+
+    def fetch(self, key):
+        self.fetched.append(key)
+        return 'fetched ' + key
+
+    def test_writes_to_a_key_are_coalesced(self):
+        self.cache.set('recipe', 'a')
+        self.cache.set('count', 1)
+        self.cache.set('recipe', 'b')
+
+        self.assertEqual(self.stored, [])
+        self.assertTrue(self.cache.flush())
+        self.assertEqual(self.stored, [('recipe', 'b'), ('count', 1)])
+        self.assertEqual(self.cache.coalesced, 1)
+        self.assertEqual(self.cache.sent, 2)
+
+    def test_reads_are_served_from_memory(self):
+        self.assertEqual(self.cache.get('recipe'), 'fetched recipe')
+        self.assertEqual(self.cache.get('recipe'), 'fetched recipe')
+        self.cache.set('count', 3)
+        self.assertEqual(self.cache.get('count'), 3)
+
+        self.assertEqual(self.fetched, ['recipe'])
+        self.assertEqual((self.cache.reads, self.cache.hits), (3, 2))
+
+    def test_failed_writes_are_sent_first_on_the_next_flush(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.failingKeys.add('a')
+        self.assertFalse(self.cache.flush())
+        self.assertEqual(self.cache.getPendingCount(), 2)
+
+        self.cache.set('c', 3)
+        self.failingKeys.clear()
+        self.assertTrue(self.cache.flush())
+        self.assertEqual(self.stored, [('a', 1), ('b', 2), ('c', 3)])
+
+    def test_a_failed_write_does_not_replace_a_newer_one(self):
+        self.cache.set('a', 1)
+        self.failingKeys.add('a')
+        self.assertFalse(self.cache.flush())
+        self.cache.set('a', 2)
+
+        self.failingKeys.clear()
+        self.assertTrue(self.cache.flush())
+        self.assertEqual(self.stored, [('a', 2)])
+
+    def test_write_through_sends_before_returning(self):
+        self.cache.durability = DATA_DURABILITY.write_through
+        self.cache.set('a', 1)
+        self.assertEqual(self.stored, [('a', 1)])
+
+    def test_close_flushes(self):
+        self.cache.set('a', 1)
+        self.assertTrue(self.cache.close())
+        self.assertEqual(self.stored, [('a', 1)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from internal.machine_motion import DIRECTION, GCode, GCodeBuilder, LoopbackTransport, getGCodeVerb
+
+class GCodeBuilderTest(unittest.TestCase):
+
+    def test_axis_names(self):
+        self.assertEqual([GCodeBuilder.axisName(axis) for axis in (1, 2, 3)], ['X', 'Y', 'Z'])
+        self.assertEqual(GCodeBuilder.axisName(4), 'Axis Error')
+
+    def test_signed_distance(self):
+        self.assertEqual(GCodeBuilder.signedDistance(DIRECTION.POSITIVE, 3), '3')
+        self.assertEqual(GCodeBuilder.signedDistance(DIRECTION.NEGATIVE, 12.5), '-12.5')
+        self.assertEqual(GCodeBuilder.signedDistance(DIRECTION.NEGATIVE, -3), '3')
+
+    def test_moves(self):
+        self.assertEqual(GCodeBuilder.move(2, 10), 'G0 Y10')
+        self.assertEqual(GCodeBuilder.combinedMove([1, 3], [100, 0]), 'G0 X100 Z0')
+        self.assertEqual(GCodeBuilder.home(3), 'G28 Z')
+        self.assertEqual(GCodeBuilder.setPosition(1, 5), 'G92 X5')
+
+    def test_settings(self):
+        self.assertEqual(GCodeBuilder.stepsPerMm(2, 80.0), 'M92 Y80.0')
+        self.assertEqual(GCodeBuilder.feedrate(6000), 'G0 F6000')
+        self.assertEqual(GCodeBuilder.acceleration(50), 'M204 T50')
+
+    def test_speed_mode(self):
+        self.assertEqual(GCodeBuilder.positionMode(1), 'V5 X1')
+        self.assertEqual(GCodeBuilder.speedMode(2), 'V5 Y2')
+        self.assertEqual(GCodeBuilder.speed(1, 100, 200), 'V4 S100 A200 X')
+
+    def test_verb_ignores_line_number_and_checksum(self):
+        self.assertEqual(getGCodeVerb('G0 X10'), 'G0')
+        self.assertEqual(getGCodeVerb('N12 M114*33'), 'M114')
+
+    def test_numbered_line_checksum(self):
+        gCode = GCode('127.0.0.1', LoopbackTransport())
+        self.assertEqual(gCode.__numberLine__('G0 X1', 1), 'N1 G0 X1*97')
+
+    def test_resend_line(self):
+        gCode = GCode('127.0.0.1', LoopbackTransport())
+        self.assertEqual(gCode.__getResendLine__('Resend: 7\nok\n'), 7)
+        self.assertEqual(gCode.__getResendLine__('Error:checksum mismatch, Last Line: 4\n'), 5)
+        self.assertIsNone(gCode.__getResendLine__('echo:G0 X1\nok\n'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from internal.machine_motion import GCodeReply
+
+M114_REPLY = b'echo:M114\nX:125.00 Y:40.50 Z:0.00 E:0.00 Count X:10000 Y:3240 Z:0\nok\n'
+M119_REPLY = b'echo:M119\nReporting endstop status\nx_min: TRIGGERED\nx_max: open\ny_min: open\ny_max: open\nz_min: TRIGGERED\nz_max: open\nok\n'
+
+class GCodeReplyTest(unittest.TestCase):
+
+    def test_decodes_bytes_and_stays_a_string(self):
+        reply = GCodeReply(b'echo:G0 X1\nok\n')
+        self.assertIsInstance(reply, str)
+        self.assertEqual(reply, 'echo:G0 X1\nok\n')
+        self.assertTrue(reply.isOk)
+
+    def test_is_ok_needs_echo_and_ok(self):
+        self.assertFalse(GCodeReply('ok\n').isOk)
+        self.assertFalse(GCodeReply('echo:G0 X1\n').isOk)
+
+    def test_m114_positions(self):
+        self.assertEqual(GCodeReply(M114_REPLY).getPositions(), {1: 125.0, 2: 40.5, 3: 0.0})
+
+    def test_m114_positions_with_spaces_after_colons(self):
+        reply = GCodeReply('echo:M114\nX: -1.5 Y: 2 Z: 3.25 E:0.00\nok\n')
+        self.assertEqual(reply.getPositions(), {1: -1.5, 2: 2.0, 3: 3.25})
+
+    def test_m114_without_positions_raises(self):
+        with self.assertRaises(Exception):
+            GCodeReply('echo:M114\nok\n').getPositions()
+
+    def test_m119_end_stop_states(self):
+        self.assertEqual(GCodeReply(M119_REPLY).getEndStopStates(), {
+            'x_min': 'TRIGGERED', 'x_max': 'open',
+            'y_min': 'open', 'y_max': 'open',
+            'z_min': 'TRIGGERED', 'z_max': 'open'
+        })
+
+    def test_m119_with_missing_end_stops_raises(self):
+        with self.assertRaises(Exception):
+            GCodeReply('echo:M119\nx_min: open\nok\n').getEndStopStates()
+
+    def test_v0_motion_completed(self):
+        self.assertTrue(GCodeReply(b'echo:V0\nCOMPLETED\nok\n').isMotionCompleted())
+        self.assertFalse(GCodeReply(b'echo:V0\nPENDING\nok\n').isMotionCompleted())
+
+    def test_error_reply(self):
+        reply = GCodeReply(b'echo:G0 X1\nError:Printer halted. kill() called!\n')
+        self.assertFalse(reply.isOk)
+        self.assertEqual(reply.error, 'Error:Printer halted. kill() called!')
+        self.assertIsNone(GCodeReply(M114_REPLY).error)
+
+    def test_fields(self):
+        fields = GCodeReply(M114_REPLY).getFields()
+        self.assertEqual(fields['echo'], 'M114')
+        self.assertEqual(fields['X'], '125.00')     # The first value wins over the one of "Count X:"
+
+    def test_m503_steps_per_mm(self):
+        reply = GCodeReply('echo:M503\necho:  M92 X10.5 Y20 Z30\nok\n')
+        self.assertEqual(reply.getStepsPerMm(), {1: 10.5, 2: 20.0, 3: 30.0})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import gc
+import time
+import unittest
+from unittest import mock
+
+import paho.mqtt.client as mqtt
+
+from internal.machine_motion import ControllerUnavailable, HTTPConnectionPool, LoopbackTransport, MachineMotion
+from tests.raw_controller import RawController, reply
+
+def createMachineMotion():
+    ''' MachineMotion answering through a LoopbackTransport, without connecting to a broker '''
+    transport = LoopbackTransport()
+    with mock.patch.object(mqtt.Client, 'connect'), mock.patch.object(mqtt.Client, 'loop_start'):
+        machineMotion = MachineMotion('127.0.0.1', transport=transport)
+    return machineMotion, transport
+
+class ModalStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.machineMotion, self.transport = createMachineMotion()
+
+    def test_unchanged_settings_are_sent_once(self):
+        self.machineMotion.emitSpeed(100)
+        self.machineMotion.emitSpeed(100)
+        self.machineMotion.emitAcceleration(50)
+        self.machineMotion.emitAcceleration(50)
+
+        self.assertEqual(self.transport.log, ['G0 F6000', 'M204 T50'])
+        self.assertEqual(self.machineMotion.redundantCommandsSkipped, 2)
+
+    def test_changed_settings_are_sent(self):
+        self.machineMotion.emitSpeed(100)
+        self.machineMotion.emitSpeed(200)
+        self.assertEqual(self.transport.log, ['G0 F6000', 'G0 F12000'])
+
+    def test_positioning_mode_is_sent_once(self):
+        self.machineMotion.configAxis(1, 8, 150)
+        self.machineMotion.emitRelativeMove(1, 'positive', 10)
+        self.machineMotion.emitRelativeMove(1, 'positive', 10)
+        self.assertEqual(self.transport.log.count('G91'), 1)
+
+    def test_invalidation_sends_settings_again(self):
+        self.machineMotion.emitSpeed(100)
+        self.machineMotion.invalidateModalState()
+        self.machineMotion.emitSpeed(100)
+        self.assertEqual(self.transport.log, ['G0 F6000', 'G0 F6000'])
+
+    def test_estop_invalidates(self):
+        self.machineMotion.emitSpeed(100)
+        self.machineMotion.eStopEvent(True)
+        self.machineMotion.eStopEvent(False)
+        self.machineMotion.emitSpeed(100)
+        self.assertEqual(self.transport.log, ['G0 F6000', 'G0 F6000'])
+
+    def test_machine_motion_invalidates_on_reconnection(self):
+        self.machineMotion.emitSpeed(100)
+        self.machineMotion.myGCode.myConnectionPool._HTTPConnectionPool__notifyReconnect()
+        self.machineMotion.emitSpeed(100)
+        self.assertEqual(self.transport.log, ['G0 F6000', 'G0 F6000'])
+
+class ReconnectListenerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = None
+
+    def tearDown(self):
+        if self.controller is not None:
+            self.controller.close()
+
+    def test_stale_kept_alive_socket_notifies_listeners(self):
+        def closeAfterReply(controller, connection, gCode):
+            reply(connection, 'echo:%s\nok\n' % gCode)
+            return True
+
+        self.controller = RawController(closeAfterReply)
+        pool = HTTPConnectionPool(self.controller.host)
+        notifications = []
+        pool.addReconnectListener(lambda: notifications.append(True))
+
+        pool.request('/gcode?gcode=G0')
+        time.sleep(0.2)     # Lets the close of the controller reach the kept-alive socket
+        pool.request('/gcode?gcode=G0')
+
+        self.assertEqual(pool.reconnects, 1)
+        self.assertEqual(notifications, [True])
+
+    def test_unanswered_request_is_not_sent_again(self):
+        self.controller = RawController(lambda controller, connection, gCode: True)
+        pool = HTTPConnectionPool(self.controller.host)
+
+        with self.assertRaises(ControllerUnavailable):
+            pool.request('/gcode?gcode=G28', deadline=2.0)
+        self.assertEqual(self.controller.gCodes, ['G28'])
+        self.assertEqual(pool.unanswered, 1)
+
+    def test_machine_motion_listeners_are_held_weakly(self):
+        pool = HTTPConnectionPool('127.0.0.1:1')
+        machineMotion, _ = createMachineMotion()
+        pool.addReconnectListener(machineMotion.invalidateModalState)
+
+        del machineMotion
+        gc.collect()
+        pool._HTTPConnectionPool__notifyReconnect()
+        self.assertEqual(pool._HTTPConnectionPool__reconnectListeners, [])
+
+if __name__ == '__main__':
+    unittest.main()
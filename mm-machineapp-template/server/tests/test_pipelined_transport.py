@@ -0,0 +1,68 @@
+import unittest
+
+from internal.machine_motion import ControllerUnavailable, PipelinedHTTPTransport
+from tests.raw_controller import RawController, reply
+
+def acknowledge(controller, connection, gCode):
+    reply(connection, 'echo:%s\nok\n' % gCode)
+    return False
+
+class PipelinedHTTPTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = None
+        self.transport = None
+
+    def tearDown(self):
+        if self.transport is not None:
+            self.transport.close()
+        if self.controller is not None:
+            self.controller.close()
+
+    def connect(self, behaviour, **options):
+        self.controller = RawController(behaviour)
+        self.transport = PipelinedHTTPTransport(self.controller.host, timeout=2.0, **options)
+        return self.transport
+
+    def test_replies_are_read_in_order_on_one_connection(self):
+        transport = self.connect(acknowledge)
+        replies = transport.sendMany(['G0 X1', 'G0 X2', 'G0 X3'])
+
+        self.assertEqual(replies, [b'echo:G0 X1\nok\n', b'echo:G0 X2\nok\n', b'echo:G0 X3\nok\n'])
+        self.assertEqual(self.controller.connections, 1)
+        self.assertEqual(transport.batches, 1)
+
+    def test_commands_are_sent_at_most_max_in_flight_at_a_time(self):
+        transport = self.connect(acknowledge, maxInFlight=2)
+        self.assertEqual(len(transport.sendMany(['G0 X%d' % i for i in range(5)])), 5)
+        self.assertEqual(transport.batches, 3)
+
+    def test_requests_after_connection_close_are_sent_again(self):
+        def closeAfterFirstReply(controller, connection, gCode):
+            isFirst = controller.connections == 1
+            reply(connection, 'echo:%s\nok\n' % gCode, close=isFirst)
+            return isFirst
+
+        transport = self.connect(closeAfterFirstReply)
+        replies = transport.sendMany(['G0 X1', 'G0 X2', 'G0 X3'])
+
+        self.assertEqual(replies, [b'echo:G0 X1\nok\n', b'echo:G0 X2\nok\n', b'echo:G0 X3\nok\n'])
+        self.assertEqual(self.controller.gCodes, ['G0 X1', 'G0 X2', 'G0 X3'])
+        self.assertEqual(self.controller.connections, 2)
+
+    def test_unanswered_requests_are_never_sent_again(self):
+        def dropAfterFirstReply(controller, connection, gCode):
+            reply(connection, 'echo:%s\nok\n' % gCode)
+            return True
+
+        transport = self.connect(dropAfterFirstReply)
+        with self.assertRaises(ControllerUnavailable) as context:
+            transport.sendMany(['G0 X1', 'G0 X2', 'G0 X3'])
+
+        self.assertEqual(context.exception.replies, [b'echo:G0 X1\nok\n'])
+        self.assertIn('1 of 3 commands acknowledged', str(context.exception))
+        self.assertEqual(self.controller.gCodes, ['G0 X1'])
+        self.assertEqual(self.controller.connections, 1)
+
+if __name__ == '__main__':
+    unittest.main()